@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark: replay recorded clips through the full detection pipeline.
+
+Every combination of the swept settings (models/weights, inference size,
+process-every-n-frames, enhancement and background subtraction for inference)
+is run over every clip, headless and without sending anything on the network
+(messages are still encoded). Clips are replayed either as fast as the pipeline
+goes (default: the capture thread waits for each frame to be picked up and full
+queues block, so no frame is dropped) or at their own frame rate with the
+production drop policy (--realtime).
+
+The JSON report has, per run:
+- throughput: published frames per second and the ratio to the clip's frame rate
+- per-stage latency percentiles (the same stages as the metrics endpoint) and
+  capture-to-send latency
+- tracker-output stability: share of frames tracking, tracking dropouts (and
+  short flickers), frame-to-frame jitter of the raw and smoothed point and, with
+  --multi-person, track ID churn
+- per point filter (--filters), replayed over the run's detections on the clip's
+  timeline: jitter and the lag of the sent point behind the person
+
+Example: pick settings for a dark venue from the recordings made there
+    python benchmark_detector.py --videos venue/*.mp4 --models yolov8n.pt exdark \\
+        --inference-sizes 192 256 320 --every-n 1 2 --enhancement off on --bg-subtraction off on
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from collections import defaultdict, deque
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from pose_detector_yoloV8 import (INFERENCE_BACKENDS, POINT_FILTERS, YOLO_AVAILABLE, MetricsRegistry,
+                                  YOLODetectorOSC, find_exdark_weights, find_test_video, make_point_filter)
+
+
+class SampleRecorder(MetricsRegistry):
+    """Metrics registry that also keeps every observation, for exact percentiles"""
+
+    def __init__(self):
+        super().__init__()
+        self.samples = defaultdict(list)
+
+    def observe(self, name: str, value: float, **labels):
+        super().observe(name, value, **labels)
+        self.samples[labels.get('stage', name)].append(value)
+
+
+class ReplayDetector(YOLODetectorOSC):
+    """Detector that records what it would publish instead of sending it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outputs = []  # (raw point, smoothed point, tracking) per published frame
+        self.track_ids = []  # confirmed track IDs per published frame (multi-person)
+        self.raw_point = None
+        # Filter input on the clip's timeline: (capture time, send time, raw point, tracking)
+        self.filter_inputs = []
+        self.clip_fps = 30.0
+        # (capture time, seq) in capture order; entries up to the published frame are
+        # dropped on publish, so frames skipped or dropped on the way don't pile up
+        self.capture_seqs = deque()
+
+    def on_capture(self, seconds, seq):
+        super().on_capture(seconds, seq)
+        ring = self.grabber.ring
+        self.capture_seqs.append((float(ring.timestamps[ring.index(seq)]), seq))
+
+    def update_smoothed_point(self, detected_point, tracking, capture_time=None, now=None):
+        # Filters see the clip's own timeline (frame n at n / fps) plus the measured
+        # capture-to-send latency, so replaying faster than real time doesn't change them
+        now = time.time() if now is None else now
+        seq = None
+        while self.capture_seqs and capture_time is not None and self.capture_seqs[0][0] <= capture_time:
+            captured_at, captured_seq = self.capture_seqs.popleft()
+            if captured_at == capture_time:
+                seq = captured_seq
+        if seq is not None:
+            clip_time = (seq - 1) / self.clip_fps
+            now, capture_time = clip_time + (now - capture_time), clip_time
+            self.filter_inputs.append((capture_time, now, detected_point, bool(tracking)))
+        self.raw_point = detected_point
+        return super().update_smoothed_point(detected_point, tracking, capture_time, now)
+
+    def send_osc_data(self, avg_point, tracking, depth_blob=None):
+        self.outputs.append((self.raw_point, avg_point, bool(tracking and avg_point)))
+        super().send_osc_data(avg_point, tracking, depth_blob)
+
+    def send_people_data(self, tracks):
+        self.track_ids.append(tracks[:, 0].astype(np.int64).tolist())
+        super().send_people_data(tracks)
+
+    def publish_dgram(self, dgram, address="/depth", binary=None) -> bool:
+        return True
+
+
+def percentiles(values) -> dict:
+    """Latency summary in milliseconds"""
+    if len(values) == 0:
+        return {'count': 0}
+    ms = np.asarray(values, dtype=np.float64) * 1000
+    return {
+        'count': int(ms.size),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p90_ms': float(np.percentile(ms, 90)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+    }
+
+
+def point_steps(points) -> np.ndarray:
+    """Distances between consecutive points of a run of tracking frames"""
+    steps = []
+    prev = None
+    for p in points:
+        if p is not None and prev is not None:
+            steps.append(float(np.hypot(p[0] - prev[0], p[1] - prev[1])))
+        prev = p
+    return np.array(steps)
+
+
+def stability_summary(outputs: list, track_ids: list, duration: float, flicker_frames: int) -> dict:
+    """How steady the published output is (no ground truth: lower jitter and fewer dropouts is better)"""
+    if not outputs:
+        return {'frames': 0}
+    tracking = np.array([o[2] for o in outputs])
+    # Tracking runs and gaps: a dropout is tracking -> not tracking, a flicker is
+    # a gap of at most flicker_frames published frames between two tracking runs
+    dropouts, flickers, gap = 0, 0, 0
+    for prev, cur in zip(tracking[:-1], tracking[1:]):
+        if prev and not cur:
+            dropouts += 1
+            gap = 1
+        elif not prev and not cur and gap:
+            gap += 1
+        elif not prev and cur:
+            if 0 < gap <= flicker_frames:
+                flickers += 1
+            gap = 0
+    minutes = max(duration, 1e-6) / 60
+
+    summary = {
+        'frames': len(outputs),
+        'tracking_ratio': float(tracking.mean()),
+        'dropouts': dropouts,
+        'dropouts_per_min': dropouts / minutes,
+        'flickers': flickers,
+    }
+    for name, index in (('raw', 0), ('smoothed', 1)):
+        steps = point_steps([o[index] if o[2] else None for o in outputs])
+        summary[f'jitter_{name}'] = {
+            'mean': float(steps.mean()) if steps.size else 0.0,
+            'p95': float(np.percentile(steps, 95)) if steps.size else 0.0,
+        }
+    if track_ids:
+        counts = np.array([len(ids) for ids in track_ids])
+        distinct = len({i for ids in track_ids for i in ids})
+        summary['people'] = {
+            'mean_tracks': float(counts.mean()),
+            'max_tracks': int(counts.max()),
+            'distinct_ids': distinct,
+            # IDs started per minute beyond the ones needed for the peak crowd
+            'id_churn_per_min': max(0, distinct - int(counts.max())) / minutes,
+        }
+    return summary
+
+
+def reference_track(points: np.ndarray, radius: int = 2) -> np.ndarray:
+    """Where the person was: raw points averaged over +-radius frames (no lag, less noise)"""
+    kernel = np.ones(2 * radius + 1)
+    counts = np.convolve(np.ones(len(points)), kernel, mode='same')
+    return np.stack([np.convolve(points[:, i], kernel, mode='same') / counts for i in range(2)], axis=1)
+
+
+def filter_lag(inputs: list, outputs: list, max_lag: float = 0.5) -> dict:
+    """Lag of the sent points behind the reference track, and the error at the best alignment.
+
+    The lag is the time shift that best lines up each sent point (at its send time)
+    with the reference track; it includes the pipeline latency that prediction
+    takes out. Only runs of consecutive tracking frames are compared.
+    """
+    runs, start = [], None
+    for i, (_, _, _, tracking) in enumerate(inputs + [(0, 0, None, False)]):
+        if tracking and start is None:
+            start = i
+        elif not tracking and start is not None:
+            if i - start >= 10:
+                runs.append((start, i))
+            start = None
+    if not runs:
+        return {'lag_ms': None, 'error_mean': None}
+    shifts = np.arange(-0.1, max_lag, 0.005)
+    errors = np.zeros(len(shifts))
+    counts = np.zeros(len(shifts))
+    for start, end in runs:
+        capture = np.array([inputs[i][0] for i in range(start, end)])
+        send = np.array([inputs[i][1] for i in range(start, end)])
+        reference = reference_track(np.array([inputs[i][2][:2] for i in range(start, end)]))
+        sent = np.array([outputs[i][:2] for i in range(start, end)])
+        for k, shift in enumerate(shifts):
+            query = send - shift
+            valid = (query >= capture[0]) & (query <= capture[-1])
+            if not valid.any():
+                continue
+            ref = np.stack([np.interp(query[valid], capture, reference[:, i]) for i in range(2)], axis=1)
+            errors[k] += np.hypot(*(sent[valid] - ref).T).sum()
+            counts[k] += valid.sum()
+    mean_errors = np.where(counts > 0, errors / np.maximum(counts, 1), np.inf)
+    best = int(np.argmin(mean_errors))
+    zero = int(np.argmin(np.abs(shifts)))
+    return {'lag_ms': float(shifts[best] * 1000), 'error_mean': float(mean_errors[best]),
+            'error_at_send': float(mean_errors[zero])}
+
+
+def filter_summary(inputs: list, names: List[str], saved_params: dict, max_prediction: float) -> dict:
+    """Replay the recorded filter input through each point filter (and the raw point)"""
+    summary = {}
+    for name in ['raw'] + names:
+        if name == 'raw':
+            outputs = [point if tracking else None for _, _, point, tracking in inputs]
+        else:
+            point_filter = make_point_filter(name, saved_params.get(name), max_prediction)
+            outputs = [point_filter.step(point, tracking, capture, send) for capture, send, point, tracking in inputs]
+        tracked = [o if tracking else None for o, (_, _, _, tracking) in zip(outputs, inputs)]
+        steps = point_steps(tracked)
+        summary[name] = {
+            'jitter_mean': float(steps.mean()) if steps.size else 0.0,
+            'jitter_p95': float(np.percentile(steps, 95)) if steps.size else 0.0,
+            **filter_lag(inputs, outputs),
+        }
+    return summary
+
+
+def load_filter_params(settings_file: str) -> dict:
+    """Point filter parameters tuned and saved in the detector settings file"""
+    try:
+        with open(settings_file) as f:
+            return json.load(f).get('point_filters', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def resolve_model(spec: str, exdark_path: str):
+    """Map a --models entry to (model_name, weights_path); 'exdark' searches the exdark folder"""
+    if spec == 'exdark':
+        weights = find_exdark_weights(exdark_path)
+        return (None, None) if weights is None else ('yolov8n.pt', weights)
+    if os.path.exists(spec):
+        return 'yolov8n.pt', spec
+    return spec, None
+
+
+def clip_info(path: str):
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), cap.get(cv2.CAP_PROP_FPS) or 30.0
+    finally:
+        cap.release()
+
+
+def run_config(clip: str, config: dict, args, shared: Optional[YOLODetectorOSC]) -> Tuple[dict, YOLODetectorOSC]:
+    """Replay one clip with one configuration; returns (run report, detector)"""
+    total, fps = clip_info(clip)
+    frames = min(total, args.frames) if args.frames else total
+    recorder = SampleRecorder()
+    detector = ReplayDetector(
+        source=clip,
+        model_name=config['model_name'],
+        weights_path=config['weights_path'],
+        confidence_threshold=args.confidence,
+        use_websockets=False,
+        headless=True,
+        queue_size=args.queue_size,
+        drop_policy=args.drop_policy if args.realtime else 'block',
+        backend=args.backend,
+        model_cache_dir=args.model_cache,
+        warmup_runs=0,
+        multi_person=args.multi_person,
+        settings_file=args.settings,
+        shared_model_from=shared,
+        metrics=recorder,
+        inference_size=config['inference_size'],
+        direct_inference=config['direct'],
+    )
+    detector.process_every_n_frames = config['every_n']
+    detector.apply_enhancement_to_inference = config['enhancement']
+    detector.use_bg_subtraction = config['bg_subtraction']
+    detector.grabber.max_frames = frames
+    detector.clip_fps = fps
+    if not args.realtime:
+        detector.grabber.frame_interval = 0.0
+        detector.grabber.lossless = True
+    # Warm up at this configuration's size so the first frames don't pay for it
+    detector.warmup_model(args.warmup)
+
+    expected = frames // config['every_n']
+    detector.start_pipeline()
+    t0 = time.perf_counter()
+    last_progress, last_count = t0, 0
+    try:
+        while not detector.stop_event.wait(0.05):
+            now = time.perf_counter()
+            published = len(detector.outputs)
+            if published != last_count:
+                last_progress, last_count = now, published
+            # Whole clip handed out and nothing left in flight
+            if published >= expected or (detector.grabber.seq >= frames and now - last_progress > 0.25):
+                break
+            if now - last_progress > args.stall_timeout:
+                print(f"No output for {args.stall_timeout:.0f}s, ending run early")
+                break
+        wall = last_progress - t0
+        # Counted before stopping: frames captured while the stages shut down aren't drops
+        dropped = detector.grabber.take_dropped()
+        dropped += sum(detector.stage_queues[k].take_dropped() for k in ('inference', 'publish'))
+    finally:
+        detector.stop_pipeline()
+        detector.grabber.stop()
+        detector.cap.release()
+
+    outputs = detector.outputs
+    published = len(outputs)
+    capture_to_send = recorder.samples.pop('detector_capture_to_send_seconds', [])
+    clip_seconds = frames / fps
+    report = {
+        'clip': clip,
+        'config': {k: v for k, v in config.items() if k not in ('model_name', 'weights_path')},
+        'frames_in_clip': frames,
+        'clip_fps': fps,
+        'frames_published': published,
+        'dropped_frames': dropped,
+        'wall_seconds': wall,
+        'throughput_fps': published / max(wall, 1e-6),
+        # Clip frames covered per second of wall time; >= 1 keeps up with the recording
+        'realtime_factor': (min(detector.grabber.seq, frames) / fps) / max(wall, 1e-6),
+        'stages': {stage: percentiles(values) for stage, values in sorted(recorder.samples.items())},
+        'capture_to_send': percentiles(capture_to_send),
+        'stability': stability_summary(outputs, detector.track_ids, clip_seconds, args.flicker_frames),
+        'filters': filter_summary(detector.filter_inputs, args.filters, load_filter_params(args.settings),
+                                  args.max_prediction),
+    }
+    return report, detector
+
+
+def parse_toggle(values: List[str]) -> List[bool]:
+    return sorted({v.lower() in ('on', '1', 'true', 'yes') for v in values})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded clips through the detector pipeline and sweep settings')
+    parser.add_argument('--videos', nargs='*', default=None, help='Clips to replay (default: video.MOV)')
+    parser.add_argument('--models', nargs='+', default=['yolov8n.pt'],
+                        help="YOLO model names, .pt weight files, or 'exdark' for the weights in --exdark-path")
+    parser.add_argument('--exdark-path', default='./exdark', help='Path to local exdark repo/folder')
+    parser.add_argument('--inference-sizes', nargs='+', type=int, default=[256], help='Inference sizes to sweep')
+    parser.add_argument('--every-n', nargs='+', type=int, default=[1], help='process_every_n_frames values to sweep')
+    parser.add_argument('--enhancement', nargs='+', default=['off'], help='Enhancement for inference: off and/or on')
+    parser.add_argument('--bg-subtraction', nargs='+', default=['off'], help='Background subtraction: off and/or on')
+    parser.add_argument('--direct-inference', nargs='+', default=['off'],
+                        help='Direct input-tensor path instead of the Ultralytics predictor: off and/or on')
+    parser.add_argument('--backend', default='torch', choices=INFERENCE_BACKENDS, help='Inference runtime')
+    parser.add_argument('--model-cache', default='model_cache', help='Folder for exported ONNX/OpenVINO models')
+    parser.add_argument('--confidence', type=float, default=0.5, help='Confidence threshold')
+    parser.add_argument('--settings', default='detector_settings.json', help='Detector settings file with the venue crop')
+    parser.add_argument('--multi-person', action='store_true', help='Also run the tracker and report track ID churn')
+    parser.add_argument('--filters', nargs='+', default=list(POINT_FILTERS), choices=list(POINT_FILTERS),
+                        help='Point filters to replay over each run (tuned parameters come from --settings)')
+    parser.add_argument('--max-prediction', type=float, default=0.1,
+                        help='Prediction limit for the replayed filters, seconds')
+    parser.add_argument('--realtime', action='store_true',
+                        help='Replay at the clip frame rate with the live drop policy (default: as fast as possible, lossless)')
+    parser.add_argument('--queue-size', type=int, default=1, help='Max frames waiting between pipeline stages')
+    parser.add_argument('--drop-policy', default='drop_oldest', help='Queue drop policy for --realtime runs')
+    parser.add_argument('--frames', type=int, default=0, help='Only replay the first N frames of each clip (0 = all)')
+    parser.add_argument('--warmup', type=int, default=3, help='Warm-up inference passes before each run')
+    parser.add_argument('--flicker-frames', type=int, default=3,
+                        help='Tracking gaps up to this many published frames count as flicker')
+    parser.add_argument('--stall-timeout', type=float, default=10.0, help='End a run after this long without output')
+    parser.add_argument('--report', default='benchmark_report.json', help='Where to write the JSON report')
+    args = parser.parse_args()
+
+    if not YOLO_AVAILABLE:
+        print("Ultralytics YOLO is required. Install with: pip install ultralytics")
+        return 1
+
+    videos = args.videos or [v for v in [find_test_video()] if v]
+    clips = []
+    for video in videos:
+        info = clip_info(video)
+        if info is None or info[0] <= 0:
+            print(f"Skipping unreadable clip: {video}")
+        else:
+            clips.append(video)
+    if not clips:
+        print("No recordings found; pass --videos or put video.MOV next to the script")
+        return 1
+
+    models = []
+    for spec in args.models:
+        model_name, weights_path = resolve_model(spec, args.exdark_path)
+        if model_name is None:
+            print(f"Skipping model '{spec}'")
+        else:
+            models.append((spec, model_name, weights_path))
+    if not models:
+        return 1
+
+    configs = []
+    for (spec, model_name, weights_path), size, every_n, enhancement, bg, direct in itertools.product(
+            models, args.inference_sizes, args.every_n, parse_toggle(args.enhancement),
+            parse_toggle(args.bg_subtraction), parse_toggle(args.direct_inference)):
+        configs.append({'model': spec, 'model_name': model_name, 'weights_path': weights_path,
+                        'inference_size': size, 'every_n': max(1, every_n),
+                        'enhancement': enhancement, 'bg_subtraction': bg, 'direct': direct})
+
+    # One loaded model per weights file and inference path (and per size for the
+    # fixed-shape exported backends and the direct path's input tensor)
+    loaded = {}
+    runs = []
+    started = time.time()
+    print(f"{len(configs)} configurations x {len(clips)} clips, "
+          f"{'real-time' if args.realtime else 'as fast as possible'}")
+    for config in configs:
+        fixed_size = args.backend != 'torch' or config['direct']
+        key = (config['model'], config['direct'], config['inference_size'] if fixed_size else None)
+        for clip in clips:
+            label = (f"{config['model']} size={config['inference_size']} every={config['every_n']} "
+                     f"enh={'on' if config['enhancement'] else 'off'} bg={'on' if config['bg_subtraction'] else 'off'}"
+                     f"{' direct' if config['direct'] else ''}")
+            try:
+                report, detector = run_config(clip, config, args, loaded.get(key))
+            except Exception as e:
+                print(f"{label} {os.path.basename(clip)}: failed ({e})")
+                continue
+            loaded.setdefault(key, detector)
+            runs.append(report)
+            inference = report['stages'].get('inference', {})
+            stability = report['stability']
+            print(f"{label} {os.path.basename(clip)}: {report['throughput_fps']:.1f} fps "
+                  f"(x{report['realtime_factor']:.2f} real time), inference p90 {inference.get('p90_ms', 0):.1f} ms, "
+                  f"capture->send p90 {report['capture_to_send'].get('p90_ms', 0):.1f} ms, "
+                  f"tracking {stability.get('tracking_ratio', 0):.0%}, dropouts/min {stability.get('dropouts_per_min', 0):.1f}")
+            for name, stats in report['filters'].items():
+                if stats['lag_ms'] is not None:
+                    print(f"    {name:9s} lag {stats['lag_ms']:6.0f} ms  jitter {stats['jitter_mean'] * 1000:.2f}e-3")
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'duration_seconds': time.time() - started,
+        'mode': 'realtime' if args.realtime else 'max',
+        'backend': args.backend,
+        'confidence_threshold': args.confidence,
+        'settings_file': args.settings,
+        'clips': clips,
+        'runs': runs,
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report} ({len(runs)} runs)")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Memory/allocation benchmark for the capture -> inference-frame path.
+
+Runs the same per-frame work twice on identical frames:
+
+- copying: the previous implementation (new arrays from decode, flip, display
+  copy, background mask, enhancement LUT and resize on every frame)
+- ring: the current one (decode into a reused buffer, flip into a
+  shared-memory FrameRing slot, every other step writing into BufferRing destinations)
+
+and reports time, bytes allocated per frame (tracemalloc peak over the frame) and
+RSS growth. Frames come from a video file (--video) or are synthetic.
+RSS comes from psutil if installed, else from the resource module (peak RSS,
+Unix only); without either it is not reported.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from pose_detector_yoloV8 import BufferRing, FrameRing
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+
+class SyntheticCapture:
+    """Stand-in for cv2.VideoCapture: noise background with a moving block"""
+
+    def __init__(self, width: int, height: int):
+        rng = np.random.default_rng(0)
+        self.background = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+        self.count = 0
+
+    def read(self, image=None):
+        if image is None or image.shape != self.background.shape:
+            image = np.empty_like(self.background)
+        np.copyto(image, self.background)
+        h, w = image.shape[:2]
+        x = (self.count * 7) % max(1, w - h // 3)
+        image[h // 3:2 * h // 3, x:x + h // 3] = 200
+        self.count += 1
+        return True, image
+
+
+class VideoCapture:
+    """Looping video file reader that honours the reuse-buffer argument"""
+
+    def __init__(self, path: str):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Could not open video: {path}")
+
+    def read(self, image=None):
+        ret, frame = self.cap.read(image)
+        if not ret:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(image)
+        return ret, frame
+
+
+def rss_kb():
+    """Resident set size in KB, or None if neither psutil nor resource is available"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss // 1024
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+def crop_box(shape, crop: float):
+    """Centered crop covering `crop` of each dimension"""
+    h, w = shape[:2]
+    cw, ch = int(w * crop), int(h * crop)
+    x1, y1 = (w - cw) // 2, (h - ch) // 2
+    return x1, y1, x1 + cw, y1 + ch
+
+
+def inference_shape(crop_w: int, crop_h: int, inference_size: int):
+    scale = min(inference_size / crop_w, inference_size / crop_h, 1.0)
+    return int(crop_w * scale), int(crop_h * scale)
+
+
+def run_copying(cap, frames: int, crop: float, inference_size: int, use_mask: bool, lut: np.ndarray):
+    """Per-frame work as it was before the frame ring"""
+    mask = None
+
+    def step():
+        nonlocal mask
+        _, frame = cap.read()
+        frame = cv2.flip(frame, 1)
+        display = frame.copy()
+        x1, y1, x2, y2 = crop_box(frame.shape, crop)
+        cropped = frame[y1:y2, x1:x2]
+        if use_mask:
+            if mask is None:
+                mask = np.full(cropped.shape[:2], 255, dtype=np.uint8)
+            mask3 = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
+            cropped = cv2.bitwise_and(cropped, mask3)
+        enhanced = cv2.LUT(cropped, lut)
+        w, h = inference_shape(x2 - x1, y2 - y1, inference_size)
+        return display, cv2.resize(enhanced, (w, h))
+
+    return measure(step, frames)
+
+
+def run_ring(cap, frames: int, crop: float, inference_size: int, use_mask: bool, lut: np.ndarray, slots: int):
+    """Per-frame work with the shared-memory ring and reused destinations"""
+    state = {'raw': None, 'ring': None, 'seq': 0, 'mask': None}
+    buffers = {name: BufferRing(1) for name in ('mask3', 'masked', 'enhanced', 'display')}
+    buffers['inference'] = BufferRing(4)
+
+    def step():
+        _, raw = cap.read(state['raw'])
+        state['raw'] = raw
+        if state['ring'] is None:
+            state['ring'] = FrameRing(raw.shape, slots)
+        ring = state['ring']
+        state['seq'] += 1
+        frame = cv2.flip(raw, 1, dst=ring.frames[ring.index(state['seq'])])
+        ring.commit(state['seq'], time.time())
+        display = buffers['display'].get(frame.shape)
+        np.copyto(display, frame)
+        x1, y1, x2, y2 = crop_box(frame.shape, crop)
+        cropped = frame[y1:y2, x1:x2]
+        if use_mask:
+            if state['mask'] is None:
+                state['mask'] = np.full(cropped.shape[:2], 255, dtype=np.uint8)
+            mask3 = cv2.cvtColor(state['mask'], cv2.COLOR_GRAY2BGR, dst=buffers['mask3'].get(cropped.shape))
+            cropped = cv2.bitwise_and(cropped, mask3, dst=buffers['masked'].get(cropped.shape))
+        enhanced = cv2.LUT(cropped, lut, dst=buffers['enhanced'].get(cropped.shape))
+        w, h = inference_shape(x2 - x1, y2 - y1, inference_size)
+        out = buffers['inference'].get((h, w, 3))
+        return display, cv2.resize(enhanced, (w, h), dst=out)
+
+    try:
+        return measure(step, frames)
+    finally:
+        if state['ring'] is not None:
+            state['ring'].close()
+
+
+def measure(step, frames: int, warmup: int = 20) -> dict:
+    """Run step() `frames` times untraced for timing, then again under tracemalloc.
+
+    The warm-up should cover every ring slot once so first-touch page faults of
+    the shared memory are not counted. Timing is taken without tracemalloc, which
+    slows down every allocation it records.
+    """
+    for _ in range(warmup):
+        step()
+    rss_before = rss_kb()
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        step()
+    elapsed = time.perf_counter() - t0
+
+    per_frame_bytes = []
+    tracemalloc.start()
+    try:
+        for _ in range(frames):
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            step()
+            _, peak = tracemalloc.get_traced_memory()
+            per_frame_bytes.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+    rss_after = rss_kb()
+    return {
+        'ms_per_frame': elapsed / frames * 1000,
+        'alloc_bytes_per_frame': float(np.mean(per_frame_bytes)),
+        'max_alloc_bytes_per_frame': int(np.max(per_frame_bytes)),
+        'rss_growth_kb': None if rss_before is None else int(rss_after - rss_before),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Allocation benchmark: copying frame path vs shared-memory frame ring')
+    parser.add_argument('--video', default=None, help='Video file to read frames from (default: synthetic frames)')
+    parser.add_argument('--size', default='1920x1080', help='Synthetic frame size WxH')
+    parser.add_argument('--frames', type=int, default=300, help='Frames per run')
+    parser.add_argument('--crop', type=float, default=0.8, help='Crop fraction of each dimension')
+    parser.add_argument('--inference-size', type=int, default=256, help='Inference frame size')
+    parser.add_argument('--bg-mask', action='store_true', help='Include the background-subtraction masking step')
+    parser.add_argument('--slots', type=int, default=8, help='Frame ring slots')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    lut = np.clip(np.arange(256) * 1.2 + 10, 0, 255).astype(np.uint8)
+
+    def new_capture():
+        return VideoCapture(args.video) if args.video else SyntheticCapture(width, height)
+
+    results = {
+        'copying': run_copying(new_capture(), args.frames, args.crop, args.inference_size, args.bg_mask, lut),
+        'ring': run_ring(new_capture(), args.frames, args.crop, args.inference_size, args.bg_mask, lut, args.slots),
+    }
+    for name, stats in results.items():
+        rss = 'RSS n/a' if stats['rss_growth_kb'] is None else f"RSS +{stats['rss_growth_kb']} KB"
+        print(f"{name:8s} {stats['ms_per_frame']:7.2f} ms/frame  "
+              f"{stats['alloc_bytes_per_frame'] / 1024:9.1f} KiB allocated/frame "
+              f"(max {stats['max_alloc_bytes_per_frame'] / 1024:.1f} KiB)  {rss}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
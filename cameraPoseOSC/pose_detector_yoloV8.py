@@ -1,36 +1,40 @@
+import time
+# Startup timing reference (see StartupTimer): as early as the script can take it
+PROCESS_START = time.perf_counter()
 import cv2
 import numpy as np
 from pythonosc import udp_client
-import time
 import argparse
 import json
 import os
+import shutil
+import hashlib
+import importlib.util
+import struct
+import bisect
 import socket
+import signal
 import threading
 import asyncio
-import websockets
+import sys
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
 from collections import deque
 from typing import List, Tuple, Optional
 
-try:
-    import torch
-    TORCH_AVAILABLE = True
-except Exception:
-    TORCH_AVAILABLE = False
+# PyTorch, Ultralytics and websockets take seconds to import. They are only looked
+# up here and imported on first use (import_torch/import_yolo/import_websockets),
+# so the model can be imported and loaded on its own thread while the camera opens.
+TORCH_AVAILABLE = importlib.util.find_spec('torch') is not None
+torch = None
 
-try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
-except ImportError:
-    YOLO_AVAILABLE = False
+YOLO_AVAILABLE = importlib.util.find_spec('ultralytics') is not None
+YOLO = None
+if not YOLO_AVAILABLE:
     print("Warning: Ultralytics YOLO not available. Install with: pip install ultralytics")
 
-try:
-    import websocket
-    WEBSOCKET_AVAILABLE = True
-except ImportError:
-    WEBSOCKET_AVAILABLE = False
-    print("Note: websocket-client not available. Using UDP OSC fallback.")
+websockets = None
 
 try:
     from pythonosc.osc_message_builder import OscMessageBuilder
@@ -39,6 +43,1928 @@ except Exception:
     OSC_MSG_BUILDER_AVAILABLE = False
     OscMessageBuilder = None
 
+
+INFERENCE_BACKENDS = ('torch', 'onnx', 'openvino', 'onnx-int8')
+
+
+def import_torch():
+    """Import PyTorch on first use and return the module"""
+    global torch
+    if torch is None:
+        import torch as torch_module
+        torch = torch_module
+    return torch
+
+
+def import_yolo():
+    """Import Ultralytics (which imports PyTorch) on first use and return the YOLO class"""
+    global YOLO
+    if YOLO is None:
+        from ultralytics import YOLO as yolo_class
+        YOLO = yolo_class
+    return YOLO
+
+
+def import_websockets():
+    """Import the websockets package on first use (only the WebSocket server needs it)"""
+    global websockets
+    if websockets is None:
+        import websockets as websockets_module
+        websockets = websockets_module
+    return websockets
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Return the hex SHA-256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_model_path(weights_file: str, backend: str, imgsz: int, cache_dir: str) -> str:
+    """Return where the exported artefact for these weights/backend/imgsz lives.
+
+    The cache key is the weights hash plus the inference size, so retrained weights
+    or a different inference_size produce a new export while restarts reuse the old one.
+    """
+    stem = os.path.splitext(os.path.basename(weights_file))[0]
+    digest = file_sha256(weights_file)[:16]
+    if backend == 'onnx':
+        return os.path.join(cache_dir, f"{stem}_{digest}_{imgsz}.onnx")
+    if backend == 'onnx-int8':
+        return os.path.join(cache_dir, f"{stem}_{digest}_{imgsz}_int8.onnx")
+    # Ultralytics recognises OpenVINO models by the '_openvino_model' folder suffix
+    return os.path.join(cache_dir, f"{stem}_{digest}_{imgsz}_openvino_model")
+
+
+def export_model_cached(weights_file: str, backend: str, imgsz: int, cache_dir: str) -> str:
+    """Export YOLO weights to ONNX or OpenVINO IR once and return the cached artefact path.
+
+    INT8 models need calibration frames and are produced by quantize_detector.py;
+    here they are only looked up.
+    """
+    target = cached_model_path(weights_file, backend, imgsz, cache_dir)
+    if backend == 'onnx-int8':
+        if not os.path.exists(target):
+            raise FileNotFoundError(f"{target} not found, run quantize_detector.py first")
+        print(f"Using cached INT8 model: {target}")
+        return target
+    if os.path.exists(target):
+        print(f"Using cached {backend} model: {target}")
+        return target
+
+    print(f"Exporting {weights_file} to {backend} (imgsz={imgsz}), this only happens once...")
+    os.makedirs(cache_dir, exist_ok=True)
+    exported = import_yolo()(weights_file).export(format=backend, imgsz=imgsz, device='cpu', half=False, dynamic=False)
+    shutil.move(str(exported), target)
+    print(f"Exported model cached at: {target}")
+    return target
+
+
+def find_test_video() -> Optional[str]:
+    """Return a local test recording 'video.MOV' if present, else None"""
+    # Prefer a local test file 'video.MOV' (case-insensitive) if available.
+    candidates = ['video.MOV', 'video.mov']
+    # Check working directory first
+    for v in candidates:
+        if os.path.exists(v):
+            return v
+    # Then check the script directory
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    for v in candidates:
+        p = os.path.join(script_dir, v)
+        if os.path.exists(p):
+            return p
+    return None
+
+
+# Folders that never hold trained weights but can be huge (a checked-out exdark
+# repo carries its tooling's node_modules)
+WEIGHTS_SCAN_SKIP = {'node_modules', '.git', '__pycache__', '.venv', 'venv'}
+
+
+def scan_weights(root: str) -> Tuple[List[str], dict]:
+    """Every .pt file under root, in one walk, and the mtime of every folder walked.
+
+    A new .pt or a new subfolder anywhere in the tree changes the mtime of the
+    folder it lands in, so comparing weights_index_dirs() against these mtimes
+    tells whether the cached index is still complete.
+    """
+    found, mtimes = [], {}
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in WEIGHTS_SCAN_SKIP]
+        mtimes[dirpath] = os.stat(dirpath).st_mtime
+        found.extend(os.path.join(dirpath, f) for f in files if f.endswith('.pt'))
+    return found, mtimes
+
+
+def weights_index_dirs(dirs) -> dict:
+    """Current mtimes of the folders a scan walked (OSError if one is gone)"""
+    return {d: os.stat(d).st_mtime for d in dirs}
+
+
+def find_exdark_weights(exdark_path: str, index_file: Optional[str] = None,
+                        refresh: bool = False) -> Optional[str]:
+    """Search the exdark folder for trained weights (best.pt preferred over last.pt, then any .pt)
+
+    The .pt files found are kept in index_file (JSON, per folder) and reused while
+    every folder the scan walked is unchanged; refresh forces a new scan.
+    """
+    exdark_dir = os.path.abspath(os.path.expanduser(exdark_path))
+    found = []
+    if os.path.exists(exdark_dir):
+        index = {}
+        if index_file and os.path.exists(index_file):
+            try:
+                with open(index_file, 'r') as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+        entry = index.get(exdark_dir)
+        try:
+            cached = (not refresh and entry is not None and all(os.path.exists(p) for p in entry['weights'])
+                      and weights_index_dirs(entry['walked']) == entry['walked'])
+        except (OSError, KeyError, TypeError):
+            cached = False
+        if cached:
+            found = list(entry['weights'])
+        else:
+            found, dirs = scan_weights(exdark_dir)
+            if index_file:
+                index[exdark_dir] = {'weights': found, 'walked': dirs}
+                try:
+                    os.makedirs(os.path.dirname(index_file) or '.', exist_ok=True)
+                    with open(index_file, 'w') as f:
+                        json.dump(index, f, indent=2)
+                except OSError as e:
+                    print(f"Could not write weights index: {e}")
+    # Trained weights (best/last) first; if none, any .pt
+    trained = [p for p in found if 'best' in os.path.basename(p).lower() or 'last' in os.path.basename(p).lower()]
+    found = trained or found
+
+    if not found:
+        print(f"No .pt weights found under {exdark_dir}; falling back to default model")
+        return None
+    # prefer best.pt over last.pt
+    found.sort(key=lambda p: (0 if 'best' in os.path.basename(p).lower() else 1, p))
+    print(f"Using EXDark weights found at: {found[0]}")
+    return found[0]
+
+
+def find_person_class_idx(class_names) -> Optional[int]:
+    """Return the class index named 'person'/'people', or None if the model has none"""
+    try:
+        items = class_names.items() if isinstance(class_names, dict) else enumerate(class_names)
+        for idx, name in items:
+            if str(name).lower() in ('person', 'people'):
+                return int(idx)
+    except Exception:
+        pass
+    return None
+
+
+def extract_person_detections(results, person_class_idx: Optional[int], confidence_threshold: float) -> np.ndarray:
+    """Pull person boxes out of a YOLO result in one vectorized pass.
+
+    Returns an (N, 6) float32 array of [x1, y1, x2, y2, conf, weight]. Box
+    coordinates are normalized to the image the model saw (the crop), so callers
+    never need to know the inference scale. weight is conf * box area in model
+    pixels (bigger and more confident boxes count more).
+    """
+    empty = np.zeros((0, 6), dtype=np.float32)
+    if not results or len(results) == 0:
+        return empty
+    result = results[0]
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return empty
+
+    # One device->host transfer per field instead of one per box
+    data = boxes.data.cpu().numpy() if hasattr(boxes.data, 'cpu') else np.asarray(boxes.data)
+    xyxy = data[:, :4].astype(np.float32)
+    conf = data[:, 4].astype(np.float32)
+    cls = data[:, 5].astype(np.int64)
+
+    # Filter for person class (use detected mapping if available, otherwise class 0)
+    target = person_class_idx if person_class_idx is not None else 0
+    keep = (cls == target) & (conf > confidence_threshold)
+    if not keep.any():
+        return empty
+    xyxy = xyxy[keep]
+    conf = conf[keep]
+
+    img_h, img_w = result.orig_img.shape[:2]
+    box_w = np.maximum(1.0, xyxy[:, 2] - xyxy[:, 0])
+    box_h = np.maximum(1.0, xyxy[:, 3] - xyxy[:, 1])
+
+    detections = np.empty((len(conf), 6), dtype=np.float32)
+    detections[:, :4] = xyxy / np.array([img_w, img_h, img_w, img_h], dtype=np.float32)
+    detections[:, 4] = conf
+    detections[:, 5] = conf * box_w * box_h
+    return detections
+
+
+def weighted_average_point(detections: np.ndarray) -> Optional[Tuple[float, float, float]]:
+    """Weighted center of all detections (normalized x, y) and their mean confidence"""
+    if detections is None or len(detections) == 0:
+        return None
+    weights = detections[:, 5]
+    total_weight = float(weights.sum())
+    if total_weight <= 0:
+        return None
+    centers_x = (detections[:, 0] + detections[:, 2]) * 0.5
+    centers_y = (detections[:, 1] + detections[:, 3]) * 0.5
+    norm_x = min(max(0.0, float(np.dot(centers_x, weights)) / total_weight), 1.0)
+    norm_y = min(max(0.0, float(np.dot(centers_y, weights)) / total_weight), 1.0)
+    # avg_z: keep as mean confidence across person boxes
+    return (norm_x, norm_y, float(detections[:, 4].mean()))
+
+
+CENTER_POINT = (0.5, 0.5, 0.0)
+
+
+class PointFilter:
+    """Smooths the published point and predicts it forward to the moment it is sent.
+
+    Measurements are stamped with their frame's capture time; step() extrapolates
+    the filtered position over the measured capture-to-send latency (at most
+    max_prediction seconds), which takes the pipeline delay out of the output.
+    Without a detection the point drifts back to the crop center and the velocity
+    is forgotten; when someone is found again the filter restarts at them.
+    Subclasses implement the filter itself (update/predict), its tuning from the
+    P/O keys and the parameters kept in the settings file.
+    """
+
+    name = ''
+    predictive = True
+
+    def __init__(self, max_prediction: float = 0.1):
+        self.max_prediction = max_prediction
+        self.point = None  # filtered position at self.time, np.array([x, y, z])
+        self.velocity = None  # per second, for predictive filters
+        self.time = None
+        self.tracking = False
+
+    def step(self, detected_point: Optional[Tuple[float, float, float]], tracking: bool,
+             capture_time: float, now: Optional[float] = None) -> Tuple[float, float, float]:
+        """Feed one frame's point (None when nobody is tracked); returns the point to send"""
+        if not tracking or detected_point is None:
+            self.tracking = False
+            if self.point is None:
+                self.reset(CENTER_POINT, capture_time)
+            else:
+                self.drift(CENTER_POINT, capture_time)
+            return tuple(float(v) for v in self.point)
+        measured = np.asarray(detected_point, dtype=np.float64)
+        # Out-of-order or repeated timestamps: treat as one frame interval
+        dt = capture_time - self.time if self.time is not None and capture_time > self.time else 1.0 / 30
+        if self.point is None or not self.tracking:
+            self.tracking = True
+            self.resume(measured, capture_time, dt)
+            return tuple(float(v) for v in self.point)
+        self.update(measured, dt)
+        self.time = capture_time
+        now = time.time() if now is None else now
+        lead = min(max(now - capture_time, 0.0), self.max_prediction)
+        predicted = self.predict(lead)
+        # x, y are normalized to the crop; don't extrapolate past its edges
+        return (min(max(float(predicted[0]), 0.0), 1.0), min(max(float(predicted[1]), 0.0), 1.0),
+                float(predicted[2]))
+
+    def reset(self, point, capture_time: float):
+        self.point = np.array(point, dtype=np.float64)
+        self.time = capture_time
+
+    def drift(self, target, capture_time: float, alpha: float = 0.3):
+        """Move toward target without using (and forgetting) the velocity"""
+        self.point += (np.asarray(target) - self.point) * alpha
+        self.time = capture_time
+
+    def resume(self, measured: np.ndarray, capture_time: float, dt: float):
+        """First detection after nobody was tracked (the jump is not a velocity)"""
+        self.reset(measured, capture_time)
+
+    def update(self, measured: np.ndarray, dt: float):
+        raise NotImplementedError
+
+    def predict(self, lead: float) -> np.ndarray:
+        return self.point
+
+    def tune(self, direction: int):
+        """P (+1): follow faster, less smoothing; O (-1): smoother"""
+        raise NotImplementedError
+
+    def params(self) -> dict:
+        raise NotImplementedError
+
+    def snapshot(self):
+        """(capture time, position, velocity or None) for sending between updates"""
+        velocity = self.velocity.copy() if self.predictive and self.velocity is not None else None
+        return self.time, self.point.copy(), velocity
+
+    def describe(self) -> str:
+        values = "  ".join(f"{k}: {v:.3g}" for k, v in self.params().items())
+        if self.predictive:
+            values += f"  max_prediction: {self.max_prediction * 1000:.0f}ms"
+        return f"filter: {self.name}  {values}"
+
+
+class EmaFilter(PointFilter):
+    """Fixed-alpha exponential moving average per frame (no prediction)"""
+
+    name = 'ema'
+    predictive = False
+
+    def __init__(self, alpha: float = 0.2, max_prediction: float = 0.1):
+        super().__init__(max_prediction)
+        self.alpha = alpha
+
+    def drift(self, target, capture_time: float, alpha: float = 0.3):
+        # Move toward center a bit faster than while tracking
+        super().drift(target, capture_time, min(0.4, self.alpha * 1.5))
+
+    def resume(self, measured: np.ndarray, capture_time: float, dt: float):
+        # Glide from where the point drifted to, as while tracking
+        if self.point is None:
+            self.reset(measured, capture_time)
+        else:
+            self.update(measured, dt)
+            self.time = capture_time
+
+    def update(self, measured: np.ndarray, dt: float):
+        self.point += (measured - self.point) * self.alpha
+
+    def tune(self, direction: int):
+        self.alpha = min(0.95, max(0.01, self.alpha + 0.05 * direction))
+
+    def params(self) -> dict:
+        return {'alpha': self.alpha}
+
+
+def lowpass_alpha(cutoff, dt: float):
+    """Smoothing factor of a first-order low-pass at cutoff Hz sampled every dt seconds"""
+    tau = 1.0 / (2 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter(PointFilter):
+    """One-Euro filter: a low-pass whose cutoff rises with speed.
+
+    At rest the cutoff is min_cutoff (steady point), while moving it grows by
+    beta per unit of speed (normalized crop widths per second), so fast motion
+    is followed with little lag. The speed is measured between consecutive raw
+    points (not against the lagging filtered point), low-passed at d_cutoff, and
+    also extrapolates the point to the send time.
+    """
+
+    name = 'one_euro'
+
+    def __init__(self, min_cutoff: float = 1.0, beta: float = 5.0, d_cutoff: float = 0.5,
+                 max_prediction: float = 0.1):
+        super().__init__(max_prediction)
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.velocity = np.zeros(3)
+        self.measured = None  # previous raw point, for the speed estimate
+
+    def reset(self, point, capture_time: float):
+        super().reset(point, capture_time)
+        self.velocity = np.zeros(3)
+        self.measured = self.point.copy()
+
+    def drift(self, target, capture_time: float, alpha: float = 0.3):
+        super().drift(target, capture_time, alpha)
+        self.velocity[:] = 0.0
+
+    def update(self, measured: np.ndarray, dt: float):
+        raw_velocity = (measured - self.measured) / dt
+        self.measured = measured.copy()
+        self.velocity += (raw_velocity - self.velocity) * lowpass_alpha(self.d_cutoff, dt)
+        cutoff = self.min_cutoff + self.beta * np.abs(self.velocity)
+        self.point += (measured - self.point) * lowpass_alpha(cutoff, dt)
+
+    def predict(self, lead: float) -> np.ndarray:
+        return self.point + self.velocity * lead
+
+    def tune(self, direction: int):
+        self.min_cutoff = min(20.0, max(0.05, self.min_cutoff * 1.25 ** direction))
+
+    def params(self) -> dict:
+        return {'min_cutoff': self.min_cutoff, 'beta': self.beta, 'd_cutoff': self.d_cutoff}
+
+
+class KalmanFilter(PointFilter):
+    """Constant-velocity Kalman filter, one independent (position, velocity) state per axis.
+
+    process_noise is the white-acceleration spectral density (how quickly people
+    may change speed), measurement_noise the variance of a detected point. The
+    ratio sets the smoothing; the velocity state extrapolates to the send time.
+    """
+
+    name = 'kalman'
+
+    def __init__(self, process_noise: float = 0.02, measurement_noise: float = 1e-4,
+                 max_prediction: float = 0.1):
+        super().__init__(max_prediction)
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.velocity = np.zeros(3)
+        self.covariance = np.zeros((3, 2, 2))
+
+    def reset(self, point, capture_time: float):
+        super().reset(point, capture_time)
+        self.velocity = np.zeros(3)
+        # Position as uncertain as a measurement, velocity unknown (~1 crop/s)
+        self.covariance = np.zeros((3, 2, 2))
+        self.covariance[:, 0, 0] = self.measurement_noise
+        self.covariance[:, 1, 1] = 1.0
+
+    def drift(self, target, capture_time: float, alpha: float = 0.3):
+        super().drift(target, capture_time, alpha)
+        self.velocity[:] = 0.0
+        self.covariance[:, 0, 1] = self.covariance[:, 1, 0] = 0.0
+        self.covariance[:, 1, 1] = 1.0
+
+    def update(self, measured: np.ndarray, dt: float):
+        # Predict: x += v dt, P = F P F^T + Q
+        self.point += self.velocity * dt
+        p00, p01, p11 = self.covariance[:, 0, 0], self.covariance[:, 0, 1], self.covariance[:, 1, 1]
+        q = self.process_noise
+        p00 = p00 + dt * (2 * p01 + dt * p11) + q * dt ** 3 / 3
+        p01 = p01 + dt * p11 + q * dt ** 2 / 2
+        p11 = p11 + q * dt
+        # Correct with the measured position
+        gain_p = p00 / (p00 + self.measurement_noise)
+        gain_v = p01 / (p00 + self.measurement_noise)
+        innovation = measured - self.point
+        self.point += gain_p * innovation
+        self.velocity += gain_v * innovation
+        self.covariance[:, 0, 0] = (1 - gain_p) * p00
+        self.covariance[:, 0, 1] = self.covariance[:, 1, 0] = (1 - gain_p) * p01
+        self.covariance[:, 1, 1] = p11 - gain_v * p01
+
+    def predict(self, lead: float) -> np.ndarray:
+        return self.point + self.velocity * lead
+
+    def tune(self, direction: int):
+        self.process_noise = min(1e3, max(1e-3, self.process_noise * 2.0 ** direction))
+
+    def params(self) -> dict:
+        return {'process_noise': self.process_noise, 'measurement_noise': self.measurement_noise}
+
+
+POINT_FILTERS = {cls.name: cls for cls in (EmaFilter, OneEuroFilter, KalmanFilter)}
+
+
+def make_point_filter(name: str, params: Optional[dict] = None, max_prediction: float = 0.1) -> PointFilter:
+    """Build a filter from POINT_FILTERS with saved parameters (unknown keys are ignored)"""
+    cls = POINT_FILTERS[name]
+    point_filter = cls(max_prediction=max_prediction)
+    for key, value in (params or {}).items():
+        if key in point_filter.params():
+            setattr(point_filter, key, float(value))
+    return point_filter
+
+
+class OutputScheduler:
+    """Latest filtered point for a fixed-rate sender, interpolated or extrapolated to each tick.
+
+    The publish stage submits every filtered point with its filter's state and the
+    output stage asks for the point at each tick. With a predictive filter the
+    point moves on along the filter's velocity from the frame's capture time, at
+    most max_prediction plus one update interval ahead, so it keeps moving until
+    the next detection is due. Otherwise (ema, or prediction off) it is
+    interpolated from the previous to the latest point over the spacing of their
+    updates: up to one update interval of extra delay, but no overshoot. While
+    nobody is tracked the latest point is repeated.
+    """
+
+    # Longer gaps between updates (inference stalled) are not bridged any further
+    MAX_INTERVAL = 0.25
+
+    def __init__(self, rate: float, max_prediction: float = 0.1):
+        self.rate = rate
+        self.max_prediction = max_prediction
+        self.lock = threading.Lock()
+        self.state = None
+
+    def submit(self, point: Tuple[float, float, float], tracking: bool, depth_blob: Optional[bytes],
+               point_filter: Optional[PointFilter], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        filter_time, position, velocity = (point_filter.snapshot() if point_filter is not None and tracking
+                                           else (None, None, None))
+        with self.lock:
+            previous = self.state
+            interval = min(now - previous['arrived'], self.MAX_INTERVAL) if previous else 0.0
+            self.state = {
+                'point': np.asarray(point, dtype=np.float64),
+                'previous': previous['point'] if previous and previous['tracking'] and tracking else None,
+                'tracking': tracking,
+                'depth_blob': depth_blob,
+                'arrived': now,
+                'interval': interval,
+                'filter_time': filter_time,
+                'position': position,
+                'velocity': velocity if self.max_prediction > 0 else None,
+            }
+
+    def point_at(self, now: Optional[float] = None):
+        """(point, tracking, depth_blob) to send at `now`, or None before the first update"""
+        now = time.time() if now is None else now
+        with self.lock:
+            state = self.state
+        if state is None:
+            return None
+        point = state['point']
+        if state['tracking'] and state['velocity'] is not None:
+            lead = min(max(now - state['filter_time'], 0.0), self.max_prediction + state['interval'])
+            point = state['position'] + state['velocity'] * lead
+        elif state['previous'] is not None and state['interval'] > 0:
+            fraction = min((now - state['arrived']) / state['interval'], 1.0)
+            point = state['previous'] + (point - state['previous']) * fraction
+        x, y, z = (float(v) for v in point)
+        return (min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0), z), state['tracking'], state['depth_blob']
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between two sets of xyxy boxes"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class PersonTracker:
+    """Lightweight multi-person tracker: constant-velocity prediction + greedy IoU matching.
+
+    Works on the normalized detection array from extract_person_detections. All
+    track state is kept in NumPy arrays, so an update for ~20 people is a handful
+    of small vector operations (well under a millisecond).
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 10, min_hits: int = 2,
+                 velocity_smoothing: float = 0.6):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.velocity_smoothing = velocity_smoothing
+        self.next_id = 1
+        self.reset()
+
+    def reset(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.velocity = np.zeros((0, 4), dtype=np.float32)
+        self.conf = np.zeros(0, dtype=np.float32)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.age = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+
+    def update(self, detections: Optional[np.ndarray]) -> np.ndarray:
+        """Associate this frame's detections and return confirmed tracks.
+
+        Returns an (M, 7) float32 array of [id, x, y, conf, width, height, age]
+        with x/y the normalized box center and age in processed frames.
+        """
+        if detections is None:
+            detections = np.zeros((0, 6), dtype=np.float32)
+        det_boxes = detections[:, :4]
+        predicted = self.boxes + self.velocity
+
+        track_idx, det_idx = [], []
+        if len(predicted) and len(det_boxes):
+            ious = iou_matrix(predicted, det_boxes)
+            for _ in range(min(ious.shape)):
+                t, d = np.unravel_index(np.argmax(ious), ious.shape)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                track_idx.append(t)
+                det_idx.append(d)
+                ious[t, :] = -1.0
+                ious[:, d] = -1.0
+
+        # Unmatched tracks coast on their prediction with decaying velocity
+        unmatched = np.ones(len(self.ids), dtype=bool)
+        unmatched[track_idx] = False
+        self.boxes[unmatched] = predicted[unmatched]
+        self.velocity[unmatched] *= 0.5
+        self.misses[unmatched] += 1
+
+        if track_idx:
+            t = np.array(track_idx)
+            d = np.array(det_idx)
+            s = self.velocity_smoothing
+            self.velocity[t] = s * self.velocity[t] + (1.0 - s) * (det_boxes[d] - self.boxes[t])
+            self.boxes[t] = det_boxes[d]
+            self.conf[t] = detections[d, 4]
+            self.hits[t] += 1
+            self.misses[t] = 0
+
+        # Drop tracks that have been lost for too long
+        keep = self.misses <= self.max_misses
+        self.ids, self.boxes, self.velocity = self.ids[keep], self.boxes[keep], self.velocity[keep]
+        self.conf, self.hits, self.age, self.misses = self.conf[keep], self.hits[keep], self.age[keep], self.misses[keep]
+
+        # Start new tracks for unmatched detections
+        new = np.ones(len(det_boxes), dtype=bool)
+        new[det_idx] = False
+        count = int(new.sum())
+        if count:
+            self.ids = np.concatenate((self.ids, np.arange(self.next_id, self.next_id + count)))
+            self.next_id += count
+            self.boxes = np.concatenate((self.boxes, det_boxes[new]))
+            self.velocity = np.concatenate((self.velocity, np.zeros((count, 4), dtype=np.float32)))
+            self.conf = np.concatenate((self.conf, detections[new, 4]))
+            self.hits = np.concatenate((self.hits, np.ones(count, dtype=np.int64)))
+            self.age = np.concatenate((self.age, np.zeros(count, dtype=np.int64)))
+            self.misses = np.concatenate((self.misses, np.zeros(count, dtype=np.int64)))
+        self.age += 1
+
+        # Only report tracks that are confirmed and seen this frame
+        visible = (self.hits >= self.min_hits) & (self.misses == 0)
+        boxes = self.boxes[visible]
+        tracks = np.empty((len(boxes), 7), dtype=np.float32)
+        tracks[:, 0] = self.ids[visible]
+        tracks[:, 1] = (boxes[:, 0] + boxes[:, 2]) * 0.5
+        tracks[:, 2] = (boxes[:, 1] + boxes[:, 3]) * 0.5
+        tracks[:, 3] = self.conf[visible]
+        tracks[:, 4] = boxes[:, 2] - boxes[:, 0]
+        tracks[:, 5] = boxes[:, 3] - boxes[:, 1]
+        tracks[:, 6] = self.age[visible]
+        return tracks
+
+
+def roi_from_detections(detections: Optional[np.ndarray], margin: float,
+                        min_size: float = 0.25) -> Optional[Tuple[float, float, float, float]]:
+    """Normalized region around all detections, grown by `margin` times the region size.
+
+    Returns None when there is nothing to focus on. The region is at least
+    `min_size` of the crop in each direction so the model keeps some context.
+    """
+    if detections is None or len(detections) == 0:
+        return None
+    x1, y1 = detections[:, 0].min(), detections[:, 1].min()
+    x2, y2 = detections[:, 2].max(), detections[:, 3].max()
+    pad_x = max((x2 - x1) * margin, (min_size - (x2 - x1)) * 0.5, 0.0)
+    pad_y = max((y2 - y1) * margin, (min_size - (y2 - y1)) * 0.5, 0.0)
+    x1, x2 = max(0.0, x1 - pad_x), min(1.0, x2 + pad_x)
+    y1, y2 = max(0.0, y1 - pad_y), min(1.0, y2 + pad_y)
+    if x2 - x1 >= 0.95 and y2 - y1 >= 0.95:
+        return None  # barely smaller than the full crop, not worth it
+    return (float(x1), float(y1), float(x2), float(y2))
+
+
+def remap_detections(detections: np.ndarray, roi: Optional[Tuple[float, float, float, float]]) -> np.ndarray:
+    """Map detections normalized to an ROI back to crop-normalized coordinates"""
+    if roi is None or len(detections) == 0:
+        return detections
+    x1, y1, x2, y2 = roi
+    detections = detections.copy()
+    detections[:, [0, 2]] = x1 + detections[:, [0, 2]] * (x2 - x1)
+    detections[:, [1, 3]] = y1 + detections[:, [1, 3]] * (y2 - y1)
+    return detections
+
+
+CAPTURE_FORMATS = ('auto', 'mjpg', 'yuyv')
+# Common UVC modes, tried smallest first
+CAPTURE_MODES = ((320, 240), (424, 240), (640, 360), (640, 480), (800, 600), (848, 480), (960, 540),
+                 (1024, 768), (1280, 720), (1280, 960), (1600, 1200), (1920, 1080), (2560, 1440), (3840, 2160))
+# Practical isochronous bandwidth of a USB 2.0 camera (bytes/s); uncompressed YUYV above it drops fps
+USB2_BANDWIDTH = 24e6
+
+
+def remap_crop(crop: Tuple[int, int, int, int], from_size: Tuple[int, int],
+               to_size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """Scale crop pixel coordinates from one frame resolution to another"""
+    (fw, fh), (tw, th) = from_size, to_size
+    if (fw, fh) == (tw, th) or fw <= 0 or fh <= 0:
+        return tuple(int(v) for v in crop)
+    x1, y1, x2, y2 = crop
+    sx, sy = tw / fw, th / fh
+    return (max(0, min(tw, int(round(x1 * sx)))), max(0, min(th, int(round(y1 * sy)))),
+            max(0, min(tw, int(round(x2 * sx)))), max(0, min(th, int(round(y2 * sy)))))
+
+
+def choose_capture_modes(frame_size: Tuple[int, int], crop: Tuple[int, int, int, int],
+                         min_crop_pixels: float, modes=CAPTURE_MODES) -> List[Tuple[int, int]]:
+    """Capture modes that still give the crop enough detail, smallest first.
+
+    Only modes with the frame's aspect ratio are considered (others would make the
+    driver crop or letterbox the field of view). A mode qualifies when the longer
+    side of the crop, scaled to that mode, has at least min_crop_pixels pixels,
+    i.e. the resize to the inference size still has something to work with.
+    """
+    width, height = frame_size
+    x1, y1, x2, y2 = crop
+    crop_w, crop_h = max(1, x2 - x1), max(1, y2 - y1)
+    aspect = width / height
+    candidates = [(mw, mh) for mw, mh in modes
+                  if abs(mw / mh - aspect) < 0.02
+                  and max(crop_w * mw / width, crop_h * mh / height) >= min_crop_pixels]
+    return sorted(candidates, key=lambda m: m[0] * m[1])
+
+
+def pick_pixel_format(pixel_format: str, width: int, height: int, fps: float) -> str:
+    """'auto': uncompressed YUYV (no JPEG decode) if it fits USB 2.0 bandwidth at this fps, else MJPG"""
+    if pixel_format != 'auto':
+        return pixel_format
+    return 'yuyv' if width * height * 2 * fps <= USB2_BANDWIDTH else 'mjpg'
+
+
+DEPTH_SOURCES = ('none', 'detections', 'foreground', 'both')
+
+
+def occupancy_grid(detections: Optional[np.ndarray], grid_w: int, grid_h: int,
+                   foreground: Optional[np.ndarray] = None) -> np.ndarray:
+    """Render detections (and optionally a foreground mask) into a uint8 pseudo-depth grid.
+
+    Each person becomes a blob over its box that is brightest along the box's vertical
+    center line. Its value grows with box height, so people closer to the camera
+    appear "nearer" like in the RealSense depth stream. Foreground pixels without a
+    detection get a low constant value. The grid is mirrored horizontally to match
+    the flipped x sent in /depth.
+    """
+    grid = np.zeros((grid_h, grid_w), dtype=np.uint8)
+    if detections is not None and len(detections) > 0:
+        xs = (np.arange(grid_w, dtype=np.float32) + 0.5) / grid_w
+        ys = (np.arange(grid_h, dtype=np.float32) + 0.5) / grid_h
+        x1, y1, x2, y2 = detections[:, 0:1], detections[:, 1:2], detections[:, 2:3], detections[:, 3:4]
+        half_w = np.maximum((x2 - x1) * 0.5, 1e-3)
+        # Horizontal profile: 1 at the box center falling to 0 at its edges (N, W)
+        profile_x = np.sqrt(np.clip(1.0 - ((xs[None, :] - (x1 + x2) * 0.5) / half_w) ** 2, 0.0, 1.0))
+        # Vertical extent: inside the box or not (N, H)
+        inside_y = ((ys[None, :] >= y1) & (ys[None, :] <= y2)).astype(np.float32)
+        # Closer people (taller boxes) get higher values
+        value = 64.0 + 191.0 * np.clip(y2 - y1, 0.0, 1.0)
+        blobs = (inside_y * value)[:, :, None] * profile_x[:, None, :]
+        grid = blobs.max(axis=0).astype(np.uint8)
+    if foreground is not None:
+        # MOG2 marks shadows with 127; only count confident foreground
+        grid = np.maximum(grid, np.where(foreground > 200, 48, 0).astype(np.uint8))
+    return np.ascontiguousarray(grid[:, ::-1])
+
+
+def rle_encode(grid: np.ndarray) -> bytes:
+    """Run-length encode a uint8 array as (count, value) byte pairs, count 1..255"""
+    flat = grid.ravel()
+    if flat.size == 0:
+        return b''
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(flat)) + 1))
+    lengths = np.diff(np.concatenate((starts, [flat.size])))
+    values = flat[starts]
+    # Split runs longer than 255 into several pairs
+    pieces = (lengths + 254) // 255
+    counts = np.full(int(pieces.sum()), 255, dtype=np.uint8)
+    counts[np.cumsum(pieces) - 1] = (lengths - 255 * (pieces - 1)).astype(np.uint8)
+    out = np.empty((counts.size, 2), dtype=np.uint8)
+    out[:, 0] = counts
+    out[:, 1] = np.repeat(values, pieces)
+    return out.tobytes()
+
+
+def osc_string(value: str) -> bytes:
+    """OSC string: UTF-8, null terminated, padded to a multiple of 4 bytes"""
+    data = value.encode('utf-8') + b'\0'
+    return data + b'\0' * (-len(data) % 4)
+
+
+class OscDepthEncoder:
+    """Encoder for /depth [w, h, blob, x, y, z, tracking] that reuses its layout.
+
+    Address and type tags are encoded once; as long as the blob length stays the
+    same (always, for the raw grid) each frame only patches the numbers and blob
+    bytes into the same buffer. Output is identical to OscMessageBuilder's.
+    A run-length encoded blob is sent on rle_address instead (same arguments), so
+    receivers never have to guess the encoding from the blob length.
+    """
+
+    HEAD = struct.Struct('>iii')   # width, height, blob size
+    TAIL = struct.Struct('>fffi')  # x, y, z, tracking
+
+    def __init__(self, address: str, rle_address: Optional[str] = None):
+        self.prefixes = {False: osc_string(address) + osc_string(',iibfffi'),
+                         True: osc_string(rle_address or address + "_rle") + osc_string(',iibfffi')}
+        self.prefix = self.prefixes[False]
+        self.blob_size = -1
+        self.buffer = bytearray()
+
+    def encode(self, width: int, height: int, blob: bytes, x: float, y: float, z: float, tracking: int,
+               rle: bool = False) -> bytes:
+        size = len(blob)
+        if size != self.blob_size or self.prefix is not self.prefixes[rle]:
+            self.prefix = self.prefixes[rle]
+            self.blob_size = size
+            self.blob_offset = len(self.prefix) + self.HEAD.size
+            self.tail_offset = self.blob_offset + size + (-size % 4)
+            self.buffer = bytearray(self.tail_offset + self.TAIL.size)
+            self.buffer[:len(self.prefix)] = self.prefix
+        buf = self.buffer
+        self.HEAD.pack_into(buf, len(self.prefix), width, height, size)
+        buf[self.blob_offset:self.blob_offset + size] = blob
+        self.TAIL.pack_into(buf, self.tail_offset, x, y, z, tracking)
+        # Snapshot: the buffer is patched again for the next frame while this one is being sent
+        return bytes(buf)
+
+
+PEOPLE_OSC_RECORD = np.dtype([('id', '>i4'), ('x', '>f4'), ('y', '>f4'), ('conf', '>f4'),
+                              ('w', '>f4'), ('h', '>f4'), ('age', '>i4')])
+
+
+def encode_people_osc(address: str, tracks: np.ndarray) -> bytes:
+    """Encode /people [count, (id, x, y, conf, w, h, age) * count] in one vectorized pass.
+
+    tracks is PersonTracker output ([id, x, y, conf, w, h, age] rows); x is flipped
+    like in /depth. Output is identical to OscMessageBuilder's.
+    """
+    count = len(tracks)
+    records = np.empty(count, dtype=PEOPLE_OSC_RECORD)
+    if count:
+        records['id'] = tracks[:, 0]
+        records['x'] = 1.0 - tracks[:, 1]
+        records['y'] = tracks[:, 2]
+        records['conf'] = tracks[:, 3]
+        records['w'] = tracks[:, 4]
+        records['h'] = tracks[:, 5]
+        records['age'] = tracks[:, 6]
+    return (osc_string(address) + osc_string(',i' + 'ifffffi' * count)
+            + struct.pack('>i', count) + records.tobytes())
+
+
+# Compact binary wire format, sent instead of OSC to WebSocket clients that
+# connect with the BINARY_SUBPROTOCOL (decoder: library/src/OSC_Control.js).
+# All fields little endian:
+#   depth:  'RS' u8 version, u8 type=1, u8 channel, u8 flags (1 tracking, 2 rle),
+#           u16 w, u16 h, f32 x, f32 y, f32 z, u32 blob size, blob
+#   people: 'RS' u8 version, u8 type=2, u8 channel, u8 flags, u16 count,
+#           count * (u32 id, f32 x, f32 y, f32 conf, f32 w, f32 h, u32 age)
+BINARY_SUBPROTOCOL = 'rsbin'
+WIRE_VERSION = 2
+WIRE_DEPTH = 1
+WIRE_PEOPLE = 2
+WIRE_DEPTH_HEADER = struct.Struct('<2sBBBBHHfffI')
+WIRE_PEOPLE_HEADER = struct.Struct('<2sBBBBH')
+PEOPLE_WIRE_RECORD = np.dtype([('id', '<u4'), ('x', '<f4'), ('y', '<f4'), ('conf', '<f4'),
+                               ('w', '<f4'), ('h', '<f4'), ('age', '<u4')])
+
+
+def encode_depth_binary(channel: int, width: int, height: int, blob: bytes, x: float, y: float, z: float,
+                        tracking: int, rle: bool) -> bytes:
+    """Depth message in the compact binary format (x already flipped, like /depth)"""
+    flags = (1 if tracking else 0) | (2 if rle else 0)
+    return WIRE_DEPTH_HEADER.pack(b'RS', WIRE_VERSION, WIRE_DEPTH, channel, flags,
+                                  width, height, x, y, z, len(blob)) + blob
+
+
+def encode_people_binary(channel: int, tracks: np.ndarray) -> bytes:
+    """People message in the compact binary format (x flipped, like /people)"""
+    count = len(tracks)
+    records = np.empty(count, dtype=PEOPLE_WIRE_RECORD)
+    if count:
+        records['id'] = tracks[:, 0]
+        records['x'] = 1.0 - tracks[:, 1]
+        records['y'] = tracks[:, 2]
+        records['conf'] = tracks[:, 3]
+        records['w'] = tracks[:, 4]
+        records['h'] = tracks[:, 5]
+        records['age'] = tracks[:, 6]
+    return WIRE_PEOPLE_HEADER.pack(b'RS', WIRE_VERSION, WIRE_PEOPLE, channel, 0, count) + records.tobytes()
+
+
+class WebSocketClient:
+    """One connected browser: its wire format and a latest-message slot per address.
+
+    The broadcaster only drops messages into the slots; the client's own writer
+    task sends them. A message that is replaced before it was sent is stale and
+    counted as dropped, so a slow client never delays the others and never queues
+    more than one message per address. Send latency (slot to sent) is collected
+    per stats interval.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.binary = getattr(websocket, 'subprotocol', None) == BINARY_SUBPROTOCOL
+        remote = getattr(websocket, 'remote_address', None)
+        self.peer = f"{remote[0]}:{remote[1]}" if remote else "?"
+        self.connected_at = time.time()
+        self.pending = {}  # address -> (message, time queued)
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+        self.sending_since = None  # start of the send in progress, if any
+        self.on_sent = None  # optional callback with each message's send latency
+        self.slow_since = None
+        self.task = None
+
+    def offer(self, address: str, message: bytes):
+        """Queue a message, replacing an unsent one for the same address (event loop thread)"""
+        if address in self.pending:
+            self.dropped += 1
+        self.pending[address] = (message, time.time())
+        self.ready.set()
+
+    async def run_writer(self):
+        """Send queued messages until the connection closes"""
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.pending:
+                    address = next(iter(self.pending))
+                    message, queued_at = self.pending.pop(address)
+                    # send() waits while the socket's write buffer is full (backpressure)
+                    self.sending_since = time.time()
+                    await self.websocket.send(message)
+                    self.sending_since = None
+                    latency = time.time() - queued_at
+                    self.sent += 1
+                    self.latency_sum += latency
+                    self.latency_count += 1
+                    self.latency_max = max(self.latency_max, latency)
+                    if self.on_sent is not None:
+                        self.on_sent(latency)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def take_stats(self, now: float) -> dict:
+        """Snapshot this client's counters and reset the interval latency figures"""
+        queue_age = max((now - queued_at for _, queued_at in self.pending.values()), default=0.0)
+        send_age = now - self.sending_since if self.sending_since is not None else 0.0
+        transport = getattr(self.websocket, 'transport', None)
+        try:
+            write_buffer = transport.get_write_buffer_size() if transport is not None else 0
+        except Exception:
+            write_buffer = 0
+        stats = {
+            'peer': self.peer,
+            'format': 'binary' if self.binary else 'osc',
+            'connected_s': now - self.connected_at,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'latency_avg_ms': self.latency_sum / max(1, self.latency_count) * 1000,
+            'latency_max_ms': self.latency_max * 1000,
+            'pending': len(self.pending),
+            'queue_age_ms': queue_age * 1000,
+            'send_age_ms': send_age * 1000,
+            'write_buffer_bytes': write_buffer,
+        }
+        # A send that never completes shows up as a growing send age instead
+        stats['lag_ms'] = max(stats['latency_max_ms'], stats['queue_age_ms'], stats['send_age_ms'])
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+        return stats
+
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class MetricsRegistry:
+    """Minimal thread-safe Prometheus-style metrics: histograms, counters and gauges.
+
+    Series are keyed by metric name plus a tuple of (label, value) pairs;
+    render() produces the Prometheus text exposition format. Recording is a
+    dict lookup, a bisect and a few additions under one lock.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.histograms = {}  # name -> {labels: [bucket counts..., sum, count]}
+        self.counters = {}    # name -> {labels: value}
+        self.gauges = {}      # name -> {labels: value}
+        self.help = {}
+        self.collectors = []  # callables run before rendering (refresh gauges)
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def observe(self, name: str, value: float, **labels):
+        """Add one observation (seconds) to a histogram"""
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            data = series.get(key)
+            if data is None:
+                data = series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.gauges.setdefault(name, {})[key] = value
+
+    def clear_gauge(self, name: str, **labels):
+        """Remove the gauge's series that carry all of the given labels (all series if none)"""
+        wanted = set(labels.items())
+        with self.lock:
+            series = self.gauges.get(name, {})
+            for key in [key for key in series if wanted <= set(key)]:
+                del series[key]
+
+    @staticmethod
+    def _labels(key, extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in key]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        """Text exposition format of every series"""
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        lines = []
+        with self.lock:
+            for kind, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+                for name, series in sorted(metrics.items()):
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in sorted(series.items()):
+                        lines.append(f"{name}{self._labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, data in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float('inf'),), data):
+                        cumulative += count
+                        le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                        lines.append(f"{name}_bucket{self._labels(key, le)} {cumulative}")
+                    lines.append(f"{name}_sum{self._labels(key)} {data[-2]}")
+                    lines.append(f"{name}_count{self._labels(key)} {data[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(registry: MetricsRegistry, host: str, port: int):
+    """Answer HTTP GET /metrics with the registry (runs on an existing asyncio loop)"""
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            while (await asyncio.wait_for(reader.readline(), timeout=5.0)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in ('/metrics', '/'):
+                body = registry.render().encode('utf-8')
+                head = "HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            else:
+                body = b"not found\n"
+                head = "HTTP/1.1 404 Not Found\r\nContent-Type: text/plain\r\n"
+            writer.write(f"{head}Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Metrics on http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
+
+
+class FrameTracer:
+    """Per-frame stage spans exported in Chrome trace / Perfetto JSON format.
+
+    Each span is a complete ("X") event on the thread that ran the stage, with
+    the frame sequence number in its args. Spans are buffered in memory and
+    written every file_seconds to trace_dir/trace_<time>_<n>.json; only the
+    newest max_files files are kept, so tracing can stay on for hours. Open a
+    file in ui.perfetto.dev or chrome://tracing.
+
+    Callers check `enabled` before calling span(), so while tracing is off the
+    hooks cost one attribute lookup per stage.
+    """
+
+    def __init__(self, trace_dir: str = "traces", max_files: int = 10, file_seconds: float = 10.0):
+        self.trace_dir = trace_dir
+        self.max_files = max(1, max_files)
+        self.file_seconds = file_seconds
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.events = []  # (name, source, start, seconds, thread id, seq)
+        self.thread_names = {}
+        self.local = threading.local()
+        self.pid = os.getpid()
+        self.epoch = time.perf_counter()
+        self.file_started = 0.0
+        self.file_index = 0
+
+    def set_frame(self, seq: int):
+        """Frame that spans recorded on this thread without an explicit seq belong to"""
+        self.local.seq = seq
+
+    def span(self, name: str, seconds: float, seq: Optional[int] = None, source: str = ""):
+        """Record a stage that ended just now and took `seconds`"""
+        end = time.perf_counter()
+        if seq is None:
+            seq = getattr(self.local, 'seq', 0)
+        tid = threading.get_ident()
+        with self.lock:
+            if tid not in self.thread_names:
+                self.thread_names[tid] = threading.current_thread().name
+            self.events.append((name, source, end - seconds, seconds, tid, seq))
+
+    def start(self):
+        with self.lock:
+            self.events = []
+            self.file_started = time.perf_counter()
+            self.enabled = True
+        print(f"Tracing on: writing {self.file_seconds:.0f}s trace files to {self.trace_dir}/ (keeping {self.max_files})")
+
+    def stop(self):
+        self.enabled = False
+        self.flush(background=False)
+        print("Tracing off")
+
+    def toggle(self):
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+
+    def maybe_flush(self):
+        """Write the buffered spans once the current file covers file_seconds"""
+        if self.enabled and time.perf_counter() - self.file_started >= self.file_seconds:
+            self.flush()
+
+    def flush(self, background: bool = True):
+        with self.lock:
+            events, self.events = self.events, []
+            names = dict(self.thread_names)
+            self.file_started = time.perf_counter()
+        if not events:
+            return
+        self.file_index += 1
+        path = os.path.join(self.trace_dir, f"trace_{time.strftime('%Y%m%d_%H%M%S')}_{self.file_index:04d}.json")
+        if background:
+            # JSON encoding takes a few ms; keep it off the display/stage threads
+            writer = threading.Thread(target=self._write, args=(path, events, names), name="trace-writer")
+            writer.daemon = True
+            writer.start()
+        else:
+            self._write(path, events, names)
+
+    def _write(self, path: str, events: list, names: dict):
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in names.items()]
+        trace.extend({'name': name, 'cat': source or 'detector', 'ph': 'X',
+                      'ts': round((start - self.epoch) * 1e6, 1), 'dur': round(seconds * 1e6, 1),
+                      'pid': self.pid, 'tid': tid, 'args': {'seq': seq}}
+                     for name, source, start, seconds, tid, seq in events)
+        with self.write_lock:
+            try:
+                os.makedirs(self.trace_dir, exist_ok=True)
+                with open(path, 'w') as f:
+                    json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+                # Rolling ring on disk: drop the oldest files (also those of earlier runs)
+                files = sorted(f for f in os.listdir(self.trace_dir) if f.startswith('trace_') and f.endswith('.json'))
+                for old in files[:-self.max_files]:
+                    os.remove(os.path.join(self.trace_dir, old))
+            except Exception as e:
+                print(f"Could not write trace file {path}: {e}")
+
+
+ACCUMULATION_MODES = ('window', 'ema')
+
+
+class StartupTimer:
+    """Wall-clock breakdown of startup, from the script's first line to the first /depth.
+
+    Phases run on several threads (the model loads while the camera opens), so
+    each is kept as its start and end time since PROCESS_START. The breakdown is
+    exported as the detector_startup_seconds gauge (and printed, if verbose) when
+    the first /depth message goes out.
+    """
+
+    def __init__(self, verbose: bool = True):
+        self.verbose = verbose
+        self.phases = []
+        self.lock = threading.Lock()
+        self.finished = False
+
+    def add(self, name: str, start: float, end: Optional[float] = None):
+        """Record a phase from perf_counter() values"""
+        end = time.perf_counter() if end is None else end
+        with self.lock:
+            self.phases.append((name, start - PROCESS_START, end - PROCESS_START))
+
+    def finish(self, metrics: Optional['MetricsRegistry'] = None):
+        """First /depth sent: print the breakdown (once)"""
+        with self.lock:
+            if self.finished:
+                return
+            self.finished = True
+            phases = sorted(self.phases, key=lambda p: p[1])
+        first_send = time.perf_counter() - PROCESS_START
+        if self.verbose:
+            lines = [f"  {name:<16s}{start:6.2f} -> {end:6.2f} s  ({end - start:.2f} s)"
+                     for name, start, end in phases]
+            print("Startup (seconds since launch):\n" + "\n".join(lines) + f"\n  first /depth    {first_send:6.2f} s")
+        if metrics is not None:
+            for name, start, end in phases:
+                metrics.set('detector_startup_seconds', end - start, phase=name)
+            metrics.set('detector_startup_seconds', first_send, phase='first_depth')
+
+
+class FrameAccumulator:
+    """Temporal frame averaging for low-light denoising at O(1) cost per pixel.
+
+    - 'window': box average of the last `window` frames, kept as a preallocated
+      running sum (add newest, subtract oldest) plus a ring of the raw frames
+    - 'ema': exponential decay with alpha = 2 / (window + 1), updated in place
+
+    All buffers are allocated once and reallocated only when the frame shape changes.
+    """
+
+    def __init__(self, window: int = 3, mode: str = 'window'):
+        if mode not in ACCUMULATION_MODES:
+            raise ValueError(f"Unknown accumulation mode: {mode} (choose from {', '.join(ACCUMULATION_MODES)})")
+        self.window = max(1, int(window))
+        self.mode = mode
+        self.shape = None
+
+    def reset(self):
+        """Forget all history (buffers are reallocated on the next frame)"""
+        self.shape = None
+
+    def _allocate(self, frame):
+        self.shape = frame.shape
+        self.count = 0
+        self.index = 0
+        self.output = np.empty(frame.shape, dtype=np.uint8)
+        if self.mode == 'ema':
+            self.average = frame.astype(np.float32)
+        else:
+            # uint16 holds up to 257 frames of 255 without overflow
+            sum_dtype = np.uint16 if self.window <= 257 else np.uint32
+            self.sum = np.zeros(frame.shape, dtype=sum_dtype)
+            self.quotient = np.empty(frame.shape, dtype=sum_dtype)
+            self.ring = np.zeros((self.window,) + frame.shape, dtype=np.uint8)
+
+    def add(self, frame) -> np.ndarray:
+        """Add a uint8 frame and return the current average (a reused uint8 buffer)"""
+        if frame.shape != self.shape:
+            self._allocate(frame)
+        if self.mode == 'ema':
+            cv2.accumulateWeighted(frame, self.average, 2.0 / (self.window + 1))
+            np.copyto(self.output, self.average, casting='unsafe')
+            return self.output
+
+        slot = self.ring[self.index]
+        if self.count == self.window:
+            np.subtract(self.sum, slot, out=self.sum)
+        else:
+            self.count += 1
+        np.add(self.sum, frame, out=self.sum)
+        slot[...] = frame
+        self.index = (self.index + 1) % self.window
+        np.floor_divide(self.sum, self.count, out=self.quotient)
+        np.copyto(self.output, self.quotient, casting='unsafe')
+        return self.output
+
+
+class FrameRing:
+    """Preallocated ring of frame buffers in shared memory.
+
+    The writer fills slot seq % slots in place and commits its sequence number,
+    timestamp and the frame's height/width (a slot may hold a smaller frame than
+    the ring's shape); readers in this or another process (inference workers, a
+    recorder, a preview) attach by name and read a slot by index without copying.
+    A slot is overwritten after `slots` newer frames, so readers must finish before
+    then (or check is_current()). Layout: [h, w, c, slots] int64, per-slot seq
+    int64, timestamp float64, height int64 and width int64, then the frames.
+    """
+
+    META = 4
+
+    def __init__(self, shape: Tuple[int, ...] = None, slots: int = 8, name: Optional[str] = None):
+        create = name is None
+        if create:
+            shape = tuple(int(v) for v in shape) + ((1,) if len(shape) == 2 else ())
+            slots = max(2, int(slots))
+            size = (self.META + 4 * slots) * 8 + slots * int(np.prod(shape))
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            meta = np.ndarray((self.META,), dtype=np.int64, buffer=self.shm.buf)
+            meta[:] = shape + (slots,)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            meta = np.ndarray((self.META,), dtype=np.int64, buffer=self.shm.buf)
+            shape, slots = tuple(int(v) for v in meta[:3]), int(meta[3])
+        self.shape = shape if shape[2] > 1 else shape[:2]
+        self.slots = slots
+        self.owner = create
+        offset = self.META * 8
+        self.seqs = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        self.timestamps = np.ndarray((slots,), dtype=np.float64, buffer=self.shm.buf, offset=offset + slots * 8)
+        self.sizes = np.ndarray((slots, 2), dtype=np.int64, buffer=self.shm.buf, offset=offset + slots * 16)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf,
+                                 offset=offset + slots * 32)
+        if create:
+            self.seqs[:] = 0
+            self.sizes[:] = self.shape[:2]
+
+    @classmethod
+    def attach(cls, name: str) -> 'FrameRing':
+        """Open an existing ring created by another process"""
+        return cls(name=name)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def index(self, seq: int) -> int:
+        """Slot that holds (or will hold) frame number seq"""
+        return seq % self.slots
+
+    def commit(self, seq: int, timestamp: float, height: Optional[int] = None, width: Optional[int] = None):
+        """Mark the frame written into slot index(seq) as frame seq (default size: the full slot)"""
+        index = self.index(seq)
+        self.timestamps[index] = timestamp
+        self.sizes[index] = (self.shape[0] if height is None else height, self.shape[1] if width is None else width)
+        self.seqs[index] = seq
+
+    def frame(self, seq: int) -> np.ndarray:
+        """View of frame seq, cropped to the size it was committed with"""
+        index = self.index(seq)
+        h, w = self.sizes[index]
+        return self.frames[index, :h, :w]
+
+    def is_current(self, seq: int) -> bool:
+        """True while frame seq has not been overwritten"""
+        return int(self.seqs[self.index(seq)]) == seq
+
+    def close(self):
+        """Detach; the creating process also removes the segment"""
+        self.seqs = self.timestamps = self.sizes = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Frames still referenced elsewhere; the mapping goes away with the process
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class BufferRing:
+    """Rotating set of preallocated destination arrays for OpenCV dst= output.
+
+    get() hands out the next of `count` buffers and reallocates only when the
+    requested shape changes. A buffer comes round again after count - 1 further
+    calls, so count must exceed the number of results a consumer may still hold.
+    """
+
+    def __init__(self, count: int = 1, dtype=np.uint8):
+        self.count = max(1, int(count))
+        self.dtype = dtype
+        self.buffers = [None] * self.count
+        self.next = 0
+
+    def get(self, shape: Tuple[int, ...]) -> np.ndarray:
+        buf = self.buffers[self.next]
+        if buf is None or buf.shape != tuple(shape):
+            buf = np.empty(shape, dtype=self.dtype)
+            self.buffers[self.next] = buf
+        self.next = (self.next + 1) % self.count
+        return buf
+
+
+class FrameGrabber:
+    """Continuously drain a cv2.VideoCapture into a single-slot latest-frame buffer.
+
+    The capture thread always overwrites the slot, so a slow consumer only ever sees
+    the freshest frame and stale frames are dropped instead of queueing up in the
+    camera driver. Each frame carries a sequence number and its capture timestamp.
+
+    Frames are decoded into one reused buffer and flipped straight into a
+    FrameRing, so capture allocates nothing per frame; the frames handed out
+    are views into the ring (frame seq lives in slot ring.index(seq)).
+    """
+
+    def __init__(self, cap, loop_video: bool = False, flip: bool = True, ring_slots: int = 8,
+                 on_capture=None, lossless: bool = False, max_frames: int = 0):
+        self.cap = cap
+        # Offline replay: lossless waits for the consumer to pick up each frame before
+        # reading the next one (as fast as the pipeline goes, nothing dropped), and
+        # capture ends after max_frames frames (0 = never)
+        self.lossless = lossless
+        self.max_frames = max_frames
+        # Called with the seconds spent reading (waiting for + decoding) and flipping each frame, and its seq
+        self.on_capture = on_capture
+        self.loop_video = loop_video
+        self.flip = flip
+        self.ring_slots = ring_slots
+        self.ring = None
+        self.raw = None
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.timestamp = 0.0
+        self.consumed_seq = 0
+        self.dropped_frames = 0
+        self.failed = False
+        self.running = False
+        self.thread = None
+
+        # Video files are decoded much faster than real time; pace them at their own fps
+        self.frame_interval = 0.0
+        if loop_video:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 0
+            if fps > 0:
+                self.frame_interval = 1.0 / fps
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="FrameGrabber")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def _run(self):
+        next_due = time.time()
+        while self.running:
+            if self.max_frames and self.seq >= self.max_frames:
+                return
+            if self.lossless:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.consumed_seq >= self.seq or not self.running)
+            read_t0 = time.perf_counter()
+            ret, frame = self.cap.read(self.raw)
+            if not ret:
+                # If we're using a video file, loop back to start
+                if self.loop_video:
+                    print("End of video reached, looping back to start")
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    ret, frame = self.cap.read(self.raw)
+                    if not ret:
+                        print("Failed to read from video after seeking to start")
+                else:
+                    print("Failed to read from camera")
+                if not ret:
+                    with self.cond:
+                        self.failed = True
+                        self.cond.notify_all()
+                    return
+
+            captured_at = time.time()
+            self.raw = frame
+            if self.ring is None or self.ring.shape != frame.shape:
+                if self.ring is not None:
+                    self.ring.close()
+                self.ring = FrameRing(frame.shape, self.ring_slots)
+                print(f"Frame ring: {self.ring.name} ({frame.shape[1]}x{frame.shape[0]}, {self.ring.slots} slots)")
+            seq = self.seq + 1
+            slot = self.ring.frames[self.ring.index(seq)]
+            if self.flip:
+                cv2.flip(frame, 1, dst=slot)
+            else:
+                np.copyto(slot, frame)
+            self.ring.commit(seq, captured_at)
+            if self.on_capture is not None:
+                self.on_capture(time.perf_counter() - read_t0, seq)
+
+            with self.cond:
+                # The previous frame was never picked up by the consumer -> dropped
+                if self.frame is not None and self.consumed_seq < self.seq:
+                    self.dropped_frames += 1
+                self.frame = slot
+                self.seq = seq
+                self.timestamp = captured_at
+                self.cond.notify_all()
+
+            if self.frame_interval > 0:
+                next_due += self.frame_interval
+                delay = next_due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_due = time.time()
+
+    def read(self, timeout: float = 1.0):
+        """Wait for a frame newer than the last one read.
+
+        Returns (ok, seq, timestamp, frame). ok is False once the source has failed
+        or when no new frame arrived within the timeout.
+        """
+        with self.cond:
+            deadline = time.time() + timeout
+            while self.seq <= self.consumed_seq and not self.failed:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.running:
+                    return False, self.consumed_seq, self.timestamp, None
+                self.cond.wait(remaining)
+            if self.seq <= self.consumed_seq:
+                return False, self.consumed_seq, self.timestamp, None
+            self.consumed_seq = self.seq
+            if self.lossless:
+                self.cond.notify_all()
+            return True, self.seq, self.timestamp, self.frame
+
+    def take_dropped(self) -> int:
+        """Return and reset the number of frames dropped since the last call."""
+        with self.cond:
+            dropped = self.dropped_frames
+            self.dropped_frames = 0
+            return dropped
+
+
+class StageQueue:
+    """Bounded hand-off queue between pipeline stages with a configurable drop policy.
+
+    - 'drop_oldest': a full queue discards its oldest item (latest frame wins)
+    - 'drop_newest': a full queue rejects the incoming item
+    - 'block': the producer waits until there is room
+    """
+
+    DROP_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, maxsize: int = 1, drop_policy: str = 'drop_oldest',
+                 ready_event: Optional[threading.Event] = None):
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy} (choose from {', '.join(self.DROP_POLICIES)})")
+        self.maxsize = max(1, int(maxsize))
+        self.drop_policy = drop_policy
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.dropped = 0
+        # Optional event set on every put, so one consumer can wait on several queues
+        self.ready_event = ready_event
+
+    def put(self, item, timeout: float = 0.5) -> bool:
+        """Hand an item to the next stage. Returns False if an item was dropped."""
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                if self.drop_policy == 'drop_oldest':
+                    self.items.popleft()
+                    self.dropped += 1
+                elif self.drop_policy == 'drop_newest':
+                    self.dropped += 1
+                    return False
+                else:
+                    if not self.cond.wait_for(lambda: len(self.items) < self.maxsize, timeout):
+                        self.dropped += 1
+                        return False
+            self.items.append(item)
+            self.cond.notify_all()
+        if self.ready_event is not None:
+            self.ready_event.set()
+        return True
+
+    def get(self, timeout: float = 0.5):
+        """Return the next item, or None if nothing arrived within the timeout."""
+        with self.cond:
+            if timeout <= 0:
+                if not self.items:
+                    return None
+            elif not self.cond.wait_for(lambda: len(self.items) > 0, timeout):
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def take_dropped(self) -> int:
+        """Return and reset the number of items dropped since the last call."""
+        with self.cond:
+            dropped = self.dropped
+            self.dropped = 0
+            return dropped
+
+
+class DirectDetector:
+    """Lean person detector that feeds the network directly, without the Ultralytics predictor.
+
+    The predictor letterboxes, converts BGR->RGB, allocates a new input tensor and
+    builds a Results object on every call. Here the input is one preallocated
+    (1, 3, S, S) float32 array (S = inference size rounded up to the model
+    stride): each prepared frame is scaled to fit S like the predictor's letterbox
+    (up or down) and written into its top-left corner in a single pass that swaps the channels, transposes to CHW and scales to 0..1; the
+    padding is only refilled when the frame size changes. Person scores are read
+    straight from the raw output and NMS'd with cv2.dnn.NMSBoxes.
+
+    detect() returns the (N, 6) array of extract_person_detections, normalized
+    to the frame it was given, so no inference scale has to be known afterwards.
+
+    forward is the runtime call: it takes the input array and returns the raw
+    predictions, (4 + classes, anchors) with center-xywh boxes, or (N, 6)
+    [x1, y1, x2, y2, conf, cls] for end-to-end models.
+    """
+
+    PAD_VALUE = 114 / 255.0
+
+    def __init__(self, forward, input_size: int, person_class_idx: Optional[int],
+                 iou_threshold: float = 0.7, max_detections: int = 300, stride: int = 32):
+        self.forward = forward
+        self.input_size = int(np.ceil(input_size / stride) * stride)
+        self.person_class_idx = person_class_idx if person_class_idx is not None else 0
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+        self.input = np.full((1, 3, self.input_size, self.input_size), self.PAD_VALUE, dtype=np.float32)
+        self.frame_shape = None
+        self.resized = BufferRing(1)
+
+    @classmethod
+    def from_model(cls, model, backend: str, model_source: str, input_size: int,
+                   person_class_idx: Optional[int], threads: int = 0) -> 'DirectDetector':
+        """Build the forward call for a loaded Ultralytics model (torch) or its ONNX export"""
+        if backend == 'torch':
+            if not TORCH_AVAILABLE:
+                raise RuntimeError("PyTorch is not available")
+            torch = import_torch()
+            if threads > 0:
+                torch.set_num_threads(threads)
+            net = model.model
+            if hasattr(net, 'fuse'):
+                net = net.fuse(verbose=False)
+            net.eval()
+            param = next(net.parameters())
+            detector = cls(None, input_size, person_class_idx, stride=int(max(32, getattr(net, 'stride', [32])[-1])))
+            # The network reads the preallocated array in place (CPU) or through one
+            # reused device tensor (CUDA, in the model's dtype)
+            host = torch.from_numpy(detector.input)
+            device_input = None if param.device.type == 'cpu' else torch.empty(host.shape, dtype=param.dtype,
+                                                                                device=param.device)
+
+            def forward(_):
+                with torch.inference_mode():
+                    if device_input is None:
+                        preds = net(host)
+                    else:
+                        device_input.copy_(host, non_blocking=True)
+                        preds = net(device_input)
+                    if isinstance(preds, (list, tuple)):
+                        preds = preds[0]
+                    return preds[0].float().cpu().numpy()
+
+            detector.forward = forward
+            return detector
+        if backend in ('onnx', 'onnx-int8'):
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            if threads > 0:
+                options.intra_op_num_threads = threads
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(model_source, options, providers=['CPUExecutionProvider'])
+            input_name = session.get_inputs()[0].name
+            # Exports are static: the input size is the export's
+            detector = cls(None, session.get_inputs()[0].shape[-1], person_class_idx)
+
+            def forward(tensor):
+                return session.run(None, {input_name: tensor})[0][0]
+
+            detector.forward = forward
+            return detector
+        raise ValueError(f"No direct inference path for the {backend} backend")
+
+    def detect(self, frame: np.ndarray, confidence_threshold: float) -> np.ndarray:
+        """Run the network on a prepared (already cropped and resized) BGR frame"""
+        h, w = frame.shape[:2]
+        # Fit the longer side to the input like Ultralytics' letterbox, scaling small
+        # crops up as well, so the network sees people at the size it expects
+        scale = min(self.input_size / h, self.input_size / w)
+        if scale != 1.0:
+            w, h = min(self.input_size, max(1, round(w * scale))), min(self.input_size, max(1, round(h * scale)))
+            frame = cv2.resize(frame, (w, h), dst=self.resized.get((h, w) + frame.shape[2:]),
+                               interpolation=cv2.INTER_LINEAR)
+        if frame.shape != self.frame_shape:
+            self.input.fill(self.PAD_VALUE)
+            self.frame_shape = frame.shape
+        np.multiply(frame[:, :, ::-1].transpose(2, 0, 1), 1 / 255.0, out=self.input[0, :, :h, :w],
+                    casting='unsafe')
+        preds = self.forward(self.input)
+        return self.decode(preds, w, h, confidence_threshold)
+
+    def decode(self, preds: np.ndarray, width: int, height: int, confidence_threshold: float) -> np.ndarray:
+        """Person boxes above the threshold after NMS, normalized to a width x height frame"""
+        empty = np.zeros((0, 6), dtype=np.float32)
+        if preds.ndim == 2 and preds.shape[-1] == 6 and preds.shape[0] > preds.shape[1]:
+            # End-to-end model: boxes are already NMS'd
+            keep = (preds[:, 5].astype(np.int64) == self.person_class_idx) & (preds[:, 4] > confidence_threshold)
+            xyxy = preds[keep, :4].astype(np.float32)
+            conf = preds[keep, 4].astype(np.float32)
+        else:
+            scores = preds[4 + self.person_class_idx]
+            keep = np.flatnonzero(scores > confidence_threshold)
+            if keep.size == 0:
+                return empty
+            conf = scores[keep].astype(np.float32)
+            xywh = preds[:4, keep].T.astype(np.float32)
+            # Only the best-scoring classes count in Ultralytics' NMS: a box whose
+            # top class isn't person is dropped like in the predictor
+            if preds.shape[0] > 5:
+                best = preds[4:, keep].argmax(axis=0)
+                is_person = best == self.person_class_idx
+                conf, xywh = conf[is_person], xywh[is_person]
+            boxes = np.empty_like(xywh)
+            boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] * 0.5
+            boxes[:, 2:] = xywh[:, 2:]
+            picked = cv2.dnn.NMSBoxes(boxes.tolist(), conf.tolist(), confidence_threshold, self.iou_threshold,
+                                      top_k=self.max_detections)
+            picked = np.asarray(picked, dtype=np.int64).reshape(-1)
+            if picked.size == 0:
+                return empty
+            boxes, conf = boxes[picked], conf[picked]
+            xyxy = np.concatenate([boxes[:, :2], boxes[:, :2] + boxes[:, 2:]], axis=1)
+        if len(conf) == 0:
+            return empty
+
+        # The (scaled) frame sits in the top-left corner of the input
+        xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], 0, width)
+        xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], 0, height)
+        box_w = np.maximum(1.0, xyxy[:, 2] - xyxy[:, 0])
+        box_h = np.maximum(1.0, xyxy[:, 3] - xyxy[:, 1])
+        detections = np.empty((len(conf), 6), dtype=np.float32)
+        detections[:, :4] = xyxy / np.array([width, height, width, height], dtype=np.float32)
+        detections[:, 4] = conf
+        detections[:, 5] = conf * box_w * box_h
+        return detections
+
+
+def inference_worker(worker_id: int, model_source: str, inference_size: int, ring_name: str,
+                     task_queue, result_queue, person_class_idx: Optional[int], torch_threads: int,
+                     direct: bool = False):
+    """Inference worker process: runs the model on frames in the pool's shared FrameRing.
+
+    Tasks are (ticket, seq) tuples; the worker attaches to the ring by name and
+    reads frame seq from its slot, so no image data is pickled. Results are (worker_id, ticket, detections, seconds) with
+    detections at confidence 0, from the predictor or, with direct=True, a
+    DirectDetector; the main process applies the current threshold. Ticket -1
+    announces the worker is ready.
+    """
+    ring = FrameRing.attach(ring_name)
+    try:
+        if TORCH_AVAILABLE and torch_threads > 0:
+            try:
+                import_torch().set_num_threads(torch_threads)
+            except Exception:
+                pass
+        model = import_yolo()(model_source, task='detect')
+
+        direct_model = None
+        if direct:
+            backend = 'onnx' if str(model_source).endswith('.onnx') else 'torch'
+            direct_model = DirectDetector.from_model(model, backend, model_source, inference_size,
+                                                     person_class_idx, torch_threads)
+
+        def infer(image):
+            if direct_model is not None:
+                return direct_model.detect(image, 0.0)
+            try:
+                results = model(image, imgsz=inference_size, conf=0.0, verbose=False)
+            except TypeError:
+                results = model(image, conf=0.0, verbose=False)
+            return extract_person_detections(results, person_class_idx, 0.0)
+
+        infer(np.zeros((inference_size, inference_size, 3), dtype=np.uint8))
+        result_queue.put((worker_id, -1, None, 0.0))
+
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            ticket, seq = task
+            t0 = time.time()
+            try:
+                detections = infer(ring.frame(seq))
+                if not ring.is_current(seq):
+                    raise RuntimeError("frame was overwritten during inference")
+            except Exception as e:
+                print(f"Inference worker {worker_id} failed on frame: {e}")
+                detections = None
+            result_queue.put((worker_id, ticket, detections, time.time() - t0))
+    except Exception as e:
+        print(f"Inference worker {worker_id} stopped: {e}")
+    finally:
+        ring.close()
+
+
+class InferencePool:
+    """Inference worker processes fed from a shared-memory FrameRing of prepared frames.
+
+    submit() writes a prepared frame into the next ring slot and sends an idle
+    worker only its ticket and ring seq; the worker reads the frame from the ring
+    by slot index. At most one frame per worker is in flight, so a ring of twice
+    as many slots is never overwritten before it is read. next_result() returns results in completion order
+    (callers reorder by ticket). Each worker gets an equal share of the CPU cores
+    for its PyTorch threads.
+    """
+
+    def __init__(self, workers: int, model_source: str, inference_size: int, person_class_idx: Optional[int],
+                 direct: bool = False):
+        self.inference_size = inference_size
+        ctx = multiprocessing.get_context('spawn')
+        self.result_queue = ctx.Queue()
+        self.free_workers = queue.Queue()  # ids of idle workers (filled as they report ready)
+        self.stats_lock = threading.Lock()
+        self.stats = [{'frames': 0, 'busy': 0.0} for _ in range(workers)]
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        self.ring = FrameRing((inference_size, inference_size, 3), 2 * workers)
+        self.seq = 0
+        self.task_queues, self.processes = [], []
+        for worker_id in range(workers):
+            task_queue = ctx.Queue()
+            self.task_queues.append(task_queue)
+            proc = ctx.Process(target=inference_worker, name=f"inference-worker-{worker_id}",
+                               args=(worker_id, model_source, inference_size, self.ring.name, task_queue,
+                                     self.result_queue, person_class_idx, torch_threads, direct))
+            proc.daemon = True
+            proc.start()
+            self.processes.append(proc)
+        print(f"Started {workers} inference worker processes ({torch_threads} threads each)")
+
+    def submit(self, ticket: int, frame: np.ndarray, stop_event: threading.Event) -> bool:
+        """Hand a frame to the next idle worker, waiting for one. False if stopped first."""
+        while not stop_event.is_set():
+            try:
+                worker_id = self.free_workers.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            h, w = frame.shape[:2]
+            if h > self.inference_size or w > self.inference_size:
+                frame = cv2.resize(frame, (min(w, self.inference_size), min(h, self.inference_size)))
+                h, w = frame.shape[:2]
+            self.seq += 1
+            np.copyto(self.ring.frames[self.ring.index(self.seq), :h, :w], frame)
+            self.ring.commit(self.seq, time.time(), h, w)
+            self.task_queues[worker_id].put((ticket, self.seq))
+            return True
+        return False
+
+    def next_result(self, timeout: float = 0.5):
+        """Return the next (worker_id, ticket, detections, seconds), or None on timeout"""
+        while True:
+            try:
+                worker_id, ticket, detections, elapsed = self.result_queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            # The worker is done with its slot and can take the next frame
+            self.free_workers.put(worker_id)
+            if ticket < 0:
+                print(f"Inference worker {worker_id} ready")
+                continue
+            with self.stats_lock:
+                self.stats[worker_id]['frames'] += 1
+                self.stats[worker_id]['busy'] += elapsed
+            return worker_id, ticket, detections, elapsed
+
+    def take_stats(self) -> List[dict]:
+        """Return and reset the per-worker frame counts and busy time"""
+        with self.stats_lock:
+            stats = self.stats
+            self.stats = [{'frames': 0, 'busy': 0.0} for _ in stats]
+        return stats
+
+    def close(self):
+        """Stop the workers and release the shared memory"""
+        for task_queue in self.task_queues:
+            try:
+                task_queue.put(None)
+            except Exception:
+                pass
+        for proc in self.processes:
+            proc.join(timeout=2.0)
+            if proc.is_alive():
+                proc.terminate()
+        self.result_queue.cancel_join_thread()
+        self.ring.close()
+        self.processes = []
+
+
 class YOLODetectorOSC:
     def __init__(self, 
                  osc_host: str = "0.0.0.0",
@@ -47,7 +1973,47 @@ class YOLODetectorOSC:
                  model_name: str = "yolov8n.pt",
                  weights_path: Optional[str] = None,
                  confidence_threshold: float = 0.4,
-                 use_websockets: bool = True):
+                 use_websockets: bool = True,
+                 queue_size: int = 1,
+                 drop_policy: str = 'drop_oldest',
+                 headless: bool = False,
+                 backend: str = 'torch',
+                 model_cache_dir: str = 'model_cache',
+                 warmup_runs: int = 3,
+                 depth_source: str = 'none',
+                 depth_grid: Tuple[int, int] = (160, 140),
+                 depth_rle: bool = True,
+                 multi_person: bool = False,
+                 roi_mode: bool = False,
+                 motion_gate: bool = False,
+                 motion_threshold: float = 0.005,
+                 idle_scan_interval: float = 2.0,
+                 accumulation_window: int = 3,
+                 accumulation_mode: str = 'window',
+                 source: Optional[str] = None,
+                 settings_file: str = "detector_settings.json",
+                 address_suffix: str = "",
+                 shared_model_from: Optional['YOLODetectorOSC'] = None,
+                 transport_owner: Optional['YOLODetectorOSC'] = None,
+                 name: str = "",
+                 inference_workers: int = 0,
+                 frame_ring_slots: int = 8,
+                 ws_max_latency: float = 0.5,
+                 ws_evict_after: float = 5.0,
+                 metrics_port: int = 0,
+                 metrics: Optional[MetricsRegistry] = None,
+                 inference_size: int = 256,
+                 tracer: Optional[FrameTracer] = None,
+                 capture_mode: str = 'auto',
+                 capture_format: str = 'auto',
+                 capture_fps: float = 30.0,
+                 capture_detail: float = 1.5,
+                 direct_inference: bool = False,
+                 inference_threads: int = 0,
+                 point_filter: Optional[str] = None,
+                 max_prediction: float = 0.1,
+                 output_rate: float = 0.0,
+                 startup: Optional[StartupTimer] = None):
         
         if not YOLO_AVAILABLE:
             raise ImportError("Ultralytics YOLO is required. Install with: pip install ultralytics")
@@ -56,36 +2022,127 @@ class YOLODetectorOSC:
         self.osc_host = osc_host
         self.osc_port = osc_port
         self.use_websockets = use_websockets
+        # Several detectors can share one server (multi-source mode); each then
+        # publishes on its own address, e.g. /depth/1
+        self.depth_address = "/depth" + address_suffix
+        # Run-length encoded grids go to their own address (see OscDepthEncoder)
+        self.depth_rle_address = "/depth_rle" + address_suffix
+        self.people_address = "/people" + address_suffix
+        self.transport_owner = transport_owner
+        self.name = name
+        self.depth_encoder = OscDepthEncoder(self.depth_address, self.depth_rle_address)
+        # Channel byte of the binary format: the source index in multi-source mode
+        suffix = address_suffix.strip('/')
+        self.wire_channel = int(suffix) if suffix.isdigit() else 0
         self.ws_clients = set()
+        self.ws_binary_clients = 0
+        # Clients whose send lag stays above ws_max_latency for ws_evict_after
+        # seconds are disconnected; per-client stats are refreshed every second.
+        self.ws_max_latency = ws_max_latency
+        self.ws_evict_after = ws_evict_after
+        self.ws_client_stats = []
         self.frame_count = 0
         self.process_every_n_frames = 1  # Process every frame by default
-        self.inference_size = 256  # Default inference size (smaller for speed)
+        self.inference_size = inference_size  # Default 256 (smaller for speed); exports are built at this size
 
         # Timing accumulators for perf debugging (seconds)
-        self.timing = {'decode': 0.0, 'preprocess': 0.0, 'inference': 0.0, 'draw': 0.0}
+        # 'dropped_frames' counts frames the capture thread overwrote before they were
+        # processed, 'capture_to_send' sums the latency from capture to OSC publish.
+        self.timing = self.new_timing()
         self.timing_count = 0
+        self.timing_sends = 0
+        self.timing_draws = 0
         self.timing_last_print = time.time()
+        self.timing_lock = threading.Lock()
+
+        # Prometheus-style metrics (shared between sources in multi-source mode),
+        # served on metrics_port (0 = off) from the WebSocket server's event loop
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.metrics_port = metrics_port
+        self.metrics_source = name or "0"
+        self.metrics.describe('detector_stage_seconds', 'Per-stage latency (capture, crop, bg_subtraction, '
+                              'enhancement, resize, inference, postprocess, publish, output, draw)')
+        self.metrics.describe('detector_ws_send_seconds', 'Time from broadcast to WebSocket send completion')
+        self.metrics.describe('detector_capture_to_send_seconds', 'Latency from frame capture to OSC publish')
+        self.metrics.describe('detector_frames_total', 'Frames published')
+        self.metrics.describe('detector_dropped_frames_total', 'Frames dropped by the capture thread or full stage queues')
+        self.metrics.describe('detector_skipped_inference_total', 'Frames not inferred because the scene was idle')
+        self.metrics.describe('detector_fps', 'Published frames per second')
+        self.metrics.describe('detector_ws_clients', 'Connected WebSocket clients')
+        self.metrics.describe('detector_ws_client_lag_seconds', 'Worst send lag per WebSocket client in the last second')
+        self.metrics.collectors.append(self.collect_metrics)
+        # Optional per-frame trace of every stage (off until started with T, SIGUSR1 or --trace)
+        self.tracer = tracer if tracer is not None else FrameTracer()
+        # Startup breakdown (shared by all sources in multi-source mode; main() prints it)
+        self.startup = startup if startup is not None else StartupTimer(verbose=False)
+        self.metrics.describe('detector_startup_seconds', 'Startup phase durations and time to the first /depth')
+        init_t0 = time.perf_counter()
+
+        # Pipeline: capture -> preprocess -> inference -> publish -> display.
+        # Each hand-off is a bounded queue so a slow stage drops frames instead of
+        # building up lag; the display queue always keeps only the latest packet.
+        self.stage_queues = {
+            'inference': StageQueue(queue_size, drop_policy),
+            'publish': StageQueue(queue_size, drop_policy),
+            'display': StageQueue(1, 'drop_oldest'),
+        }
+        self.stage_threads = []
+        self.stop_event = threading.Event()
+
+        # Optional inference worker processes (started with the pipeline). Frames are
+        # numbered in dispatch order and results are published in that order.
+        self.inference_workers = inference_workers
+        self.inference_pool = None
+        self.pool_pending = {}
+        self.pool_lock = threading.Lock()
+
+        # Headless mode: no window, no drawing; controls arrive as text commands
+        # (one key or word per line on stdin) and annotated snapshots are only
+        # rendered on request.
+        self.headless = headless
+        self.control_commands = deque()
+        self.snapshot_requested = False
+        self.snapshot_dir = "snapshots"
 
-        # Initialize camera or video file if present
-        # Prefer a local test file 'video.MOV' (case-insensitive) if available.
-        video_file = None
-        candidates = ['video.MOV', 'video.mov']
-        # Check working directory first
-        for v in candidates:
-            if os.path.exists(v):
-                video_file = v
-                break
-        # Then check the script directory
-        if video_file is None:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            for v in candidates:
-                p = os.path.join(script_dir, v)
-                if os.path.exists(p):
-                    video_file = p
-                    break
+        # YOLO setup (allow loading custom weights)
+        self.weights_path = weights_path
+        self.confidence_threshold = confidence_threshold
+        # Direct inference: feed the network from a preallocated input tensor instead
+        # of going through the Ultralytics predictor (see DirectDetector)
+        self.direct_inference = direct_inference
+        self.inference_threads = inference_threads
+        if shared_model_from is not None:
+            # Multi-source mode: reuse the already loaded (and warmed up) model
+            self.model = shared_model_from.model
+            self.model_source = shared_model_from.model_source
+            self.backend = shared_model_from.backend
+            self.device = shared_model_from.device
+            self.class_names = shared_model_from.class_names
+            self.person_class_idx = shared_model_from.person_class_idx
+            self.direct_model = shared_model_from.direct_model
+            self.model_thread = None
+        else:
+            # Import, load and warm up the model on its own thread while the camera
+            # opens and the WebSocket server binds; joined at the end of __init__
+            self.model_error = None
+            self.model_thread = threading.Thread(target=self._load_model_thread, name="model-load",
+                                                 args=(model_name, backend, model_cache_dir, warmup_runs))
+            self.model_thread.daemon = True
+            self.model_thread.start()
+
+        # Initialize camera or video file if present; an explicit source (camera
+        # index or video path) takes precedence over the local test recording
+        if source is None:
+            video_file = find_test_video()
+        elif str(source).isdigit():
+            video_file = None
+            camera_id = int(source)
+        else:
+            video_file = str(source)
 
         self.video_file = video_file
         self.using_video_file = False
+        camera_t0 = time.perf_counter()
         if video_file:
             print(f"Using video file for input: {video_file}")
             self.cap = cv2.VideoCapture(video_file)
@@ -94,20 +2151,44 @@ class YOLODetectorOSC:
             self.cap = cv2.VideoCapture(camera_id)
         if not self.cap.isOpened():
             raise RuntimeError(f"Could not open video/camera (camera_id={camera_id}, video_file={video_file})")
+        # Capture thread is created here but only started in run()
+        self.grabber = FrameGrabber(self.cap, loop_video=self.using_video_file, ring_slots=frame_ring_slots,
+                                    on_capture=self.on_capture)
         
         # Get camera resolution
         self.camera_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         self.camera_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         print(f"Camera resolution: {self.camera_width}x{self.camera_height}")
+        self.startup.add(self.phase_name('camera'), camera_t0)
 
         # Initialize enhancement settings
-        self.frame_buffer = deque(maxlen=3)
+        # Separate accumulators for the inference crop and the display frame (different sizes)
+        self.accumulators = {
+            'inference': FrameAccumulator(accumulation_window, accumulation_mode),
+            'display': FrameAccumulator(accumulation_window, accumulation_mode),
+        }
         self.enable_accumulation = False
         self.auto_gain = True
         self.gain = 1.0
         self.brightness = 0
         self.contrast = 1.0
         self.show_enhanced = False
+        # Lookup tables for contrast/brightness/gain and a reusable CLAHE instance
+        self.enhance_luts = {}
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        # Preallocated destinations for the per-frame OpenCV steps. Inference frames
+        # rotate through enough buffers to cover every frame still queued or being
+        # inferred; the others are consumed before the next frame arrives.
+        self.buffers = {
+            'mask3': BufferRing(1),
+            'masked': BufferRing(1),
+            'enhanced': BufferRing(1),
+            'inference': BufferRing(queue_size + 3),
+            'motion_small': BufferRing(1),
+            'motion': BufferRing(2),
+            'depth': BufferRing(1),
+            'display': BufferRing(1),
+        }
         # Whether to run the model on the enhanced frame (slower but may help in low light)
         self.apply_enhancement_to_inference = False
         # Background subtraction (MOG2)
@@ -115,11 +2196,40 @@ class YOLODetectorOSC:
         self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=True)
         self.bg_subtract_learning_rate = -1  # default automatic
 
+        # Pseudo-depth grid sent as the /depth blob, at the poster library's resolution.
+        # The foreground layer uses its own tiny MOG2 model on a grid-sized copy of the crop.
+        # Opt-in: with 'none' /depth keeps its 1-byte blob and crop width/height. The
+        # grid is run-length encoded and sent on /depth_rle unless depth_rle is off.
+        self.depth_source = depth_source
+        self.depth_grid_w, self.depth_grid_h = depth_grid
+        self.depth_rle = depth_rle
+        self.depth_bg_subtractor = cv2.createBackgroundSubtractorMOG2(history=300, varThreshold=25, detectShadows=True)
+
+        # Multi-person mode: track individual people and publish them on /people
+        self.multi_person = multi_person
+        self.tracker = PersonTracker()
+
         # Configure camera for low light
         self.configure_camera_for_low_light()
+        # Camera resolution/pixel format/fps are negotiated once the saved crop is
+        # loaded (configure_capture): 'auto' picks the smallest mode that covers the crop
+        # with capture_detail x inference_size pixels, 'native' keeps the driver's
+        # default, 'WxH' asks for that mode.
+        self.capture_mode = capture_mode
+        self.capture_format = capture_format
+        self.capture_fps = capture_fps
+        self.capture_detail = capture_detail
+
+        # Without a WebSocket server of our own, the metrics endpoint gets its own loop
+        if self.metrics_port and (self.transport_owner is not None or not self.use_websockets):
+            metrics_thread = threading.Thread(target=self._run_metrics_server, name="metrics")
+            metrics_thread.daemon = True
+            metrics_thread.start()
 
         # OSC setup
-        if self.use_websockets:
+        if self.transport_owner is not None:
+            print(f"Publishing {self.depth_address} through the shared server on port {self.transport_owner.osc_port}")
+        elif self.use_websockets:
             # event loop for the websocket server thread will be stored here
             self.ws_loop = None
             self.ws_thread = threading.Thread(target=self._run_ws_server)
@@ -130,20 +2240,104 @@ class YOLODetectorOSC:
             self.osc_client = udp_client.SimpleUDPClient(osc_host, osc_port)
             print(f"UDP OSC client targeting {osc_host}:{osc_port}")
 
-        # YOLO setup (allow loading custom weights)
-        self.weights_path = weights_path
+        
+        # Crop settings
+        self.crop_x1 = 0
+        self.crop_y1 = 0
+        self.crop_x2 = self.camera_width
+        self.crop_y2 = self.camera_height
+        
+        # UI state
+        self.dragging = False
+        self.drag_start = (0, 0)
+        self.show_crop_interface = False
+        self.show_detections = True
+        self.paused = False
+        
+        # Performance tracking
+        self.fps_counter = 0
+        self.fps_start_time = time.time()
+        self.current_fps = 0
+        
+        # Settings
+        # Adaptive ROI: after people were found, run the model on a region around them
+        # and only scan the full crop every roi_full_scan_interval processed frames.
+        self.roi_enabled = False
+        self.roi_full_scan_interval = 10
+        self.roi_margin = 0.3
+        self.roi_frames_since_full = 0
+        # Detections from the most recent inference (crop-normalized), used by ROI and the motion gate
+        self.last_detections = None
+
+        # Motion gate: while the crop is static and nobody was seen, skip inference and
+        # keep re-sending the last output at a low rate so posters stay connected.
+        self.motion_gate = motion_gate
+        self.motion_threshold = motion_threshold  # fraction of changed pixels that counts as motion
+        self.idle_scan_interval = idle_scan_interval  # seconds between forced scans while idle
+        self.idle_publish_interval = 0.1
+        self.motion_prev_small = None
+        self.motion_level = 0.0
+        self.last_inference_time = 0.0
+        self.last_hold_publish = 0.0
+        self.last_depth_blob = None
+
+        # Filter for the published point (see PointFilter): the name given here wins
+        # over the one in the settings file; tuned parameters are saved per filter
+        self.point_filter_name = point_filter
+        self.point_filter_params = {}
+        self.max_prediction = max_prediction
+
+        self.settings_file = settings_file
+        capture_t0 = time.perf_counter()
+        self.load_settings()
+        if roi_mode:
+            self.roi_enabled = True
+        self.configure_capture()
+        self.startup.add(self.phase_name('capture_mode'), capture_t0)
+
+        # Smoothed average point for stable output (normalized x,y,z)
+        self.smoothed_point = None
+        self.point_filter = self.make_point_filter(self.point_filter_name or 'ema')
+        # Held while the publish stage steps the filter and while keys tune or swap it
+        self.point_filter_lock = threading.Lock()
+        self.stepped_filter = self.point_filter
+        # Fixed-rate /depth output (Hz) from its own stage thread; 0 = send once per processed frame
+        self.output = OutputScheduler(output_rate, max_prediction) if output_rate > 0 else None
+
+        if self.model_thread is not None:
+            self.model_thread.join()
+            if self.model_error is not None:
+                raise self.model_error
+        self.startup.add(self.phase_name('init'), init_t0)
+
+    def phase_name(self, phase: str) -> str:
+        """Startup phase name, per source in multi-source mode"""
+        return f"{phase} {self.name}" if self.name else phase
+
+    def _load_model_thread(self, model_name: str, backend: str, model_cache_dir: str, warmup_runs: int):
+        try:
+            self.load_model(model_name, backend, model_cache_dir, warmup_runs)
+        except Exception as e:
+            self.model_error = e
+
+    def load_model(self, model_name: str, backend: str, model_cache_dir: str, warmup_runs: int):
+        """Load the YOLO model (custom weights if given), pick the backend and warm it up"""
+        import_t0 = time.perf_counter()
+        import_yolo()
+        load_t0 = time.perf_counter()
+        self.startup.add('model_import', import_t0, load_t0)
         try:
             if self.weights_path and os.path.exists(self.weights_path):
                 print(f"Loading custom weights: {self.weights_path}")
-                self.model = YOLO(self.weights_path)
+                self.model = import_yolo()(self.weights_path)
                 loaded_name = self.weights_path
             else:
-                self.model = YOLO(model_name)
+                self.model = import_yolo()(model_name)
                 loaded_name = model_name
             # Use CUDA if available (guarded)
             if TORCH_AVAILABLE:
                 try:
-                    self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+                    self.device = 'cuda' if import_torch().cuda.is_available() else 'cpu'
                 except Exception:
                     self.device = 'cpu'
                 try:
@@ -164,7 +2358,16 @@ class YOLODetectorOSC:
         except Exception as e:
             print(f"Failed to load YOLO model: {e}")
             print("Trying to download default model...")
-            self.model = YOLO("yolov8n.pt")
+            self.model = import_yolo()("yolov8n.pt")
+            loaded_name = "yolov8n.pt"
+
+        # Path/name the model was loaded from (inference worker processes load it again)
+        self.model_source = loaded_name
+
+        # Optionally replace the PyTorch model with an exported CPU-optimised one
+        self.backend = 'torch'
+        if backend != 'torch':
+            self.load_backend_model(backend, loaded_name, model_cache_dir)
 
         # Expose class name mapping and detect which index corresponds to 'person'
         try:
@@ -173,218 +2376,126 @@ class YOLODetectorOSC:
             self.class_names = {}
 
         # person class index (None means fallback to class 0)
-        self.person_class_idx = None
-        try:
-            if isinstance(self.class_names, dict):
-                for idx, name in self.class_names.items():
-                    if str(name).lower() in ('person', 'people'):
-                        self.person_class_idx = int(idx)
-                        break
-            else:
-                for idx, name in enumerate(self.class_names):
-                    if str(name).lower() in ('person', 'people'):
-                        self.person_class_idx = int(idx)
-                        break
-        except Exception:
-            self.person_class_idx = None
+        self.person_class_idx = find_person_class_idx(self.class_names)
 
-        self.confidence_threshold = confidence_threshold
-        
-        # Crop settings
-        self.crop_x1 = 0
-        self.crop_y1 = 0
-        self.crop_x2 = self.camera_width
-        self.crop_y2 = self.camera_height
-        
-        # UI state
-        self.dragging = False
-        self.drag_start = (0, 0)
-        self.show_crop_interface = False
-        self.show_detections = True
-        self.paused = False
-        
-        # Performance tracking
-        self.fps_counter = 0
-        self.fps_start_time = time.time()
-        self.current_fps = 0
-        
-        # Settings
-        self.settings_file = "detector_settings.json"
-        self.load_settings()
+        self.direct_model = None
+        if self.direct_inference:
+            try:
+                self.direct_model = DirectDetector.from_model(self.model, self.backend, self.model_source,
+                                                              self.inference_size, self.person_class_idx,
+                                                              self.inference_threads)
+                print(f"Direct inference: {self.backend}, input {self.direct_model.input_size}x{self.direct_model.input_size}")
+            except Exception as e:
+                print(f"Direct inference not available ({e}); using the Ultralytics predictor")
 
-        # Smoothed average point for stable output (normalized x,y,z)
-        self.smoothed_point = None
-        self.smoothing_alpha = 0.2  # base smoothing factor (0-1)
+        self.startup.add('model_load', load_t0)
 
-    def update_smoothed_point(self, detected_point: Optional[Tuple[float, float, float]], tracking: bool) -> Tuple[float, float, float]:
-        """Update and return smoothed normalized (x,y,z).
+        # A few dummy passes so the first real frame doesn't pay for lazy init
+        warmup_t0 = time.perf_counter()
+        self.warmup_model(warmup_runs)
+        self.startup.add('warmup', warmup_t0)
 
-        - If detected_point is None, target becomes center of crop (0.5, 0.5) for x,y and 0 for z.
-        - Uses exponential moving average with alpha self.smoothing_alpha.
-        """
-        # Target when no detection: center
-        if detected_point is None:
-            target = (0.5, 0.5, 0.0)
-        else:
-            target = detected_point
-
-        if self.smoothed_point is None:
-            # initialize directly
-            self.smoothed_point = target
-            return self.smoothed_point
-
-        alpha = self.smoothing_alpha
-        # If tracking is False (no detection), use a slightly higher alpha to move toward center faster
-        if not tracking:
-            alpha = min(0.4, alpha * 1.5)
-
-        sx, sy, sz = self.smoothed_point
-        tx, ty, tz = target
-        nx = sx * (1 - alpha) + tx * alpha
-        ny = sy * (1 - alpha) + ty * alpha
-        nz = sz * (1 - alpha) + tz * alpha
-        self.smoothed_point = (nx, ny, nz)
-        return self.smoothed_point
+    def load_backend_model(self, backend: str, loaded_name: str, cache_dir: str):
+        """Swap self.model for an ONNX Runtime or OpenVINO export of the same weights"""
+        weights_file = getattr(self.model, 'ckpt_path', None) or loaded_name
+        if not weights_file or not os.path.exists(weights_file):
+            print(f"Cannot export for {backend} backend: weights file not found ({weights_file}); using PyTorch")
+            return
+        try:
+            artefact = export_model_cached(weights_file, backend, self.inference_size, cache_dir)
+            self.model = import_yolo()(artefact, task='detect')
+            self.model_source = artefact
+            self.backend = backend
+            self.device = 'cpu'
+            print(f"Inference backend: {backend} ({artefact})")
+        except Exception as e:
+            print(f"Could not use {backend} backend ({e}); falling back to PyTorch")
 
-    def calculate_average_point(self, results) -> Optional[Tuple[float, float, float]]:
-        """Calculate average point from detected person bounding boxes"""
-        if not results or len(results) == 0:
-            return None
-        
-        result = results[0]
-        person_boxes = []
-
-        # Get dimensions for scaling (crop image size)
-        # Use the original image size returned by the model for this result
-        crop_height, crop_width = results[0].orig_img.shape[:2]
-
-        # Calculate inference dimensions (how the model may have resized the crop)
-        scale = min(self.inference_size / crop_width, self.inference_size / crop_height)
-        inference_w = max(1, int(crop_width * scale))
-        inference_h = max(1, int(crop_height * scale))
-
-        # Calculate scale factors to map inference coords back to crop coords
-        scale_x = crop_width / inference_w
-        scale_y = crop_height / inference_h
-
-        # Filter for person class (use detected mapping if available)
-        for box in result.boxes:
-            cls_idx = int(box.cls)
-            # If we detected a person index from the model's names, use it; otherwise default to 0
-            if self.person_class_idx is not None:
-                if cls_idx != self.person_class_idx:
-                    continue
-            else:
-                if cls_idx != 0:
-                    continue
+    def warmup_model(self, runs: int):
+        """Run the model a few times on a blank frame at the inference size"""
+        if runs <= 0:
+            return
+        dummy = np.zeros((self.inference_size, self.inference_size, 3), dtype=np.uint8)
+        t0 = time.time()
+        try:
+            for _ in range(runs):
+                if self.direct_model is not None:
+                    self.direct_model.detect(dummy, self.confidence_threshold)
+                else:
+                    self.run_inference(dummy)
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+            return
+        print(f"Model warm-up ({runs} runs, {self.backend}): {(time.time() - t0) / runs * 1000:.1f} ms/run")
 
-            conf = float(box.conf)
-            if conf > self.confidence_threshold:
-                # Coordinates in inference space
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+    @staticmethod
+    def new_timing() -> dict:
+        """Return a fresh set of timing accumulators"""
+        return {'decode': 0.0, 'preprocess': 0.0, 'inference': 0.0, 'draw': 0.0,
+                'dropped_frames': 0, 'capture_to_send': 0.0, 'skipped_inference': 0}
 
-                # Box center in inference space
-                center_x = (x1 + x2) / 2.0
-                center_y = (y1 + y2) / 2.0
+    def make_point_filter(self, name: str) -> PointFilter:
+        """Filter `name` with the parameters last saved for it"""
+        return make_point_filter(name, self.point_filter_params.get(name), self.max_prediction)
 
-                # Box area in inference space
-                box_w = max(1.0, (x2 - x1))
-                box_h = max(1.0, (y2 - y1))
-                area_inf = box_w * box_h
+    def update_smoothed_point(self, detected_point: Optional[Tuple[float, float, float]], tracking: bool,
+                              capture_time: Optional[float] = None, now: Optional[float] = None) -> Tuple[float, float, float]:
+        """Update and return smoothed normalized (x,y,z).
 
-                # Map center and area back to crop space
-                center_x *= scale_x
-                center_y *= scale_y
-                area_crop = area_inf * (scale_x * scale_y)
+        - If detected_point is None, the point drifts to the center of the crop (0.5, 0.5) for x,y and 0 for z.
+        - Filtered by self.point_filter with the frame's capture time and predicted
+          forward to `now` (the send time, default: current time).
+        """
+        if capture_time is None:
+            capture_time = time.time()
+        with self.point_filter_lock:
+            # The filter stepped last, for publish_point (a key may swap self.point_filter meanwhile)
+            self.stepped_filter = self.point_filter
+            self.smoothed_point = self.stepped_filter.step(detected_point, tracking, capture_time, now)
+        return self.smoothed_point
 
-                # Weight by confidence * area (bigger and more confident boxes count more)
-                weight = conf * area_crop
-                person_boxes.append((center_x, center_y, conf, weight))
+    def extract_detections(self, results) -> np.ndarray:
+        """Person detections above the confidence threshold as an (N, 6) array (see extract_person_detections)"""
+        return extract_person_detections(results, self.person_class_idx, self.confidence_threshold)
 
-        if not person_boxes:
-            return None
+    def calculate_average_point(self, detections: np.ndarray) -> Optional[Tuple[float, float, float]]:
+        """Calculate average point from detected person bounding boxes"""
+        return weighted_average_point(detections)
 
-        # Total weight for centers
-        total_weight = sum(p[3] for p in person_boxes)
-        if total_weight == 0:
-            return None
+    def draw_detections(self, image, detections: np.ndarray):
+        """Draw bounding boxes and average point"""
+        if detections is None or len(detections) == 0:
+            return
 
-        # Weighted average of centers
-        avg_x = sum(p[0] * p[3] for p in person_boxes) / total_weight
-        avg_y = sum(p[1] * p[3] for p in person_boxes) / total_weight
+        # Map normalized crop coordinates to the main frame
+        crop_width = self.crop_x2 - self.crop_x1
+        crop_height = self.crop_y2 - self.crop_y1
+        boxes = detections[:, :4] * (crop_width, crop_height, crop_width, crop_height)
+        boxes += (self.crop_x1, self.crop_y1, self.crop_x1, self.crop_y1)
 
-        # Clamp
-        avg_x = min(max(0.0, avg_x), float(crop_width))
-        avg_y = min(max(0.0, avg_y), float(crop_height))
+        for (x1, y1, x2, y2), conf in zip(boxes.astype(int).tolist(), detections[:, 4].tolist()):
+            # Draw rectangle
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
 
-        # Normalize
-        norm_x = avg_x / float(crop_width) if crop_width > 0 else 0.5
-        norm_y = avg_y / float(crop_height) if crop_height > 0 else 0.5
+            # Draw center point
+            cv2.circle(image, ((x1 + x2) // 2, (y1 + y2) // 2), 4, (0, 0, 255), -1)
 
-        # avg_z: keep as mean confidence across person boxes
-        avg_conf = sum(p[2] for p in person_boxes) / len(person_boxes)
+            # Draw confidence and coordinates for debugging
+            cv2.putText(image, f"conf: {conf:.2f}", (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            cv2.putText(image, f"y: {y2 - y1}", (x1, y2 + 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
-        return (norm_x, norm_y, avg_conf)
+    def draw_tracks(self, image, tracks: np.ndarray):
+        """Label tracked people with their ID"""
+        crop_width = self.crop_x2 - self.crop_x1
+        crop_height = self.crop_y2 - self.crop_y1
+        for track_id, x, y, _, _, h, _ in tracks.tolist():
+            px = int(self.crop_x1 + x * crop_width)
+            py = int(self.crop_y1 + (y - h * 0.5) * crop_height)
+            cv2.putText(image, f"id {int(track_id)}", (px, py - 28),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 200, 255), 2)
 
-    def draw_detections(self, image, results):
-        """Draw bounding boxes and average point"""
-        if not results or len(results) == 0:
-            return
-                
-        result = results[0]
-        
-        # Get dimensions of cropped and inference frames
-        cropped_frame = self.get_cropped_image(image)
-        crop_height, crop_width = cropped_frame.shape[:2]
-        
-        # Calculate scale factors based on the actual inference frame dimensions
-        scale = min(self.inference_size / crop_width, self.inference_size / crop_height)
-        inference_w = int(crop_width * scale)
-        inference_h = int(crop_height * scale)
-        scale_x = crop_width / inference_w
-        scale_y = crop_height / inference_h
-        
-        # Draw boxes for persons
-        for box in result.boxes:
-            cls_idx = int(box.cls)
-            # Use detected person index if available, otherwise default to 0
-            if self.person_class_idx is not None:
-                if cls_idx != self.person_class_idx:
-                    continue
-            else:
-                if cls_idx != 0:
-                    continue
-
-            conf = float(box.conf)
-            if conf > self.confidence_threshold:
-                # Get coordinates from detection
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-
-                # Scale coordinates
-                x1 = x1 * scale_x
-                x2 = x2 * scale_x
-                y1 = y1 * scale_y
-                y2 = y2 * scale_y
-
-                # Adjust coordinates to main frame
-                x1, x2 = x1 + self.crop_x1, x2 + self.crop_x1
-                y1, y2 = y1 + self.crop_y1, y2 + self.crop_y1
-
-                # Draw rectangle
-                cv2.rectangle(image, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-
-                # Draw center point
-                center_x = int((x1 + x2) / 2)
-                center_y = int((y1 + y2) / 2)
-                cv2.circle(image, (center_x, center_y), 4, (0, 0, 255), -1)
-
-                # Draw confidence and coordinates for debugging
-                cv2.putText(image, f"conf: {conf:.2f}", (int(x1), int(y1) - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                cv2.putText(image, f"y: {int(y2-y1)}", (int(x1), int(y2) + 20),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                    
-            
     def configure_camera_for_low_light(self):
         """Configure camera settings for better low-light performance"""
         # Increase exposure time (smaller number means longer exposure)
@@ -400,54 +2511,116 @@ class YOLODetectorOSC:
         except:
             pass
 
+    def configure_capture(self):
+        """Negotiate camera resolution, pixel format and fps and move the crop to the new resolution"""
+        if self.using_video_file or self.capture_mode == 'native':
+            return
+        native = (self.camera_width, self.camera_height)
+        crop = (self.crop_x1, self.crop_y1, self.crop_x2, self.crop_y2)
+        if self.capture_mode == 'auto':
+            # ROI inference zooms into part of the crop, so it needs more pixels
+            min_pixels = self.inference_size * self.capture_detail * (2 if self.roi_enabled else 1)
+            candidates = choose_capture_modes(native, crop, min_pixels)
+        else:
+            try:
+                candidates = [tuple(int(v) for v in self.capture_mode.lower().split('x'))]
+            except ValueError:
+                print(f"Invalid capture mode '{self.capture_mode}', expected auto, native or WxH")
+                return
+        if not candidates:
+            print(f"Capture: keeping {native[0]}x{native[1]} (no smaller mode covers the crop)")
+            return
+
+        actual = None
+        for width, height in candidates:
+            actual = self.apply_capture_mode(width, height, pick_pixel_format(self.capture_format, width, height,
+                                                                              self.capture_fps))
+            if actual[:2] == (width, height):
+                break
+            print(f"Capture: camera refused {width}x{height} (got {actual[0]}x{actual[1]})")
+        else:
+            # Nothing was accepted: go back to the driver's default mode
+            actual = self.apply_capture_mode(native[0], native[1], pick_pixel_format(
+                self.capture_format, native[0], native[1], self.capture_fps))
+
+        width, height, fourcc, fps = actual
+        self.crop_x1, self.crop_y1, self.crop_x2, self.crop_y2 = remap_crop(crop, native, (width, height))
+        self.camera_width, self.camera_height = width, height
+        print(f"Capture: {width}x{height} {fourcc or '?'} @ {fps:.0f} fps (driver default {native[0]}x{native[1]}), "
+              f"crop {self.crop_x2 - self.crop_x1}x{self.crop_y2 - self.crop_y1}")
+
+    def apply_capture_mode(self, width: int, height: int, pixel_format: str) -> Tuple[int, int, str, float]:
+        """Ask the driver for a mode and return what it actually delivers (width, height, fourcc, fps).
+
+        YUYV that cannot reach the requested fps (USB bandwidth) is retried as MJPG.
+        """
+        # V4L2 applies the pixel format first, then the size, then the frame rate
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*pixel_format.upper()))
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.cap.set(cv2.CAP_PROP_FPS, self.capture_fps)
+        actual_w = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        actual_h = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        code = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+        fourcc = "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00 ') if code > 0 else ""
+        if pixel_format == 'yuyv' and 0 < fps < self.capture_fps * 0.9:
+            return self.apply_capture_mode(width, height, 'mjpg')
+        return actual_w, actual_h, fourcc, fps
+
+    def enhancement_lut(self, gain: float) -> np.ndarray:
+        """256-entry table for clip((v * contrast + brightness) * gain), cached per parameter set"""
+        key = (self.contrast, self.brightness, gain)
+        lut = self.enhance_luts.get(key)
+        if lut is None:
+            values = (np.arange(256, dtype=np.float32) * self.contrast + self.brightness) * gain
+            lut = np.clip(values, 0, 255).astype(np.uint8)
+            if len(self.enhance_luts) > 64:
+                self.enhance_luts.clear()
+            self.enhance_luts[key] = lut
+        return lut
+
     def enhance_frame(self, frame, for_inference: bool = False):
         """Apply various enhancements to improve low-light performance"""
-        # Convert to float32 for processing (keep in 0..1 range)
-        frame_float = frame.astype(np.float32) / 255.0
-
         # Apply temporal averaging if enabled
         if self.enable_accumulation:
-            self.frame_buffer.append(frame_float)
-            # Average the buffered frames
-            accumulated = np.mean(self.frame_buffer, axis=0)
+            accumulator = self.accumulators['inference' if for_inference else 'display']
+            accumulated = accumulator.add(frame)
         else:
-            accumulated = frame_float
-
-        # Apply manual brightness/contrast in float domain
-        # contrast scales the values, brightness shifts the values (both in 0..1 domain)
-        enhanced_float = accumulated * self.contrast + (self.brightness / 255.0)
+            accumulated = frame
 
-        # Auto gain adjustment if enabled (operate on float image luminance)
+        # Auto gain adjustment if enabled, measured on a strided subsample of the
+        # contrast/brightness-adjusted luminance (before gain, as before)
         if self.auto_gain:
-            # compute mean on luminance (convert to grayscale)
-            mean_brightness = np.mean(cv2.cvtColor((np.clip(enhanced_float, 0, 1) * 255).astype(np.uint8), cv2.COLOR_BGR2GRAY) / 255.0)
+            sample = np.ascontiguousarray(accumulated[::8, ::8])
+            sample = cv2.LUT(sample, self.enhancement_lut(1.0))
+            if sample.ndim == 3:
+                sample = cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY)
+            mean_brightness = float(sample.mean()) / 255.0
             if mean_brightness < 0.4:  # Adjust threshold as needed
                 self.gain = min(self.gain * 1.1, 3.0)  # Increase gain
             elif mean_brightness > 0.6:
                 self.gain = max(self.gain * 0.9, 0.5)  # Decrease gain
 
-        # Apply gain in float domain so effect is visible before conversion
-        enhanced_float = enhanced_float * self.gain
-
-        # Convert to uint8 now
-        enhanced_uint8 = np.clip(enhanced_float * 255.0, 0, 255).astype(np.uint8)
-
-        # If this is for inference we want to keep processing cheap and deterministic
+        # Contrast, brightness and gain folded into one uint8 lookup table
         if for_inference:
-            return enhanced_uint8
+            # Keep processing cheap and deterministic (and allocation free) for inference
+            return cv2.LUT(accumulated, self.enhancement_lut(self.gain),
+                           dst=self.buffers['enhanced'].get(accumulated.shape))
+        enhanced_uint8 = cv2.LUT(accumulated, self.enhancement_lut(self.gain))
 
         # Optional: Apply adaptive histogram equalization on uint8 after gain for display only
         try:
             lab = cv2.cvtColor(enhanced_uint8, cv2.COLOR_BGR2LAB)
             l, a, b = cv2.split(lab)
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            l = clahe.apply(l)
+            l = self.clahe.apply(l)
             enhanced_uint8 = cv2.cvtColor(cv2.merge([l, a, b]), cv2.COLOR_LAB2BGR)
         except Exception:
             # If CLAHE fails for any reason, fall back to the gain-applied result
             pass
 
         return enhanced_uint8
+
     def load_settings(self):
         """Load settings from JSON file if it exists"""
         if os.path.exists(self.settings_file):
@@ -458,6 +2631,19 @@ class YOLODetectorOSC:
                     self.crop_y1 = settings.get('crop_y1', self.crop_y1)
                     self.crop_x2 = settings.get('crop_x2', self.crop_x2)
                     self.crop_y2 = settings.get('crop_y2', self.crop_y2)
+                    # The crop is in pixels of the resolution it was saved at (files
+                    # without frame size are from before capture negotiation: native)
+                    saved_size = (settings.get('frame_width', self.camera_width),
+                                  settings.get('frame_height', self.camera_height))
+                    self.crop_x1, self.crop_y1, self.crop_x2, self.crop_y2 = remap_crop(
+                        (self.crop_x1, self.crop_y1, self.crop_x2, self.crop_y2), saved_size,
+                        (self.camera_width, self.camera_height))
+                    self.roi_enabled = settings.get('roi_enabled', self.roi_enabled)
+                    self.roi_full_scan_interval = settings.get('roi_full_scan_interval', self.roi_full_scan_interval)
+                    self.roi_margin = settings.get('roi_margin', self.roi_margin)
+                    self.point_filter_params = settings.get('point_filters', self.point_filter_params)
+                    if self.point_filter_name is None:
+                        self.point_filter_name = settings.get('point_filter')
                     print("Settings loaded from file")
             except Exception as e:
                 print(f"Could not load settings: {e}")
@@ -468,7 +2654,14 @@ class YOLODetectorOSC:
             'crop_x1': self.crop_x1,
             'crop_y1': self.crop_y1,
             'crop_x2': self.crop_x2,
-            'crop_y2': self.crop_y2
+            'crop_y2': self.crop_y2,
+            'frame_width': self.camera_width,
+            'frame_height': self.camera_height,
+            'roi_enabled': self.roi_enabled,
+            'roi_full_scan_interval': self.roi_full_scan_interval,
+            'roi_margin': self.roi_margin,
+            'point_filter': self.point_filter.name,
+            'point_filters': {**self.point_filter_params, self.point_filter.name: self.point_filter.params()}
         }
         try:
             with open(self.settings_file, 'w') as f:
@@ -521,101 +2714,227 @@ class YOLODetectorOSC:
     
     def _run_ws_server(self):
         """Run WebSocket server in separate thread"""
+        bind_t0 = time.perf_counter()
         async def handle_client(websocket):
-            self.ws_clients.add(websocket)
+            client = WebSocketClient(websocket)
+            client.on_sent = self.observe_ws_send
+            client.task = asyncio.create_task(client.run_writer())
+            self.ws_clients.add(client)
+            self.ws_binary_clients += client.binary
             try:
                 async for _ in websocket:  # Keep connection alive
                     pass
+            except websockets.exceptions.ConnectionClosed:
+                pass
             finally:
-                self.ws_clients.remove(websocket)
+                self.ws_clients.discard(client)
+                self.ws_binary_clients -= client.binary
+                client.task.cancel()
+
+        def select_subprotocol(connection, offered):
+            # Binary if asked for, else OSC; clients that offer no subprotocol get OSC too
+            # (websockets would otherwise reject them once subprotocols are configured)
+            for protocol in (BINARY_SUBPROTOCOL, "osc"):
+                if protocol in offered:
+                    return protocol
+            return None
 
         async def serve():
             # capture the running loop so other threads can schedule coroutines on it
             self.ws_loop = asyncio.get_running_loop()
-            async with websockets.serve(handle_client, self.osc_host, self.osc_port, subprotocols=["osc"]):
-                await asyncio.Future()  # Run forever
+            if self.metrics_port:
+                asyncio.create_task(serve_metrics(self.metrics, self.osc_host, self.metrics_port))
+            async with websockets.serve(handle_client, self.osc_host, self.osc_port,
+                                        subprotocols=["osc", BINARY_SUBPROTOCOL],
+                                        select_subprotocol=select_subprotocol):
+                self.startup.add('websocket', bind_t0)
+                await self._monitor_ws_clients()  # Run forever
 
         # Run the websocket server in this thread's event loop
         try:
+            import_websockets()
             asyncio.run(serve())
         except Exception as e:
             # If server fails to start, ensure ws_loop is cleared
             self.ws_loop = None
             print(f"WebSocket server error: {e}")
 
-    async def _broadcast_osc(self, message):
-        """Broadcast OSC message to all connected clients"""
-        disconnected = set()
-        for ws in self.ws_clients:
-            try:
-                await ws.send(message)
-            except websockets.exceptions.ConnectionClosed:
-                disconnected.add(ws)
-        
-        # Remove disconnected clients
-        self.ws_clients.difference_update(disconnected)
+    def _run_metrics_server(self):
+        """Serve the metrics endpoint on a private event loop (UDP or shared-transport mode)"""
+        try:
+            asyncio.run(serve_metrics(self.metrics, self.osc_host, self.metrics_port))
+        except Exception as e:
+            print(f"Metrics server error: {e}")
+
+    def observe_stage(self, stage: str, seconds: float, seq: Optional[int] = None):
+        """Record one stage duration in the metrics histogram (and the trace, if tracing)"""
+        self.metrics.observe('detector_stage_seconds', seconds, source=self.metrics_source, stage=stage)
+        if self.tracer.enabled:
+            self.tracer.span(stage, seconds, seq, self.metrics_source)
+
+    def observe_ws_send(self, seconds: float):
+        self.metrics.observe('detector_ws_send_seconds', seconds, source=self.metrics_source)
+
+    def on_capture(self, seconds: float, seq: int):
+        """Capture thread callback: time spent reading and flipping one frame"""
+        self.add_timing('decode', seconds)
+        self.observe_stage('capture', seconds, seq)
+
+    def collect_metrics(self):
+        """Refresh gauges right before the metrics are rendered"""
+        self.metrics.set('detector_fps', self.current_fps, source=self.metrics_source)
+        if self.transport_owner is None and self.use_websockets:
+            self.metrics.set('detector_ws_clients', len(self.ws_clients), source=self.metrics_source)
+            self.metrics.clear_gauge('detector_ws_client_lag_seconds', source=self.metrics_source)
+            for st in self.ws_client_stats:
+                self.metrics.set('detector_ws_client_lag_seconds', st['lag_ms'] / 1000,
+                                 source=self.metrics_source, peer=st['peer'], format=st['format'])
+
+    async def _monitor_ws_clients(self):
+        """Refresh per-client stats every second and evict clients that stay too slow"""
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.time()
+            stats = []
+            for client in list(self.ws_clients):
+                client_stats = client.take_stats(now)
+                stats.append(client_stats)
+                if client_stats['lag_ms'] <= self.ws_max_latency * 1000:
+                    client.slow_since = None
+                elif client.slow_since is None:
+                    client.slow_since = now
+                elif now - client.slow_since >= self.ws_evict_after:
+                    print(f"Evicting slow WebSocket client {client.peer} "
+                          f"(lag {client_stats['lag_ms']:.0f} ms for {now - client.slow_since:.1f} s)")
+                    self.ws_clients.discard(client)
+                    asyncio.create_task(self._evict_ws_client(client))
+            self.ws_client_stats = stats
+
+    async def _evict_ws_client(self, client: WebSocketClient):
+        """Close a slow client's connection, dropping it hard if the close handshake stalls too"""
+        client.task.cancel()
+        try:
+            await asyncio.wait_for(client.websocket.close(1013, "client too slow"), timeout=2.0)
+        except Exception:
+            transport = getattr(client.websocket, 'transport', None)
+            if transport is not None:
+                transport.abort()
+
+    def _broadcast(self, address: str, dgram: bytes, binary: Optional[bytes]):
+        """Hand a message to every client's writer (runs on the server's event loop).
 
-    def send_osc_data(self, avg_point: Optional[Tuple[float, float, float]], tracking: bool):
+        Nothing is awaited here, so the cost does not depend on how fast each
+        browser reads; a client still busy with the previous message just gets
+        it replaced by this one.
+        """
+        for client in self.ws_clients:
+            message = binary if client.binary else dgram
+            if message is not None:
+                client.offer(address, message)
+
+    def build_depth_blob(self, detections: Optional[np.ndarray], foreground: Optional[np.ndarray]) -> Optional[bytes]:
+        """Pseudo-depth grid for the /depth blob, or None when depth output is off"""
+        if self.depth_source == 'none':
+            return None
+        if self.depth_source == 'detections':
+            foreground = None
+        elif self.depth_source == 'foreground':
+            detections = None
+        grid = occupancy_grid(detections, self.depth_grid_w, self.depth_grid_h, foreground)
+        return rle_encode(grid) if self.depth_rle else grid.tobytes()
+
+    def send_osc_data(self, avg_point: Optional[Tuple[float, float, float]], tracking: bool,
+                      depth_blob: Optional[bytes] = None):
         """Send OSC data in format compatible with realSenseOSC system"""
-        crop_width = self.crop_x2 - self.crop_x1
-        crop_height = self.crop_y2 - self.crop_y1
+        if not self.startup.finished:
+            self.startup.finish(self.metrics)
+        rle = self.depth_rle and depth_blob is not None
+        if depth_blob is not None:
+            # width/height describe the depth grid, like the RealSense sender does
+            crop_width = self.depth_grid_w
+            crop_height = self.depth_grid_h
+        else:
+            crop_width = self.crop_x2 - self.crop_x1
+            crop_height = self.crop_y2 - self.crop_y1
+            depth_blob = bytes([0])  # empty depth data
         
-        # Create OSC message
-        builder = OscMessageBuilder(address="/depth")
         if avg_point:
             x, y, z = avg_point
-            builder.add_arg(int(crop_width), 'i')     # width
-            builder.add_arg(int(crop_height), 'i')    # height
-            builder.add_arg(bytes([0]), 'b')          # empty depth data as blob
-            builder.add_arg(float(1.0 - x), 'f')      # x position (flipped)
-            builder.add_arg(float(y), 'f')            # y position
-            builder.add_arg(float(z), 'f')            # z position
-            builder.add_arg(int(tracking), 'i')       # tracking status
+            x = 1.0 - x  # x position (flipped)
         else:
-            builder.add_arg(int(crop_width), 'i')
-            builder.add_arg(int(crop_height), 'i')
-            builder.add_arg(bytes([0]), 'b')
-            builder.add_arg(0.5, 'f')
-            builder.add_arg(0.5, 'f')
-            builder.add_arg(0.0, 'f')
-            builder.add_arg(0, 'i')
-
-        osc_message = builder.build()
-        
-        if self.use_websockets:
-            # Broadcast OSC message to all WebSocket clients.
-            # The websocket server runs in a separate thread with its own asyncio loop.
-            # Schedule the broadcast on that loop to avoid "Future attached to a different loop" errors.
-            try:
-                if getattr(self, 'ws_loop', None):
-                    asyncio.run_coroutine_threadsafe(self._broadcast_osc(osc_message.dgram), self.ws_loop)
-                else:
-                    # If loop not ready, fall back to running briefly in a new loop (best-effort)
-                    asyncio.run(self._broadcast_osc(osc_message.dgram))
-            except Exception as e:
-                print(f"WebSocket broadcast scheduling failed: {e}")
-        else:
-            # Fallback to UDP OSC - send raw datagram via client's socket
-            try:
-                # python-osc's SimpleUDPClient exposes the socket as _sock
-                self.osc_client._sock.sendto(osc_message.dgram, (self.osc_host, self.osc_port))
-            except Exception:
+            x, y, z = 0.5, 0.5, 0.0
+            tracking = False
+        dgram = self.depth_encoder.encode(int(crop_width), int(crop_height), depth_blob,
+                                          float(x), float(y), float(z), int(tracking), rle)
+        binary = None
+        if self.wants_binary():
+            binary = encode_depth_binary(self.wire_channel, int(crop_width), int(crop_height), depth_blob,
+                                         float(x), float(y), float(z), int(tracking), rle)
+
+        if not self.publish_dgram(dgram, self.depth_address, binary):
+            if not self.use_websockets:
                 # Last-resort: use send_message without blob support
                 try:
                     if avg_point:
                         x, y, z = avg_point
-                        self.osc_client.send_message("/depth", [int(crop_width), int(crop_height), 0, float(1.0 - x), float(y), float(z), int(tracking)])
+                        self.osc_client.send_message(self.depth_address, [int(crop_width), int(crop_height), 0, float(1.0 - x), float(y), float(z), int(tracking)])
                     else:
-                        self.osc_client.send_message("/depth", [int(crop_width), int(crop_height), 0, 0.5, 0.5, 0.0, 0])
+                        self.osc_client.send_message(self.depth_address, [int(crop_width), int(crop_height), 0, 0.5, 0.5, 0.0, 0])
                 except Exception as e:
                     print(f"Failed to send UDP OSC: {e}")
 
+    def wants_binary(self) -> bool:
+        """True if any connected WebSocket client asked for the compact binary format"""
+        owner = self.transport_owner or self
+        return owner.use_websockets and owner.ws_binary_clients > 0
+
+    def publish_dgram(self, dgram: bytes, address: str = "/depth", binary: Optional[bytes] = None) -> bool:
+        """Send an encoded OSC message over WebSocket or UDP. Returns False on failure.
+
+        address keys the per-client latest-message slot; binary is the same message
+        in the compact format for clients that negotiated it.
+        """
+        if self.transport_owner is not None:
+            return self.transport_owner.publish_dgram(dgram, address, binary)
+        if self.use_websockets:
+            # The websocket server runs in a separate thread with its own asyncio loop;
+            # hand the message over to that loop (no client is awaited from here).
+            try:
+                if getattr(self, 'ws_loop', None):
+                    self.ws_loop.call_soon_threadsafe(self._broadcast, address, dgram, binary)
+                return True
+            except Exception as e:
+                print(f"WebSocket broadcast scheduling failed: {e}")
+                return False
+        # Fallback to UDP OSC - send raw datagram via client's socket
+        try:
+            # python-osc's SimpleUDPClient exposes the socket as _sock
+            self.osc_client._sock.sendto(dgram, (self.osc_host, self.osc_port))
+            return True
+        except Exception:
+            return False
+
+    def send_people_data(self, tracks: np.ndarray):
+        """Send tracked people as /people [count, (id, x, y, conf, w, h, age) * count].
+
+        x is flipped like in /depth, conf is the detection confidence, w/h are the
+        normalized box width and height and age is the track age in processed frames.
+        """
+        binary = encode_people_binary(self.wire_channel, tracks) if self.wants_binary() else None
+        dgram = encode_people_osc(self.people_address, tracks)
+        if not self.publish_dgram(dgram, self.people_address, binary) and not self.use_websockets:
+            print("Failed to send /people over UDP")
+
     def cleanup(self):
         """Clean up resources"""
         print("Cleaning up...")
+        if self.tracer.enabled:
+            self.tracer.flush(background=False)
         self.save_settings()
+        self.grabber.stop()
         self.cap.release()
-        cv2.destroyAllWindows()
+        if not self.headless:
+            cv2.destroyAllWindows()
         # WebSocket cleanup handled by thread daemon status
     
     def get_cropped_image(self, image):
@@ -635,7 +2954,7 @@ class YOLODetectorOSC:
             cv2.rectangle(image, (self.crop_x1, self.crop_y1), (self.crop_x2, self.crop_y2), (255, 255, 0), 2)
 
         # Draw status information
-        status_y = height - 200
+        status_y = height - 230
         # Try to display a sensible model name if available
         try:
             model_display = getattr(self, 'model_name', None) or getattr(self.model, 'path', None) or self.model.__class__.__name__
@@ -656,11 +2975,13 @@ class YOLODetectorOSC:
                     (10, params_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 0), 1)
         cv2.putText(image, f"gain: {self.gain:.2f}    auto_gain: {int(self.auto_gain)}    accumulation: {int(self.enable_accumulation)}    show_enhanced: {int(self.show_enhanced)}    show_detections: {int(self.show_detections)}",
                     (10, params_y + 18), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 0), 1)
-        # Show smoothing alpha and whether enhancement is applied to inference
-        cv2.putText(image, f"smoothing_alpha: {self.smoothing_alpha:.3f}    apply_enhancement_to_inference: {int(self.apply_enhancement_to_inference)}", (10, params_y + 36), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 0), 1)
+        # Show the point filter and whether enhancement is applied to inference
+        cv2.putText(image, f"{self.point_filter.describe()}    apply_enhancement_to_inference: {int(self.apply_enhancement_to_inference)}", (10, params_y + 36), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 0), 1)
         # Show paused state
         cv2.putText(image, f"paused: {int(self.paused)}", (10, params_y + 54), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200,200,0), 1)
         cv2.putText(image, f"bg_subtract: {int(self.use_bg_subtraction)}  bg_lr: {self.bg_subtract_learning_rate}", (10, params_y + 72), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200,200,0), 1)
+        cv2.putText(image, f"motion_gate: {int(self.motion_gate)}  motion: {self.motion_level:.4f}  threshold: {self.motion_threshold:.4f}", (10, params_y + 108), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200,200,0), 1)
+        cv2.putText(image, f"roi: {int(self.roi_enabled)}  full_scan_interval: {self.roi_full_scan_interval}  roi_margin: {self.roi_margin:.2f}", (10, params_y + 90), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200,200,0), 1)
 
         # Draw controls
         controls = [
@@ -676,7 +2997,9 @@ class YOLODetectorOSC:
             "+ / - - Increase / Decrease manual gain",
             "U / I - Increase / Decrease process_every_n_frames (skip more/less)",
             ", / . - Decrease / Increase confidence threshold",
-            "P / O - Increase / Decrease smoothing alpha (less/more smoothing)",
+            "P / O - Less / more smoothing (tunes the point filter)",
+            "F - Next point filter (ema, one_euro, kalman)",
+            "N - Toggle adaptive ROI inference",
             "SPACE - Pause / Resume",
             "Q / ESC - Quit"
         ]
@@ -695,9 +3018,597 @@ class YOLODetectorOSC:
             self.fps_counter = 0
             self.fps_start_time = current_time
 
+    def add_timing(self, key: str, value):
+        """Accumulate a timing value (called from several pipeline threads)"""
+        with self.timing_lock:
+            self.timing[key] += value
+
+    def report_timing(self):
+        """Print averaged timings once per second and reset the accumulators"""
+        now = time.time()
+        if now - self.timing_last_print < 1.0:
+            return
+        with self.timing_lock:
+            timing = self.timing
+            count = max(1, self.timing_count)
+            sends = max(1, self.timing_sends)
+            draws = max(1, self.timing_draws)
+            self.timing = self.new_timing()
+            self.timing_count = 0
+            self.timing_sends = 0
+            self.timing_draws = 0
+            self.timing_last_print = now
+        self.tracer.maybe_flush()
+        timing['dropped_frames'] += self.grabber.take_dropped()
+        timing['dropped_frames'] += sum(self.stage_queues[k].take_dropped() for k in ('inference', 'publish'))
+        self.metrics.inc('detector_dropped_frames_total', timing['dropped_frames'], source=self.metrics_source)
+        self.metrics.inc('detector_skipped_inference_total', timing['skipped_inference'], source=self.metrics_source)
+        # compute averages (per processed frame, draw per displayed frame)
+        avg_decode = timing['decode'] / count
+        avg_pre = timing['preprocess'] / count
+        avg_inf = timing['inference'] / count
+        avg_draw = timing['draw'] / draws
+        avg_latency = timing['capture_to_send'] / sends
+        prefix = f"[{self.name}] " if self.name else ""
+        print(f"{prefix}Timing (s/frame) - decode: {avg_decode:.4f}, preprocess: {avg_pre:.4f}, inference: {avg_inf:.4f}, draw: {avg_draw:.4f}, "
+              f"capture_to_send: {avg_latency:.4f}, dropped: {timing['dropped_frames']}, "
+              f"skipped (no motion): {timing['skipped_inference']}, fps: {self.current_fps}")
+        if self.ws_client_stats:
+            # Per poster browser: messages sent/dropped, send latency avg/max, unsent messages
+            print(f"{prefix}WebSocket clients - " + ", ".join(
+                f"{st['peer']} ({st['format']}): {st['sent']} sent {st['dropped']} dropped "
+                f"{st['latency_avg_ms']:.1f}/{st['latency_max_ms']:.1f} ms pending {st['pending']}"
+                for st in self.ws_client_stats))
+        if self.inference_pool is not None:
+            # Per worker: frames finished in the last interval and mean inference time
+            stats = self.inference_pool.take_stats()
+            print(f"{prefix}Workers - " + ", ".join(
+                f"#{i}: {st['frames']} frames {st['busy'] / max(1, st['frames']) * 1000:.1f} ms"
+                for i, st in enumerate(stats)))
+
+    def select_roi(self) -> Optional[Tuple[float, float, float, float]]:
+        """Pick the region to run inference on (None means the full crop)"""
+        if not self.roi_enabled:
+            return None
+        roi = None
+        if self.roi_frames_since_full < self.roi_full_scan_interval:
+            roi = roi_from_detections(self.last_detections, self.roi_margin)
+        if roi is None:
+            self.roi_frames_since_full = 0
+        else:
+            self.roi_frames_since_full += 1
+        return roi
+
+    def prepare_inference_frame(self, frame):
+        """Crop, optionally background-subtract/enhance, and resize a frame for the model.
+
+        Returns (inference_frame, roi). inference_frame is None if the crop is empty;
+        roi is the normalized part of the crop that was used (None = full crop).
+        """
+        # Get cropped frame first
+        t0 = time.perf_counter()
+        cropped_frame = self.get_cropped_image(frame)
+        t1 = time.perf_counter()
+        self.observe_stage('crop', t1 - t0)
+
+        # Optionally apply background subtraction to the cropped frame
+        if self.use_bg_subtraction:
+            t0 = t1
+            try:
+                # Apply bg subtractor to obtain mask
+                lr = self.bg_subtract_learning_rate
+                mask = self.bg_subtractor.apply(cropped_frame, learningRate=lr)
+                # Convert mask to 3-channel and apply (into reused buffers)
+                mask3 = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR, dst=self.buffers['mask3'].get(cropped_frame.shape))
+                cropped_frame = cv2.bitwise_and(cropped_frame, mask3, dst=self.buffers['masked'].get(cropped_frame.shape))
+            except Exception as e:
+                # If bg subtraction fails, keep raw crop
+                print(f"Background subtraction failed: {e}")
+            self.observe_stage('bg_subtraction', time.perf_counter() - t0)
+
+        if cropped_frame.size == 0:
+            return None, None
+
+        # If enhancement is to be applied to inference, run it on the full-size crop
+        # This avoids mixing frame-buffer entries of different shapes and ensures
+        # accumulation/gain are computed consistently.
+        if self.apply_enhancement_to_inference:
+            t0 = time.perf_counter()
+            try:
+                cropped_frame = self.enhance_frame(cropped_frame, for_inference=True)
+            except Exception:
+                pass
+            self.observe_stage('enhancement', time.perf_counter() - t0)
+
+        # Narrow down to the region around the last detections
+        roi = self.select_roi()
+        if roi is not None:
+            h, w = cropped_frame.shape[:2]
+            rx1, ry1 = int(roi[0] * w), int(roi[1] * h)
+            rx2, ry2 = max(rx1 + 1, int(roi[2] * w)), max(ry1 + 1, int(roi[3] * h))
+            roi = (rx1 / w, ry1 / h, rx2 / w, ry2 / h)
+            cropped_frame = cropped_frame[ry1:ry2, rx1:rx2]
+
+        # Resize for inference into the next free inference buffer. Small crops are
+        # copied as-is so the frame handed on never aliases the capture ring.
+        t0 = time.perf_counter()
+        h, w = cropped_frame.shape[:2]
+        scale = min(self.inference_size / w, self.inference_size / h)
+        if scale < 1:
+            inference_w = int(w * scale)
+            inference_h = int(h * scale)
+            out = self.buffers['inference'].get((inference_h, inference_w) + cropped_frame.shape[2:])
+            cv2.resize(cropped_frame, (inference_w, inference_h), dst=out)
+        else:
+            out = self.buffers['inference'].get(cropped_frame.shape)
+            np.copyto(out, cropped_frame)
+        self.observe_stage('resize', time.perf_counter() - t0)
+        return out, roi
+
+    def measure_motion(self, frame) -> float:
+        """Fraction of pixels that changed since the previous frame, on a tiny grayscale copy of the crop"""
+        cropped_frame = self.get_cropped_image(frame)
+        if cropped_frame.size == 0:
+            return 0.0
+        resized = cv2.resize(cropped_frame, (80, 60), dst=self.buffers['motion_small'].get((60, 80, 3)),
+                             interpolation=cv2.INTER_AREA)
+        # Two alternating buffers: this frame's and the previous one
+        small = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY, dst=self.buffers['motion'].get((60, 80)))
+        prev = self.motion_prev_small
+        self.motion_prev_small = small
+        if prev is None:
+            return 1.0
+        _, changed = cv2.threshold(cv2.absdiff(small, prev), 15, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(changed) / float(changed.size)
+
+    def should_run_inference(self, frame) -> bool:
+        """Motion gate: run the model if something moves, people were seen, or an idle scan is due"""
+        if not self.motion_gate:
+            return True
+        self.motion_level = self.measure_motion(frame)
+        now = time.time()
+        people_seen = self.last_detections is not None and len(self.last_detections) > 0
+        if (self.motion_level >= self.motion_threshold or people_seen
+                or now - self.last_inference_time >= self.idle_scan_interval):
+            self.last_inference_time = now
+            return True
+        return False
+
+    def depth_foreground(self, frame) -> Optional[np.ndarray]:
+        """Foreground mask of the crop at depth-grid resolution (cheap: runs on a tiny image)"""
+        cropped_frame = self.get_cropped_image(frame)
+        if cropped_frame.size == 0:
+            return None
+        small = cv2.resize(cropped_frame, (self.depth_grid_w, self.depth_grid_h),
+                           dst=self.buffers['depth'].get((self.depth_grid_h, self.depth_grid_w, 3)),
+                           interpolation=cv2.INTER_AREA)
+        return self.depth_bg_subtractor.apply(small)
+
+    def run_inference(self, inference_frame):
+        """Run the model on a prepared frame"""
+        # Force model to use a small inference size to avoid internal upscaling
+        try:
+            return self.model(inference_frame, imgsz=self.inference_size, verbose=False)
+        except TypeError:
+            # older ultralytics versions might not accept imgsz at call; fall back
+            return self.model(inference_frame, verbose=False)
+
+    def _preprocess_stage(self):
+        """Pipeline stage: take the latest captured frame and prepare it for inference"""
+        while not self.stop_event.is_set():
+            ret, frame_seq, capture_time, frame = self.grabber.read(timeout=0.5)
+            if not ret:
+                if self.grabber.failed:
+                    self.stop_event.set()
+                continue
+
+            # Crop/mask/enhance/resize spans belong to this frame
+            self.tracer.set_frame(frame_seq)
+            packet = {'seq': frame_seq, 'capture_time': capture_time, 'frame': frame,
+                      'inference_frame': None, 'roi': None, 'foreground': None, 'results': None, 'detections': None,
+                      'tracks': None, 'smoothed': None, 'tracking': False, 'hold': False}
+
+            if not self.paused:
+                # Only process every nth frame
+                self.frame_count += 1
+                if self.frame_count % self.process_every_n_frames == 0:
+                    if self.should_run_inference(frame):
+                        pre_t0 = time.time()
+                        packet['inference_frame'], packet['roi'] = self.prepare_inference_frame(frame)
+                        if self.depth_source in ('foreground', 'both'):
+                            packet['foreground'] = self.depth_foreground(frame)
+                        self.add_timing('preprocess', time.time() - pre_t0)
+                    else:
+                        packet['hold'] = True
+                        self.add_timing('skipped_inference', 1)
+
+            if packet['inference_frame'] is not None:
+                self.stage_queues['inference'].put(packet)
+            elif packet['hold'] and time.time() - self.last_hold_publish >= self.idle_publish_interval:
+                # Scene is idle: let the publish stage repeat the held output
+                self.last_hold_publish = time.time()
+                self.stage_queues['publish'].put(packet)
+            elif not self.headless:
+                # Nothing to infer; hand the raw frame straight to the display
+                self.stage_queues['display'].put(packet)
+
+    def _inference_stage(self):
+        """Pipeline stage: run the model on prepared frames"""
+        queue_in = self.stage_queues['inference']
+        while not self.stop_event.is_set():
+            packet = queue_in.get(timeout=0.5)
+            if packet is None:
+                continue
+            inf_t0 = time.time()
+            if self.direct_model is not None:
+                packet['detections'] = self.direct_model.detect(packet['inference_frame'], self.confidence_threshold)
+            else:
+                packet['results'] = self.run_inference(packet['inference_frame'])
+            self.add_timing('inference', time.time() - inf_t0)
+            self.observe_stage('inference', time.time() - inf_t0, packet['seq'])
+            self.stage_queues['publish'].put(packet)
+
+    def _pool_dispatch_stage(self):
+        """Pipeline stage: hand prepared frames to idle inference worker processes"""
+        queue_in = self.stage_queues['inference']
+        ticket = 0
+        while not self.stop_event.is_set():
+            packet = queue_in.get(timeout=0.5)
+            if packet is None:
+                continue
+            with self.pool_lock:
+                self.pool_pending[ticket] = packet
+            if not self.inference_pool.submit(ticket, packet['inference_frame'], self.stop_event):
+                break
+            ticket += 1
+
+    def _pool_collect_stage(self):
+        """Pipeline stage: gather worker results and publish them in frame order"""
+        reorder = {}
+        next_ticket = 0
+        while not self.stop_event.is_set():
+            item = self.inference_pool.next_result(timeout=0.5)
+            if item is None:
+                continue
+            _, ticket, detections, elapsed = item
+            with self.pool_lock:
+                packet = self.pool_pending.pop(ticket, None)
+            if packet is None:
+                continue
+            # Boxes come back already extracted; results stays None so the publish
+            # stage only applies the confidence threshold
+            packet['detections'] = detections if detections is not None else np.zeros((0, 6), dtype=np.float32)
+            self.add_timing('inference', elapsed)
+            self.observe_stage('inference', elapsed, packet['seq'])
+            reorder[ticket] = packet
+            # If a worker lost a frame, don't hold everything behind it forever
+            if next_ticket not in reorder and len(reorder) > 2 * self.inference_workers:
+                next_ticket = min(reorder)
+            while next_ticket in reorder:
+                self.stage_queues['publish'].put(reorder.pop(next_ticket))
+                next_ticket += 1
+
+    def _publish_stage(self):
+        """Pipeline stage: reduce detections to a point, smooth it and send it over OSC"""
+        queue_in = self.stage_queues['publish']
+        while not self.stop_event.is_set():
+            packet = queue_in.get(timeout=0.5)
+            if packet is None:
+                continue
+            if packet['hold']:
+                # Motion gate skipped inference: hold the last smoothed point
+                self.publish_point(self.smoothed_point, False, self.last_depth_blob)
+                if self.multi_person:
+                    packet['tracks'] = self.tracker.update(None)
+                    self.send_people_data(packet['tracks'])
+                packet['smoothed'] = self.smoothed_point
+                if not self.headless:
+                    self.stage_queues['display'].put(packet)
+                continue
+
+            post_t0 = time.perf_counter()
+            if packet['results'] is None:
+                # Already extracted (direct path, or a worker process at a lower threshold)
+                detections = packet['detections']
+                detections = detections[detections[:, 4] > self.confidence_threshold]
+            else:
+                detections = self.extract_detections(packet['results'])
+            detections = remap_detections(detections, packet['roi'])
+            packet['detections'] = detections
+            self.last_detections = detections
+            avg_point = self.calculate_average_point(detections)
+            tracking = avg_point is not None
+
+            # Filter the point and predict it forward to the send time
+            smoothed = self.update_smoothed_point(avg_point, tracking, packet['capture_time'])
+
+            depth_blob = self.build_depth_blob(detections, packet['foreground'])
+            self.last_depth_blob = depth_blob
+            if self.multi_person:
+                packet['tracks'] = self.tracker.update(detections)
+            send_t0 = time.perf_counter()
+            self.observe_stage('postprocess', send_t0 - post_t0, packet['seq'])
+
+            # Send OSC data using smoothed point
+            self.publish_point(smoothed, tracking, depth_blob)
+            if self.multi_person:
+                self.send_people_data(packet['tracks'])
+            self.observe_stage('publish', time.perf_counter() - send_t0, packet['seq'])
+            latency = time.time() - packet['capture_time']
+            with self.timing_lock:
+                self.timing['capture_to_send'] += latency
+                self.timing_sends += 1
+                self.timing_count += 1
+            self.metrics.observe('detector_capture_to_send_seconds', latency, source=self.metrics_source)
+            self.metrics.inc('detector_frames_total', source=self.metrics_source)
+            self.update_fps()
+
+            packet['smoothed'] = smoothed
+            packet['tracking'] = tracking
+            if not self.headless:
+                self.stage_queues['display'].put(packet)
+            elif self.snapshot_requested:
+                self.snapshot_requested = False
+                self.save_snapshot(packet)
+
+    def publish_point(self, point: Optional[Tuple[float, float, float]], tracking: bool,
+                      depth_blob: Optional[bytes]):
+        """Send /depth now, or hand the point to the fixed-rate output stage"""
+        if self.output is None:
+            self.send_osc_data(point, tracking, depth_blob)
+        else:
+            self.output.submit(point or CENTER_POINT, tracking, depth_blob, self.stepped_filter)
+
+    def _output_stage(self):
+        """Pipeline stage: send /depth at the output rate, between and beyond the processed frames"""
+        interval = 1.0 / self.output.rate
+        next_due = time.perf_counter()
+        while not self.stop_event.is_set():
+            delay = next_due - time.perf_counter()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+            next_due += interval
+            if next_due < time.perf_counter():
+                # Fell behind (e.g. the machine stalled): skip the missed ticks
+                next_due = time.perf_counter() + interval
+            sample = self.output.point_at()
+            if sample is None:
+                continue
+            send_t0 = time.perf_counter()
+            self.send_osc_data(*sample)
+            self.observe_stage('output', time.perf_counter() - send_t0)
+
+    def draw_packet(self, packet):
+        """Render a pipeline packet into a display image"""
+        # Copy for display (into a reused buffer; the packet frame is a view of the capture ring)
+        display_frame = self.buffers['display'].get(packet['frame'].shape)
+        np.copyto(display_frame, packet['frame'])
+
+        if packet['detections'] is not None:
+            # Apply image enhancements only to display frame if needed (do NOT use for inference)
+            if self.show_enhanced:
+                display_frame = self.enhance_frame(display_frame)
+
+            # Draw detections on display frame
+            if self.show_detections:
+                self.draw_detections(display_frame, packet['detections'])
+                if packet['tracks'] is not None:
+                    self.draw_tracks(display_frame, packet['tracks'])
+                if packet['roi'] is not None:
+                    # Show the region the model actually saw
+                    crop_width = self.crop_x2 - self.crop_x1
+                    crop_height = self.crop_y2 - self.crop_y1
+                    rx1, ry1, rx2, ry2 = packet['roi']
+                    cv2.rectangle(display_frame,
+                                  (int(self.crop_x1 + rx1 * crop_width), int(self.crop_y1 + ry1 * crop_height)),
+                                  (int(self.crop_x1 + rx2 * crop_width), int(self.crop_y1 + ry2 * crop_height)),
+                                  (255, 0, 255), 1)
+
+                smoothed = packet['smoothed']
+                if smoothed:
+                    # Get dimensions of crop area
+                    crop_width = self.crop_x2 - self.crop_x1
+                    crop_height = self.crop_y2 - self.crop_y1
+
+                    # Map normalized coordinates to crop area using smoothed point
+                    avg_x = int(self.crop_x1 + (smoothed[0] * crop_width))
+                    avg_y = int(self.crop_y1 + (smoothed[1] * crop_height))
+
+                    # Draw average point
+                    cv2.circle(display_frame, (avg_x, avg_y), 10, (255, 0, 0), -1)
+                    cv2.putText(display_frame, "AVG", (avg_x + 15, avg_y),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+
+        self.draw_ui(display_frame)
+        return display_frame
+
+    def handle_key(self, key: int) -> bool:
+        """Apply a keyboard control. Returns False when the application should quit."""
+        if key == ord('q') or key == 27:  # Q or ESC
+            return False
+        elif key == ord('c'):
+            self.show_crop_interface = not self.show_crop_interface
+        elif key == ord('d'):
+            self.show_detections = not self.show_detections
+        elif key == ord('r'):
+            self.reset_crop()
+        elif key == ord('s'):
+            self.save_settings()
+        elif key == ord('e'):
+            self.show_enhanced = not self.show_enhanced
+        elif key == ord('b'):
+            # Toggle background subtraction
+            self.use_bg_subtraction = not self.use_bg_subtraction
+            print(f"Background subtraction: {self.use_bg_subtraction}")
+        elif key == ord('z'):
+            # Reset background model
+            self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=True)
+            print("Background model reset")
+        elif key == ord('k'):
+            # decrease learning rate (make model learn slower -> smaller magnitude)
+            if self.bg_subtract_learning_rate == -1:
+                self.bg_subtract_learning_rate = 0.001
+            else:
+                self.bg_subtract_learning_rate = max(0.0, self.bg_subtract_learning_rate - 0.001)
+            print(f"bg_subtract_learning_rate: {self.bg_subtract_learning_rate}")
+        elif key == ord('l'):
+            # increase learning rate
+            if self.bg_subtract_learning_rate == -1:
+                self.bg_subtract_learning_rate = 0.01
+            else:
+                self.bg_subtract_learning_rate = min(1.0, self.bg_subtract_learning_rate + 0.001)
+            print(f"bg_subtract_learning_rate: {self.bg_subtract_learning_rate}")
+        elif key == ord(' '):
+            self.paused = not self.paused
+        elif key == ord('a'):
+            self.enable_accumulation = not self.enable_accumulation
+            # Start from scratch instead of blending in frames from before the toggle
+            for accumulator in self.accumulators.values():
+                accumulator.reset()
+        elif key == ord('g'):
+            self.auto_gain = not self.auto_gain
+        elif key == ord('+'):
+            self.gain = min(self.gain + 0.1, 2.0)
+        elif key == ord('-'):
+            self.gain = max(self.gain - 0.1, 0.5)
+        elif key == ord('p'):
+            # Less smoothing (follow faster)
+            with self.point_filter_lock:
+                self.point_filter.tune(1)
+            print(self.point_filter.describe())
+        elif key == ord('o'):
+            # More smoothing
+            with self.point_filter_lock:
+                self.point_filter.tune(-1)
+            print(self.point_filter.describe())
+        elif key == ord('f'):
+            # Switch filter, keeping the current one's tuning for later. Under the lock
+            # so the publish stage never steps a half-swapped filter
+            names = list(POINT_FILTERS)
+            with self.point_filter_lock:
+                self.point_filter_params[self.point_filter.name] = self.point_filter.params()
+                name = names[(names.index(self.point_filter.name) + 1) % len(names)]
+                self.point_filter = self.make_point_filter(name)
+            print(self.point_filter.describe())
+        elif key == ord('m'):
+            # Toggle applying enhancement to inference frame
+            self.apply_enhancement_to_inference = not self.apply_enhancement_to_inference
+            print(f"apply_enhancement_to_inference: {self.apply_enhancement_to_inference}")
+        elif key == ord('u'): # Decrease processing frequency (process every more frames)
+            self.process_every_n_frames = min(self.process_every_n_frames + 1, 10)
+            print(f"Processing every {self.process_every_n_frames} frames")
+        elif key == ord('i'): # Increase processing frequency (process more often)
+            self.process_every_n_frames = max(self.process_every_n_frames - 1, 1)
+            print(f"Processing every {self.process_every_n_frames} frames")
+        elif key == ord('n'):
+            # Toggle adaptive region-of-interest inference
+            self.roi_enabled = not self.roi_enabled
+            self.roi_frames_since_full = 0
+            print(f"ROI inference: {self.roi_enabled}")
+        elif key == ord(','):
+            # Decrease confidence threshold
+            self.confidence_threshold = max(0.0, self.confidence_threshold - 0.05)
+            print(f"Confidence threshold: {self.confidence_threshold:.2f}")
+        elif key == ord('.'):
+            # Increase confidence threshold
+            self.confidence_threshold = min(1.0, self.confidence_threshold + 0.05)
+            print(f"Confidence threshold: {self.confidence_threshold:.2f}")
+        elif key == ord('t'):
+            # Start/stop the per-frame stage trace
+            self.tracer.toggle()
+        return True
+
+    def save_snapshot(self, packet):
+        """Render an annotated frame and write it to the snapshot folder"""
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            path = os.path.join(self.snapshot_dir, f"snapshot_{time.strftime('%Y%m%d_%H%M%S')}_{packet['seq']}.jpg")
+            cv2.imwrite(path, self.draw_packet(packet))
+            print(f"Snapshot saved: {path}")
+        except Exception as e:
+            print(f"Could not save snapshot: {e}")
+
+    def handle_command(self, command: str) -> bool:
+        """Apply a text control command. Returns False when the application should quit.
+
+        A single character maps to the same action as the keyboard shortcut;
+        'pause' toggles pause, 'trace' starts/stops the stage trace, 'snapshot' saves
+        an annotated frame and 'quit' exits.
+        """
+        command = command.strip()
+        if not command:
+            return True
+        if command.lower() == 'snapshot':
+            self.snapshot_requested = True
+            return True
+        if command.lower() in ('quit', 'exit'):
+            return False
+        if command.lower() == 'pause':
+            return self.handle_key(ord(' '))
+        if command.lower() == 'trace':
+            return self.handle_key(ord('t'))
+        if len(command) == 1:
+            return self.handle_key(ord(command))
+        print(f"Unknown command: {command}")
+        return True
+
+    def _read_control_commands(self):
+        """Read control commands from stdin without blocking the pipeline"""
+        try:
+            for line in sys.stdin:
+                self.control_commands.append(line)
+        except Exception:
+            pass
+
+    def start_pipeline(self, with_inference: bool = True):
+        """Start the capture thread and the preprocess/inference/publish stage threads.
+
+        with_inference=False leaves the inference queue to an external consumer
+        (the batched inference thread of MultiSourceDetector).
+        """
+        self.stop_event.clear()
+        # Start draining the camera on its own thread; the stages always pick up
+        # the latest frame (already flipped) and stale frames are dropped.
+        self.grabber.start()
+        self.stage_threads = []
+        stages = [('preprocess', self._preprocess_stage), ('publish', self._publish_stage)]
+        if self.output is not None:
+            stages.append(('output', self._output_stage))
+        if with_inference and self.inference_workers > 0:
+            self.pool_pending = {}
+            self.inference_pool = InferencePool(self.inference_workers, self.model_source,
+                                                self.inference_size, self.person_class_idx,
+                                                direct=self.direct_model is not None)
+            stages[1:1] = [('dispatch', self._pool_dispatch_stage), ('collect', self._pool_collect_stage)]
+        elif with_inference:
+            stages.insert(1, ('inference', self._inference_stage))
+        for name, target in stages:
+            t = threading.Thread(target=target, name=f"stage-{name}{self.name}")
+            t.daemon = True
+            t.start()
+            self.stage_threads.append(t)
+
+    def stop_pipeline(self):
+        """Signal all stage threads to finish and wait for them"""
+        self.stop_event.set()
+        for t in self.stage_threads:
+            t.join(timeout=2.0)
+        self.stage_threads = []
+        if self.inference_pool is not None:
+            self.inference_pool.close()
+            self.inference_pool = None
+
     def run(self):
-        """Main processing loop"""
+        """Main processing loop.
+
+        Capture, preprocess, inference and publish each run on their own thread and
+        hand frames over through bounded queues. This thread only renders the most
+        recent packet and handles keyboard input, so display never blocks publishing.
+        """
         print("Starting YOLO detection...")
+        if self.headless:
+            self.run_headless()
+            return
         print("Controls: C=crop toggle, D=detections toggle, R=reset crop, S=save, E=enhancement toggle, SPACE=pause, Q=quit")
         
         window_name = 'YOLO Person Detection OSC'
@@ -707,221 +3618,296 @@ class YOLODetectorOSC:
             cv2.namedWindow(window_name)
         
         cv2.setMouseCallback(window_name, self.mouse_callback)
-        
+
+        self.start_pipeline()
+
         try:
-            while True:
-                ret, frame = self.cap.read()
-                if not ret:
-                    # If we're using a video file, loop back to start
-                    if getattr(self, 'using_video_file', False):
-                        print("End of video reached, looping back to start")
-                        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        ret, frame = self.cap.read()
-                        if not ret:
-                            print("Failed to read from video after seeking to start")
-                            break
-                    else:
-                        print("Failed to read from camera")
-                        break
-                
-                frame = cv2.flip(frame, 1)
-                display_frame = frame.copy()  # Copy for display
-                
-                if not self.paused:
-                    # Only process every nth frame
-                    self.frame_count += 1
-                    if self.frame_count % self.process_every_n_frames == 0:
-                        # Get cropped frame first
-                        cropped_frame = self.get_cropped_image(frame)
-
-                        # Optionally apply background subtraction to the cropped frame
-                        if self.use_bg_subtraction:
-                            try:
-                                # Apply bg subtractor to obtain mask
-                                lr = self.bg_subtract_learning_rate
-                                mask = self.bg_subtractor.apply(cropped_frame, learningRate=lr)
-                                # Convert mask to 3-channel and apply
-                                mask3 = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
-                                cropped_frame = cv2.bitwise_and(cropped_frame, mask3)
-                            except Exception as e:
-                                # If bg subtraction fails, keep raw crop
-                                print(f"Background subtraction failed: {e}")
-                        
-                        if cropped_frame.size > 0:
-                            # If enhancement is to be applied to inference, run it on the full-size crop
-                            # This avoids mixing frame-buffer entries of different shapes and ensures
-                            # accumulation/gain are computed consistently.
-                            if self.apply_enhancement_to_inference:
-                                try:
-                                    enhanced_cropped = self.enhance_frame(cropped_frame, for_inference=True)
-                                except Exception:
-                                    enhanced_cropped = cropped_frame
-                                # Now resize the enhanced crop for inference
-                                h, w = enhanced_cropped.shape[:2]
-                                scale = min(self.inference_size / w, self.inference_size / h)
-                                if scale < 1:
-                                    inference_w = int(w * scale)
-                                    inference_h = int(h * scale)
-                                    inference_frame = cv2.resize(enhanced_cropped, (inference_w, inference_h))
-                                else:
-                                    inference_frame = enhanced_cropped
-                            else:
-                                # Resize for inference from the raw crop
-                                h, w = cropped_frame.shape[:2]
-                                scale = min(self.inference_size / w, self.inference_size / h)
-                                if scale < 1:
-                                    inference_w = int(w * scale)
-                                    inference_h = int(h * scale)
-                                    inference_frame = cv2.resize(cropped_frame, (inference_w, inference_h))
-                                else:
-                                    inference_frame = cropped_frame
-
-                            # Run detection on smaller frame
-                            inf_t0 = time.time()
-                            # Force model to use a small inference size to avoid internal upscaling
-                            try:
-                                results = self.model(inference_frame, imgsz=self.inference_size, verbose=False)
-                            except TypeError:
-                                # older ultralytics versions might not accept imgsz at call; fall back
-                                results = self.model(inference_frame, verbose=False)
-                            inf_t1 = time.time()
-                            inference_time = inf_t1 - inf_t0
-                            self.timing['inference'] += inference_time
-                            avg_point = self.calculate_average_point(results)
-                            tracking = avg_point is not None
-
-                            # Update smoothed point (weighted moving average)
-                            smoothed = self.update_smoothed_point(avg_point, tracking)
-
-                            # Send OSC data using smoothed point
-                            self.send_osc_data(smoothed, tracking)
-                            
-                            # Apply image enhancements only to display frame if needed (do NOT use for inference)
-                            if self.show_enhanced:
-                                display_frame = self.enhance_frame(display_frame)
-                            
-                            # Draw detections on display frame
-                            if self.show_detections:
-                                self.draw_detections(display_frame, results)
-                                
-                                # In the run method, replace the avg_point drawing section:
-                                if smoothed:
-                                    # Get dimensions of crop area
-                                    crop_width = self.crop_x2 - self.crop_x1
-                                    crop_height = self.crop_y2 - self.crop_y1
-
-                                    # Map normalized coordinates to crop area using smoothed point
-                                    avg_x = int(self.crop_x1 + (smoothed[0] * crop_width))
-                                    avg_y = int(self.crop_y1 + (smoothed[1] * crop_height))
-
-                                    # Draw average point
-                                    cv2.circle(display_frame, (avg_x, avg_y), 10, (255, 0, 0), -1)
-                                    cv2.putText(display_frame, "AVG", (avg_x + 15, avg_y),
-                                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
-                
-                # Measure draw/UI/display time
-                draw_t0 = time.time()
-                self.draw_ui(display_frame)
-                self.update_fps()
-                cv2.imshow(window_name, display_frame)
-                draw_t1 = time.time()
-                draw_time = draw_t1 - draw_t0
-                self.timing['draw'] += draw_time
-
-                # Accumulate decode/preprocess counts and print timing once per second
-                self.timing_count += 1
-                now = time.time()
-                if now - self.timing_last_print >= 1.0:
-                    # compute averages
-                    count = max(1, self.timing_count)
-                    avg_decode = self.timing['decode'] / count
-                    avg_pre = self.timing['preprocess'] / count
-                    avg_inf = self.timing['inference'] / count
-                    avg_draw = self.timing['draw'] / count
-                    print(f"Timing (s/frame) - decode: {avg_decode:.4f}, preprocess: {avg_pre:.4f}, inference: {avg_inf:.4f}, draw: {avg_draw:.4f}, fps: {self.current_fps}")
-                    # reset accumulators
-                    self.timing = {'decode': 0.0, 'preprocess': 0.0, 'inference': 0.0, 'draw': 0.0}
-                    self.timing_count = 0
-                    self.timing_last_print = now
-                
+            while not self.stop_event.is_set():
+                packet = self.stage_queues['display'].get(timeout=0.05)
+                if packet is not None:
+                    # Measure draw/UI/display time
+                    draw_t0 = time.time()
+                    display_frame = self.draw_packet(packet)
+                    show_t0 = time.perf_counter()
+                    cv2.imshow(window_name, display_frame)
+                    if self.tracer.enabled:
+                        self.tracer.span('imshow', time.perf_counter() - show_t0, packet['seq'], self.metrics_source)
+                    with self.timing_lock:
+                        self.timing['draw'] += time.time() - draw_t0
+                        self.timing_draws += 1
+                    self.observe_stage('draw', time.time() - draw_t0, packet['seq'])
+                    self.tracer.set_frame(packet['seq'])
+
+                self.report_timing()
+
+                key_t0 = time.perf_counter()
                 key = cv2.waitKey(1) & 0xFF
-                if key == ord('q') or key == 27:  # Q or ESC
+                if self.tracer.enabled:
+                    # HighGUI repaints the window here, so this belongs to the last shown frame
+                    self.tracer.span('wait_key', time.perf_counter() - key_t0, None, self.metrics_source)
+                if not self.handle_key(key):
                     break
-                elif key == ord('c'):
-                    self.show_crop_interface = not self.show_crop_interface
-                elif key == ord('d'):
-                    self.show_detections = not self.show_detections
-                elif key == ord('r'):
-                    self.reset_crop()
-                elif key == ord('s'):
-                    self.save_settings()
-                elif key == ord('e'):
-                    self.show_enhanced = not self.show_enhanced
-                elif key == ord('b'):
-                    # Toggle background subtraction
-                    self.use_bg_subtraction = not self.use_bg_subtraction
-                    print(f"Background subtraction: {self.use_bg_subtraction}")
-                elif key == ord('z'):
-                    # Reset background model
-                    self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=True)
-                    print("Background model reset")
-                elif key == ord('k'):
-                    # decrease learning rate (make model learn slower -> smaller magnitude)
-                    if self.bg_subtract_learning_rate == -1:
-                        self.bg_subtract_learning_rate = 0.001
-                    else:
-                        self.bg_subtract_learning_rate = max(0.0, self.bg_subtract_learning_rate - 0.001)
-                    print(f"bg_subtract_learning_rate: {self.bg_subtract_learning_rate}")
-                elif key == ord('l'):
-                    # increase learning rate
-                    if self.bg_subtract_learning_rate == -1:
-                        self.bg_subtract_learning_rate = 0.01
-                    else:
-                        self.bg_subtract_learning_rate = min(1.0, self.bg_subtract_learning_rate + 0.001)
-                    print(f"bg_subtract_learning_rate: {self.bg_subtract_learning_rate}")
-                elif key == ord(' '):
-                    self.paused = not self.paused
-                elif key == ord('a'):
-                    self.enable_accumulation = not self.enable_accumulation
-                elif key == ord('g'):
-                    self.auto_gain = not self.auto_gain
-                elif key == ord('+'):
-                    self.gain = min(self.gain + 0.1, 2.0)
-                elif key == ord('-'):
-                    self.gain = max(self.gain - 0.1, 0.5)
-                elif key == ord('p'):
-                    # Increase smoothing alpha (less smoothing)
-                    self.smoothing_alpha = min(0.95, self.smoothing_alpha + 0.05)
-                    print(f"Smoothing alpha: {self.smoothing_alpha:.3f}")
-                elif key == ord('o'):
-                    # Decrease smoothing alpha (more smoothing)
-                    self.smoothing_alpha = max(0.01, self.smoothing_alpha - 0.05)
-                    print(f"Smoothing alpha: {self.smoothing_alpha:.3f}")
-                elif key == ord('m'):
-                    # Toggle applying enhancement to inference frame
-                    self.apply_enhancement_to_inference = not self.apply_enhancement_to_inference
-                    print(f"apply_enhancement_to_inference: {self.apply_enhancement_to_inference}")
-                elif key == ord('u'): # Decrease processing frequency (process every more frames)
-                    self.process_every_n_frames = min(self.process_every_n_frames + 1, 10)
-                    print(f"Processing every {self.process_every_n_frames} frames")
-                elif key == ord('i'): # Increase processing frequency (process more often)
-                    self.process_every_n_frames = max(self.process_every_n_frames - 1, 1)
-                    print(f"Processing every {self.process_every_n_frames} frames")
-                elif key == ord(','):
-                    # Decrease confidence threshold
-                    self.confidence_threshold = max(0.0, self.confidence_threshold - 0.05)
-                    print(f"Confidence threshold: {self.confidence_threshold:.2f}")
-                elif key == ord('.'):
-                    # Increase confidence threshold
-                    self.confidence_threshold = min(1.0, self.confidence_threshold + 0.05)
-                    print(f"Confidence threshold: {self.confidence_threshold:.2f}")
                     
         except KeyboardInterrupt:
             print("\nInterrupted by user")
         finally:
+            self.stop_pipeline()
             self.cleanup()
 
+    def run_headless(self):
+        """Main loop without any window or drawing work"""
+        print("Headless mode: type a control key or 'snapshot' / 'quit' followed by Enter")
+        reader = threading.Thread(target=self._read_control_commands, name="control")
+        reader.daemon = True
+        reader.start()
+
+        self.start_pipeline()
+
+        try:
+            while not self.stop_event.wait(0.05):
+                self.report_timing()
+                running = True
+                while self.control_commands and running:
+                    running = self.handle_command(self.control_commands.popleft())
+                if not running:
+                    break
+        except KeyboardInterrupt:
+            print("\nInterrupted by user")
+        finally:
+            self.stop_pipeline()
+            self.cleanup()
+
+class MultiSourceDetector:
+    """Several cameras/videos served by one process and one shared model.
+
+    Every source gets its own YOLODetectorOSC (crop, settings file, smoothing,
+    capture and publish threads), but only the first one loads the model. A single
+    inference thread collects the frames that are ready on each tick, runs them
+    through the model as one batch and hands each result back to its source.
+
+    routing='ports' gives source i its own server on osc_port + i (each poster
+    connects as usual); routing='addresses' publishes every source through the
+    first server as /depth/<i> and /people/<i>.
+    """
+
+    ROUTING_MODES = ('ports', 'addresses')
+
+    def __init__(self, sources, routing: str = 'ports', osc_port: int = 8025, **detector_kwargs):
+        if routing not in self.ROUTING_MODES:
+            raise ValueError(f"Unknown routing: {routing} (choose from {', '.join(self.ROUTING_MODES)})")
+        self.routing = routing
+        self.headless = detector_kwargs.get('headless', False)
+        self.stop_event = threading.Event()
+        self.control_commands = deque()
+        # Set by every source's inference queue so the batch thread wakes on any new frame
+        self.frames_ready = threading.Event()
+        self.batch_thread = None
+        self.active = 0  # source that receives keyboard input
+
+        self.detectors = []
+        for i, source in enumerate(sources):
+            primary = self.detectors[0] if self.detectors else None
+            kwargs = dict(detector_kwargs)
+            kwargs.update(
+                source=str(source),
+                name=f"cam{i}",
+                settings_file="detector_settings.json" if i == 0 else f"detector_settings_{i}.json",
+                shared_model_from=primary,
+            )
+            if primary is not None:
+                # One metrics registry and endpoint for all sources (labelled source="cam<i>")
+                kwargs['metrics'] = primary.metrics
+                kwargs['metrics_port'] = 0
+                kwargs['tracer'] = primary.tracer
+            if routing == 'ports':
+                kwargs['osc_port'] = osc_port + i
+            else:
+                kwargs['osc_port'] = osc_port
+                kwargs['address_suffix'] = f"/{i}"
+                kwargs['transport_owner'] = primary
+            print(f"Source {i}: {source}")
+            detector = YOLODetectorOSC(**kwargs)
+            detector.stage_queues['inference'].ready_event = self.frames_ready
+            self.detectors.append(detector)
+        self.tracer = self.detectors[0].tracer
+
+    def run_batch(self, frames):
+        """Run the shared model on a list of prepared frames: one result list (or detection array) per frame"""
+        primary = self.detectors[0]
+        if primary.direct_model is not None:
+            # One preallocated input tensor: frames go through one after another and
+            # come back as detections, at the lowest threshold of all sources
+            threshold = min(d.confidence_threshold for d in self.detectors)
+            return [primary.direct_model.detect(frame, threshold) for frame in frames]
+        if primary.backend != 'torch':
+            # Exported ONNX/OpenVINO models have a fixed batch size of 1
+            return [primary.run_inference(frame) for frame in frames]
+        results = primary.run_inference(frames)
+        return [results[i:i + 1] for i in range(len(frames))]
+
+    def _batched_inference_stage(self):
+        """Pipeline stage: one model call per tick for every source with a frame waiting"""
+        while not self.stop_event.is_set():
+            if not self.frames_ready.wait(0.5):
+                continue
+            self.frames_ready.clear()
+            batch = []
+            for detector in self.detectors:
+                packet = detector.stage_queues['inference'].get(timeout=0)
+                if packet is not None:
+                    batch.append((detector, packet))
+            if not batch:
+                continue
+            inf_t0 = time.time()
+            try:
+                results = self.run_batch([packet['inference_frame'] for _, packet in batch])
+            except Exception as e:
+                print(f"Batched inference failed: {e}")
+                continue
+            # Each source is charged its share of the batch, i.e. the per-frame cost
+            share = (time.time() - inf_t0) / len(batch)
+            for (detector, packet), result in zip(batch, results):
+                if isinstance(result, np.ndarray):
+                    packet['detections'] = result
+                else:
+                    packet['results'] = result
+                detector.add_timing('inference', share)
+                detector.observe_stage('inference', share, packet['seq'])
+                detector.stage_queues['publish'].put(packet)
+
+    def start(self):
+        """Start every source pipeline plus the shared inference thread"""
+        self.stop_event.clear()
+        for detector in self.detectors:
+            detector.start_pipeline(with_inference=False)
+        self.batch_thread = threading.Thread(target=self._batched_inference_stage, name="stage-inference-batched")
+        self.batch_thread.daemon = True
+        self.batch_thread.start()
+
+    def stop(self):
+        """Stop the shared inference thread and every source pipeline"""
+        self.stop_event.set()
+        if self.batch_thread is not None:
+            self.batch_thread.join(timeout=2.0)
+            self.batch_thread = None
+        for detector in self.detectors:
+            detector.stop_pipeline()
+            detector.cleanup()
+
+    def running(self) -> bool:
+        """True while at least one source is still delivering frames"""
+        return not self.stop_event.is_set() and any(not d.stop_event.is_set() for d in self.detectors)
+
+    def handle_command(self, command: str) -> bool:
+        """Apply a text command; '<index>:<command>' targets one source, anything else all of them"""
+        command = command.strip()
+        index, sep, rest = command.partition(':')
+        if sep and index.isdigit():
+            if int(index) >= len(self.detectors):
+                print(f"No source {index}")
+                return True
+            return self.detectors[int(index)].handle_command(rest)
+        if command.lower() in ('t', 'trace'):
+            # One tracer for all sources: toggle it once
+            return self.detectors[0].handle_command(command)
+        running = True
+        for detector in self.detectors:
+            running = detector.handle_command(command) and running
+        return running
+
+    def _make_mouse_callback(self, index: int):
+        """Mouse handler for one source window; clicking a window also makes it active"""
+        def callback(event, x, y, flags, param):
+            if event == cv2.EVENT_LBUTTONDOWN and self.active != index:
+                self.active = index
+                print(f"Keyboard controls now apply to source {index}")
+            self.detectors[index].mouse_callback(event, x, y, flags, param)
+        return callback
+
+    def run(self):
+        """Show one window per source (or run headless) until quit"""
+        print(f"Starting YOLO detection on {len(self.detectors)} sources...")
+        if self.headless:
+            self.run_headless()
+            return
+        print("Click a window to direct keyboard controls to that source; Q quits all")
+        window_names = []
+        for i, detector in enumerate(self.detectors):
+            window_name = f'YOLO Person Detection OSC [{i}]'
+            try:
+                cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+            except:
+                cv2.namedWindow(window_name)
+            cv2.setMouseCallback(window_name, self._make_mouse_callback(i))
+            window_names.append(window_name)
+
+        self.start()
+
+        try:
+            while self.running():
+                for detector, window_name in zip(self.detectors, window_names):
+                    packet = detector.stage_queues['display'].get(timeout=0)
+                    if packet is not None:
+                        draw_t0 = time.time()
+                        display_frame = detector.draw_packet(packet)
+                        show_t0 = time.perf_counter()
+                        cv2.imshow(window_name, display_frame)
+                        if self.tracer.enabled:
+                            self.tracer.span('imshow', time.perf_counter() - show_t0, packet['seq'], detector.metrics_source)
+                        with detector.timing_lock:
+                            detector.timing['draw'] += time.time() - draw_t0
+                            detector.timing_draws += 1
+                        detector.observe_stage('draw', time.time() - draw_t0, packet['seq'])
+                    detector.report_timing()
+
+                key_t0 = time.perf_counter()
+                key = cv2.waitKey(5) & 0xFF
+                if self.tracer.enabled:
+                    self.tracer.span('wait_key', time.perf_counter() - key_t0, 0)
+                if key == ord('q') or key == 27:
+                    break
+                self.detectors[self.active].handle_key(key)
+        except KeyboardInterrupt:
+            print("\nInterrupted by user")
+        finally:
+            self.stop()
+
+    def run_headless(self):
+        """Main loop without any window; stdin commands may be prefixed with a source index"""
+        print("Headless mode: type a control key or 'snapshot' / 'quit' followed by Enter; prefix with '<index>:' for one source")
+        reader = threading.Thread(target=self._read_control_commands, name="control")
+        reader.daemon = True
+        reader.start()
+
+        self.start()
+
+        try:
+            while self.running():
+                time.sleep(0.05)
+                for detector in self.detectors:
+                    detector.report_timing()
+                running = True
+                while self.control_commands and running:
+                    running = self.handle_command(self.control_commands.popleft())
+                if not running:
+                    break
+        except KeyboardInterrupt:
+            print("\nInterrupted by user")
+        finally:
+            self.stop()
+
+    def _read_control_commands(self):
+        """Read control commands from stdin without blocking the pipelines"""
+        try:
+            for line in sys.stdin:
+                self.control_commands.append(line)
+        except Exception:
+            pass
+
+
 def main():
+    startup = StartupTimer()
+    startup.add('imports', PROCESS_START)
     parser = argparse.ArgumentParser(description='YOLO Person Detection with OSC Output')
     parser.add_argument('--osc-host', default='127.0.0.1', help='OSC host address')
     parser.add_argument('--osc-port', type=int, default=8025, help='OSC port')
@@ -931,43 +3917,136 @@ def main():
     parser.add_argument('--weights', default=None, help='Path to custom weights (.pt) to load')
     parser.add_argument('--use-exdark', action='store_true', help='Search local exdark folder for trained weights and use them')
     parser.add_argument('--exdark-path', default='./exdark', help='Path to local exdark repo/folder')
+    parser.add_argument('--rescan-weights', action='store_true',
+                        help='Rebuild the cached index of exdark weights (<model-cache>/weights_index.json)')
+    parser.add_argument('--backend', default='torch', choices=INFERENCE_BACKENDS,
+                        help='Inference runtime; onnx/openvino export the weights once and cache them')
+    parser.add_argument('--model-cache', default='model_cache', help='Folder for exported ONNX/OpenVINO models')
+    parser.add_argument('--direct-inference', action='store_true',
+                        help='Feed the network from a preallocated input tensor, bypassing the Ultralytics predictor (torch/onnx)')
+    parser.add_argument('--inference-threads', type=int, default=0,
+                        help='CPU threads for direct inference (0 = runtime default)')
+    parser.add_argument('--warmup', type=int, default=3, help='Number of warm-up inference passes at startup')
+    parser.add_argument('--depth-source', default='none', choices=DEPTH_SOURCES,
+                        help='What fills the /depth blob: person boxes, MOG2 foreground, both, or nothing (the 1-byte blob)')
+    parser.add_argument('--depth-grid', default='160x140', help='Depth grid size WxH (poster library expects 160x140)')
+    parser.add_argument('--depth-raw', action='store_true',
+                        help='Send the depth grid uncompressed on /depth (default: run-length encoded on /depth_rle)')
+    parser.add_argument('--multi-person', action='store_true', help='Track individual people and send them on /people')
+    parser.add_argument('--point-filter', default=None, choices=list(POINT_FILTERS),
+                        help='Filter for the published point (default: from the settings file, else ema; F cycles)')
+    parser.add_argument('--max-prediction', type=float, default=0.1,
+                        help='Extrapolate the point by at most this many seconds of capture-to-send latency (0 = off)')
+    parser.add_argument('--output-rate', type=float, default=0.0,
+                        help='Send /depth at this fixed rate in Hz, e.g. 60, between processed frames (0 = once per processed frame)')
+    parser.add_argument('--roi', action='store_true', help='Run inference on a region around the last detections (periodic full scans)')
+    parser.add_argument('--motion-gate', action='store_true', help='Skip inference while the scene is static and empty')
+    parser.add_argument('--motion-threshold', type=float, default=0.005, help='Fraction of changed pixels that counts as motion')
+    parser.add_argument('--idle-scan-interval', type=float, default=2.0, help='Seconds between forced scans while idle')
+    parser.add_argument('--accumulation-window', type=int, default=3, help='Frames averaged by temporal accumulation (A key)')
+    parser.add_argument('--accumulation-mode', default='window', choices=ACCUMULATION_MODES,
+                        help='Temporal accumulation: box average over the window or exponential decay')
+    parser.add_argument('--capture-mode', default='auto',
+                        help="Camera resolution: auto (smallest mode covering the crop), native (driver default) or WxH")
+    parser.add_argument('--capture-format', default='auto', choices=CAPTURE_FORMATS,
+                        help='Camera pixel format; auto uses YUYV when it fits USB 2.0 bandwidth, else MJPG')
+    parser.add_argument('--capture-fps', type=float, default=30.0, help='Camera frame rate to request')
+    parser.add_argument('--capture-detail', type=float, default=1.5,
+                        help='auto mode: crop must keep this many times the inference size in pixels')
+    parser.add_argument('--headless', action='store_true', help='Run without preview window or drawing (controls via stdin)')
+    parser.add_argument('--queue-size', type=int, default=1, help='Max frames waiting between pipeline stages')
+    parser.add_argument('--drop-policy', default='drop_oldest', choices=StageQueue.DROP_POLICIES,
+                        help='What a full pipeline queue does with new frames')
+    parser.add_argument('--frame-ring-slots', type=int, default=8,
+                        help='Captured frames kept in the shared-memory ring (other processes can attach to it)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Run inference in N worker processes (0 = in the main process)')
+    parser.add_argument('--ws-max-latency', type=float, default=0.5,
+                        help='WebSocket send lag (s) above which a client counts as too slow')
+    parser.add_argument('--ws-evict-after', type=float, default=5.0,
+                        help='Disconnect a WebSocket client that stays too slow for this many seconds')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Serve Prometheus-style metrics on http://<osc-host>:PORT/metrics (0 = off)')
+    parser.add_argument('--trace', action='store_true',
+                        help='Start with per-frame stage tracing on (toggle at runtime with T, "trace" or SIGUSR1)')
+    parser.add_argument('--trace-dir', default='traces', help='Folder for the rolling Chrome/Perfetto trace files')
+    parser.add_argument('--trace-files', type=int, default=10, help='Trace files kept on disk (oldest are deleted)')
+    parser.add_argument('--trace-seconds', type=float, default=10.0, help='Seconds of spans per trace file')
+    parser.add_argument('--sources', nargs='+', default=None,
+                        help='Several camera IDs and/or video files served by one shared model')
+    parser.add_argument('--source-routing', default='ports', choices=MultiSourceDetector.ROUTING_MODES,
+                        help='Multi-source output: one port per source, or /depth/<i> addresses on one port')
     
     args = parser.parse_args()
+    try:
+        depth_grid = tuple(int(v) for v in args.depth_grid.lower().split('x'))
+        if len(depth_grid) != 2 or min(depth_grid) <= 0:
+            raise ValueError
+    except ValueError:
+        print(f"Invalid --depth-grid '{args.depth_grid}', expected WxH like 160x140")
+        return 1
     # Determine which weights to use (explicit weights override --use-exdark)
     weights_to_use = args.weights
     if args.use_exdark and not weights_to_use:
-        # search the exdark path for likely weights (best.pt, last.pt)
-        exdark_dir = os.path.expanduser(args.exdark_path)
-        found = []
-        if os.path.exists(exdark_dir):
-            for root, dirs, files in os.walk(exdark_dir):
-                for f in files:
-                    if f.endswith('.pt') and ('best' in f.lower() or 'last' in f.lower()):
-                        found.append(os.path.join(root, f))
-        # If none found, also scan for any .pt
-        if not found and os.path.exists(exdark_dir):
-            for root, dirs, files in os.walk(exdark_dir):
-                for f in files:
-                    if f.endswith('.pt'):
-                        found.append(os.path.join(root, f))
-
-        if found:
-            # prefer best.pt over last.pt
-            found.sort(key=lambda p: (0 if 'best' in os.path.basename(p).lower() else 1, p))
-            weights_to_use = found[0]
-            print(f"Using EXDark weights found at: {weights_to_use}")
-        else:
-            print(f"No .pt weights found under {exdark_dir}; falling back to default model")
+        lookup_t0 = time.perf_counter()
+        weights_to_use = find_exdark_weights(args.exdark_path, os.path.join(args.model_cache, 'weights_index.json'),
+                                             args.rescan_weights)
+        startup.add('weights_lookup', lookup_t0)
+
+    tracer = FrameTracer(args.trace_dir, args.trace_files, args.trace_seconds)
+    if hasattr(signal, 'SIGUSR1'):
+        # Kiosks without a keyboard: `kill -USR1 <pid>` starts/stops tracing. The
+        # toggle runs on its own thread since it may write a file and take locks.
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=tracer.toggle, daemon=True).start())
+    if args.trace:
+        tracer.start()
 
     try:
-        detector = YOLODetectorOSC(
+        detector_kwargs = dict(
             osc_host=args.osc_host,
-            osc_port=args.osc_port,
-            camera_id=args.camera,
             model_name=args.model,
             weights_path=weights_to_use,
-            confidence_threshold=args.confidence
+            confidence_threshold=args.confidence,
+            queue_size=args.queue_size,
+            drop_policy=args.drop_policy,
+            headless=args.headless,
+            backend=args.backend,
+            model_cache_dir=args.model_cache,
+            warmup_runs=args.warmup,
+            depth_source=args.depth_source,
+            depth_grid=depth_grid,
+            depth_rle=not args.depth_raw,
+            multi_person=args.multi_person,
+            roi_mode=args.roi,
+            motion_gate=args.motion_gate,
+            motion_threshold=args.motion_threshold,
+            idle_scan_interval=args.idle_scan_interval,
+            accumulation_window=args.accumulation_window,
+            accumulation_mode=args.accumulation_mode,
+            frame_ring_slots=args.frame_ring_slots,
+            ws_max_latency=args.ws_max_latency,
+            ws_evict_after=args.ws_evict_after,
+            metrics_port=args.metrics_port,
+            tracer=tracer,
+            capture_mode=args.capture_mode,
+            capture_format=args.capture_format,
+            capture_fps=args.capture_fps,
+            capture_detail=args.capture_detail,
+            direct_inference=args.direct_inference,
+            inference_threads=args.inference_threads,
+            point_filter=args.point_filter,
+            max_prediction=args.max_prediction,
+            output_rate=args.output_rate,
+            startup=startup
         )
+        if args.sources:
+            if args.workers > 0:
+                print("--workers is ignored with --sources (sources share one batched model call)")
+            detector = MultiSourceDetector(args.sources, routing=args.source_routing,
+                                           osc_port=args.osc_port, **detector_kwargs)
+        else:
+            detector = YOLODetectorOSC(osc_port=args.osc_port, camera_id=args.camera,
+                                       inference_workers=args.workers, **detector_kwargs)
         detector.run()
     except Exception as e:
         print(f"Failed to start detector: {e}")
@@ -0,0 +1,306 @@
+"""INT8 quantization of the person detector with an INT8 vs FP32 report.
+
+Calibration frames are sampled from our own recordings (video.MOV by default),
+cropped and resized exactly like YOLODetectorOSC does before inference. The FP32
+ONNX export is quantized with ONNX Runtime static quantization and written to the
+model cache, where `pose_detector_yoloV8.py --backend onnx-int8` picks it up.
+
+The report compares both models on a separate set of frames from the same clips.
+There are no ground-truth labels, so the FP32 detections are the reference:
+- person recall: share of FP32 person boxes matched by an INT8 box (IoU >= 0.5)
+- average-point error: distance between the weighted average points
+- per-frame latency of both models
+"""
+import argparse
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from pose_detector_yoloV8 import (YOLO_AVAILABLE, cached_model_path, export_model_cached,
+                                  extract_person_detections, find_person_class_idx, find_test_video,
+                                  import_yolo, iou_matrix, remap_crop, weighted_average_point)
+
+
+def load_crop(settings_file: str) -> Optional[Tuple[Tuple[int, int, int, int], Optional[Tuple[int, int]]]]:
+    """Read the crop rectangle saved by the detector and the frame size it refers to, if any"""
+    if not os.path.exists(settings_file):
+        return None
+    try:
+        with open(settings_file, 'r') as f:
+            settings = json.load(f)
+        rect = (int(settings['crop_x1']), int(settings['crop_y1']),
+                int(settings['crop_x2']), int(settings['crop_y2']))
+        size = (int(settings['frame_width']), int(settings['frame_height'])) if 'frame_width' in settings else None
+        return rect, size
+    except Exception as e:
+        print(f"Could not read crop from {settings_file}: {e}")
+        return None
+
+
+def prepare_frame(frame, crop, inference_size: int):
+    """Flip, crop and downscale a frame the same way the detector pipeline does"""
+    frame = cv2.flip(frame, 1)
+    if crop:
+        rect, size = crop
+        h, w = frame.shape[:2]
+        # The clip may have another resolution than the one the crop was saved at
+        x1, y1, x2, y2 = remap_crop(rect, size or (w, h), (w, h))
+        frame = frame[y1:y2, x1:x2]
+    h, w = frame.shape[:2]
+    scale = min(inference_size / w, inference_size / h)
+    if scale < 1:
+        frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
+    return frame
+
+
+def sample_frames(videos: List[str], count: int, offset: float, crop, inference_size: int) -> list:
+    """Sample `count` frames evenly across all clips.
+
+    `offset` (0..1) shifts the sample positions by a fraction of the step so that
+    calibration and evaluation frames don't overlap.
+    """
+    frames = []
+    per_clip = max(1, count // max(1, len(videos)))
+    for video in videos:
+        cap = cv2.VideoCapture(video)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if not cap.isOpened() or total <= 0:
+            print(f"Skipping unreadable clip: {video}")
+            continue
+        step = total / per_clip
+        for i in range(per_clip):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(i * step + offset * step) % total)
+            ret, frame = cap.read()
+            if ret:
+                frames.append(prepare_frame(frame, crop, inference_size))
+        cap.release()
+    return frames
+
+
+def letterbox(image, size: int):
+    """Resize keeping aspect ratio and pad to size x size (as Ultralytics does)"""
+    h, w = image.shape[:2]
+    scale = min(size / w, size / h)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top = (size - new_h) // 2
+    left = (size - new_w) // 2
+    return cv2.copyMakeBorder(image, top, size - new_h - top, left, size - new_w - left,
+                              cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+
+def to_model_input(image, size: int):
+    """BGR uint8 HWC -> RGB float32 NCHW in 0..1"""
+    rgb = cv2.cvtColor(letterbox(image, size), cv2.COLOR_BGR2RGB)
+    return np.ascontiguousarray(rgb.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def quantize(fp32_path: str, int8_path: str, frames: list, inference_size: int):
+    """Statically quantize an ONNX model using our own frames for calibration"""
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_static)
+
+    input_name = onnx.load(fp32_path, load_external_data=False).graph.input[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.iterator = iter(frames)
+
+        def get_next(self):
+            frame = next(self.iterator, None)
+            if frame is None:
+                return None
+            return {input_name: to_model_input(frame, inference_size)}
+
+    # Shape inference / graph cleanup recommended before static quantization
+    source = fp32_path
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        source = fp32_path.replace('.onnx', '_prep.onnx')
+        quant_pre_process(fp32_path, source)
+    except Exception as e:
+        print(f"Quantization pre-processing skipped: {e}")
+        source = fp32_path
+
+    quantize_static(source, int8_path, FrameReader(),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True)
+    if source != fp32_path:
+        os.remove(source)
+
+    # Keep the Ultralytics metadata (class names, imgsz, stride) on the INT8 model
+    src = onnx.load(fp32_path)
+    dst = onnx.load(int8_path)
+    del dst.metadata_props[:]
+    dst.metadata_props.extend(src.metadata_props)
+    onnx.save(dst, int8_path)
+    print(f"INT8 model written to: {int8_path}")
+
+
+def matched_count(reference: np.ndarray, candidate: np.ndarray, iou_threshold: float = 0.5) -> int:
+    """Greedy one-to-one matching of candidate boxes onto reference boxes"""
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0
+    ious = iou_matrix(reference, candidate)
+    matched = 0
+    while ious.size and ious.max() >= iou_threshold:
+        r, c = np.unravel_index(np.argmax(ious), ious.shape)
+        matched += 1
+        ious[r, :] = -1
+        ious[:, c] = -1
+    return matched
+
+
+def run_model(model, frames: list, inference_size: int, person_class_idx, confidence_threshold: float) -> dict:
+    """Run a model over the frames, returning boxes, average points and latencies"""
+    boxes, points, latencies = [], [], []
+    for frame in frames:
+        t0 = time.perf_counter()
+        results = model(frame, imgsz=inference_size, verbose=False)
+        latencies.append(time.perf_counter() - t0)
+        detections = extract_person_detections(results, person_class_idx, confidence_threshold)
+        boxes.append(detections[:, :4])
+        points.append(weighted_average_point(detections))
+    return {'boxes': boxes, 'points': points, 'latencies': np.array(latencies)}
+
+
+def latency_summary(latencies: np.ndarray) -> dict:
+    return {
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+def build_report(fp32: dict, int8: dict, args) -> dict:
+    reference_total = sum(len(b) for b in fp32['boxes'])
+    matched = sum(matched_count(r, c) for r, c in zip(fp32['boxes'], int8['boxes']))
+    recall = matched / reference_total if reference_total else 1.0
+
+    errors = []
+    tracking_mismatch = 0
+    for p_ref, p_int8 in zip(fp32['points'], int8['points']):
+        if (p_ref is None) != (p_int8 is None):
+            tracking_mismatch += 1
+        elif p_ref is not None:
+            errors.append(float(np.hypot(p_ref[0] - p_int8[0], p_ref[1] - p_int8[1])))
+    errors = np.array(errors) if errors else np.zeros(1)
+
+    fp32_latency = latency_summary(fp32['latencies'])
+    int8_latency = latency_summary(int8['latencies'])
+    within_tolerance = (recall >= args.min_recall
+                        and float(np.percentile(errors, 95)) <= args.max_point_error
+                        and tracking_mismatch / max(1, len(fp32['points'])) <= args.max_tracking_mismatch)
+    return {
+        'frames': len(fp32['points']),
+        'confidence_threshold': args.confidence,
+        'inference_size': args.inference_size,
+        'person_recall_vs_fp32': recall,
+        'fp32_person_boxes': reference_total,
+        'avg_point_error': {
+            'mean': float(errors.mean()),
+            'p95': float(np.percentile(errors, 95)),
+            'max': float(errors.max()),
+        },
+        'tracking_mismatch_frames': tracking_mismatch,
+        'latency_fp32': fp32_latency,
+        'latency_int8': int8_latency,
+        'speedup': fp32_latency['mean_ms'] / max(1e-6, int8_latency['mean_ms']),
+        'tolerance': {
+            'min_recall': args.min_recall,
+            'max_point_error_p95': args.max_point_error,
+            'max_tracking_mismatch': args.max_tracking_mismatch,
+        },
+        'within_tolerance': bool(within_tolerance),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='INT8 quantization of the YOLO person detector with FP32 comparison report')
+    parser.add_argument('--model', default='yolov8n.pt', help='YOLO model name')
+    parser.add_argument('--weights', default=None, help='Path to custom weights (.pt) to quantize')
+    parser.add_argument('--videos', nargs='*', default=None, help='Recorded clips for calibration/evaluation (default: video.MOV)')
+    parser.add_argument('--inference-size', type=int, default=256, help='Inference size used by the detector')
+    parser.add_argument('--confidence', type=float, default=0.5, help='Confidence threshold')
+    parser.add_argument('--settings', default='detector_settings.json', help='Detector settings file with the crop')
+    parser.add_argument('--calib-frames', type=int, default=100, help='Number of calibration frames')
+    parser.add_argument('--eval-frames', type=int, default=200, help='Number of evaluation frames')
+    parser.add_argument('--model-cache', default='model_cache', help='Folder for exported models')
+    parser.add_argument('--min-recall', type=float, default=0.95, help='Tolerance: minimum person recall vs FP32')
+    parser.add_argument('--max-point-error', type=float, default=0.02, help='Tolerance: max p95 average-point error (normalized)')
+    parser.add_argument('--max-tracking-mismatch', type=float, default=0.02, help='Tolerance: max share of frames where tracking differs')
+    parser.add_argument('--report', default='int8_report.json', help='Where to write the JSON report')
+    parser.add_argument('--skip-quantize', action='store_true', help='Only evaluate an existing INT8 model')
+    args = parser.parse_args()
+
+    if not YOLO_AVAILABLE:
+        print("Ultralytics YOLO is required. Install with: pip install ultralytics")
+        return 1
+
+    videos = args.videos or [v for v in [find_test_video()] if v]
+    if not videos:
+        print("No recordings found; pass --videos or put video.MOV next to the script")
+        return 1
+
+    # Resolve the weights file (downloads the named model on first use)
+    YOLO = import_yolo()
+    base = YOLO(args.weights if args.weights else args.model)
+    weights_file = getattr(base, 'ckpt_path', None) or args.weights or args.model
+    crop = load_crop(args.settings)
+
+    fp32_path = export_model_cached(weights_file, 'onnx', args.inference_size, args.model_cache)
+    int8_path = cached_model_path(weights_file, 'onnx-int8', args.inference_size, args.model_cache)
+
+    if not args.skip_quantize:
+        print(f"Sampling {args.calib_frames} calibration frames from {', '.join(videos)}")
+        calib = sample_frames(videos, args.calib_frames, 0.0, crop, args.inference_size)
+        if not calib:
+            print("No calibration frames could be read")
+            return 1
+        quantize(fp32_path, int8_path, calib, args.inference_size)
+    elif not os.path.exists(int8_path):
+        print(f"{int8_path} not found; run without --skip-quantize first")
+        return 1
+
+    print(f"Sampling {args.eval_frames} evaluation frames")
+    frames = sample_frames(videos, args.eval_frames, 0.5, crop, args.inference_size)
+    fp32_model = YOLO(fp32_path, task='detect')
+    int8_model = YOLO(int8_path, task='detect')
+    person_class_idx = find_person_class_idx(getattr(fp32_model, 'names', {}) or {})
+
+    # Warm both models up so the first call doesn't skew the latency numbers
+    for model in (fp32_model, int8_model):
+        for frame in frames[:3]:
+            model(frame, imgsz=args.inference_size, verbose=False)
+
+    fp32 = run_model(fp32_model, frames, args.inference_size, person_class_idx, args.confidence)
+    int8 = run_model(int8_model, frames, args.inference_size, person_class_idx, args.confidence)
+    report = build_report(fp32, int8, args)
+    report['fp32_model'] = fp32_path
+    report['int8_model'] = int8_path
+    report['videos'] = videos
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Person recall vs FP32: {report['person_recall_vs_fp32']:.3f}")
+    print(f"Average point error: mean {report['avg_point_error']['mean']:.4f}, p95 {report['avg_point_error']['p95']:.4f}")
+    print(f"Tracking mismatch frames: {report['tracking_mismatch_frames']}/{report['frames']}")
+    print(f"Latency FP32: {report['latency_fp32']['mean_ms']:.1f} ms, INT8: {report['latency_int8']['mean_ms']:.1f} ms "
+          f"({report['speedup']:.2f}x)")
+    print(f"Within tolerance: {report['within_tolerance']}  (report: {args.report})")
+    if report['within_tolerance']:
+        print("Use it with: python pose_detector_yoloV8.py --backend onnx-int8")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
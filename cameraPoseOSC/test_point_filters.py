@@ -0,0 +1,33 @@
+"""Point filter checks on synthetic tracks (run with: python -m pytest cameraPoseOSC)"""
+
+import numpy as np
+import pytest
+
+from pose_detector_yoloV8 import make_point_filter
+
+
+def walk(point_filter, speed: float, fps: float = 30.0, latency: float = 0.08, seconds: float = 2.0):
+    """Feed a constant-speed walk along x; returns the last sent x and the true x at send time"""
+    sent = None
+    for n in range(int(seconds * fps)):
+        capture_time = n / fps
+        x = 0.2 + speed * capture_time
+        sent = point_filter.step((x, 0.5, 0.8), True, capture_time, capture_time + latency)
+    return sent[0], 0.2 + speed * (capture_time + latency)
+
+
+@pytest.mark.parametrize('name', ['one_euro', 'kalman'])
+def test_velocity_converges_to_constant_speed(name):
+    point_filter = make_point_filter(name, max_prediction=0.1)
+    sent_x, true_x = walk(point_filter, speed=0.3)
+    assert point_filter.velocity[0] == pytest.approx(0.3, abs=0.01)
+    assert point_filter.velocity[1] == pytest.approx(0.0, abs=1e-6)
+    # Prediction to the send time lands on the true position, not ahead of it
+    assert sent_x <= true_x + 0.003
+
+
+def test_ema_does_not_predict():
+    point_filter = make_point_filter('ema')
+    sent_x, true_x = walk(point_filter, speed=0.3)
+    assert point_filter.velocity is None
+    assert sent_x < true_x
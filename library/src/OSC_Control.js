@@ -2,8 +2,13 @@ const OSC = require('osc-js')
 
 const port = 8025;
 const osc = new OSC();
+const BINARY_SUBPROTOCOL = 'rsbin'; // compact binary format of the webcam tracker
+const WIRE_VERSION = 2; // must match WIRE_VERSION in pose_detector_yoloV8.py
 let enableDepthStream = true;
 let enableRGBStream = false;
+let wireFormat = 'osc'; // 'osc' or 'binary'
+let binaryChannel = 0; // source index to follow when the tracker serves several cameras
+let binarySocket = null;
 
 let dataRaw; // array of depth data
 let rData // array of red data
@@ -16,25 +21,43 @@ export let OSCdepthW; // width of data array
 export let OSCdepthH; // width of height array
 export let OSCtracking = false;
 export let oscSignal = false;
+export let OSCpeople = []; // individual people from the webcam tracker (--multi-person)
 
-export function setUpOSC(depthEnabled) {
+export function setUpOSC(depthEnabled, format = wireFormat, channel = binaryChannel) {
 
     enableDepthStream = depthEnabled;
+    wireFormat = format;
+    binaryChannel = channel;
     lastOSC = window.performance.now();
     // init buffer
     // setup OSC receiver
     
     osc.on('/depth', msg => {
-      refreshData(msg);
+      refreshData(msg, false);
+    }
+    );
+
+    // same arguments, depth grid run-length encoded (webcam tracker default)
+    osc.on('/depth_rle', msg => {
+      refreshData(msg, true);
+    }
+    );
+
+    osc.on('/people', msg => {
+      refreshPeople(msg);
     }
     );
   
     try {
-      osc.open({
-        port:
-          port
+      if (wireFormat === 'binary') {
+        openBinarySocket();
+      } else {
+        osc.open({
+          port:
+            port
+        }
+        );
       }
-      );
     }
     catch (e) {
       console.log("Could not connect: " + e);
@@ -83,17 +106,103 @@ function updateOSC() {
     }
   }
   
-  function refreshData(msg) {
+  // plain WebSocket asking the tracker for the compact binary format instead of OSC
+  function openBinarySocket() {
+    if (binarySocket && binarySocket.readyState <= WebSocket.OPEN) {
+      return;
+    }
+    binarySocket = new WebSocket(`ws://localhost:${port}`, BINARY_SUBPROTOCOL);
+    binarySocket.binaryType = 'arraybuffer';
+    binarySocket.onmessage = event => decodeBinaryMessage(event.data);
+  }
+
+  // little endian, see pose_detector_yoloV8.py:
+  // depth:  'RS' version type=1 channel flags(1 tracking, 2 rle) u16 w, u16 h, f32 x, y, z, u32 size, blob
+  // people: 'RS' version type=2 channel flags u16 count, count * (u32 id, f32 x, y, conf, w, h, u32 age)
+  function decodeBinaryMessage(buffer) {
+    let view = new DataView(buffer);
+    if (view.byteLength < 8 || view.getUint8(0) !== 0x52 || view.getUint8(1) !== 0x53 || view.getUint8(2) !== WIRE_VERSION) {
+      return;
+    }
+    if (view.getUint8(4) !== binaryChannel) {
+      return;
+    }
+    let type = view.getUint8(3);
+    let flags = view.getUint8(5);
+    if (type === 1) {
+      let w = view.getUint16(6, true);
+      let h = view.getUint16(8, true);
+      let pos = { x: view.getFloat32(10, true), y: view.getFloat32(14, true), z: view.getFloat32(18, true) };
+      let data = new Uint8Array(buffer, 26, view.getUint32(22, true));
+      if (flags & 2) {
+        data = decodeDepthRLE(data, w * h);
+      }
+      applyDepth(w, h, data, pos, (flags & 1) === 1);
+    } else if (type === 2) {
+      let count = view.getUint16(6, true);
+      let people = [];
+      for (let i = 0; i < count; i++) {
+        let o = 8 + i * 28;
+        people.push({ id: view.getUint32(o, true), x: view.getFloat32(o + 4, true), y: view.getFloat32(o + 8, true), z: view.getFloat32(o + 12, true), w: view.getFloat32(o + 16, true), h: view.getFloat32(o + 20, true), age: view.getUint32(o + 24, true) });
+      }
+      OSCpeople = people;
+    }
+  }
+
+  // expand (count, value) byte pairs back into a width*height array
+  function decodeDepthRLE(blob, length) {
+    let out = new Uint8Array(length);
+    let pos = 0;
+    for (let i = 0; i + 1 < blob.length && pos < length; i += 2) {
+      out.fill(blob[i + 1], pos, Math.min(length, pos + blob[i]));
+      pos += blob[i];
+    }
+    return out;
+  }
+
+  // /people [count, (id, x, y, z, w, h, age) * count]
+  function refreshPeople(msg) {
+    let count = msg.args[0];
+    let people = [];
+    for (let i = 0; i < count; i++) {
+      let o = 1 + i * 7;
+      people.push({ id: msg.args[o], x: msg.args[o + 1], y: msg.args[o + 2], z: msg.args[o + 3], w: msg.args[o + 4], h: msg.args[o + 5], age: msg.args[o + 6] });
+    }
+    OSCpeople = people;
+  }
+
+  function refreshData(msg, rle) {
+    let data = msg.args[2];
+    // /depth_rle carries the grid as (count, value) byte pairs
+    if (rle && data) {
+      data = decodeDepthRLE(data, msg.args[0] * msg.args[1]);
+    }
+    applyDepth(msg.args[0], msg.args[1], data, {x:msg.args[3], y:msg.args[4], z:msg.args[5]}, boolean(msg.args[6]));
+
+    try {
+      if (enableRGBStream && enableDepthStream) {
+        rData = msg.args[7];
+        gData = msg.args[8];
+        bData = msg.args[9];
+      }
+    } catch (e) {
+      console.log("rgb data not defined yet");
+
+    }
+  }
+
+  // shared by the OSC and binary receivers
+  function applyDepth(w, h, data, pos, tracking) {
     lastOSC = window.performance.now();
     oscSignal = true;
-  //  updatePosition(msg.args[3], msg.args[4], msg.args[5]);
-    realsensePos = {x:msg.args[3], y:msg.args[4], z:msg.args[5]}
+  //  updatePosition(pos.x, pos.y, pos.z);
+    realsensePos = pos;
     // depth data
-    OSCtracking = boolean(msg.args[6]);
+    OSCtracking = tracking;
     if (enableDepthStream) {
-      OSCdepthW = msg.args[0];
-      OSCdepthH = msg.args[1];
-      dataRaw = msg.args[2];
+      OSCdepthW = w;
+      OSCdepthH = h;
+      dataRaw = data;
       // weighted moving average on every point
       try {
         let depthLength = OSCdepthW * OSCdepthH;
@@ -105,18 +214,7 @@ function updateOSC() {
         }
       } catch (e) {
         console.log("data not defined yet");
-        OSCdepthData = Array.from(msg.args[2]);
-      }
-  
-      try {
-        if (enableRGBStream) {
-          rData = msg.args[7];
-          gData = msg.args[8];
-          bData = msg.args[9];
-        }
-      } catch (e) {
-        console.log("rgb data not defined yet");
-   
+        OSCdepthData = Array.from(dataRaw);
       }
     }
  }
@@ -5,7 +5,7 @@ import { setUpGui, dragElement } from './GUI.js'
 */
 import { recordCanvas, recordSetup, stopRecordCanvas, recording } from './recordCanvas.js'
 
-import { setUpOSC, realsensePos, OSCdepthData, OSCdepthW, OSCdepthH, OSCtracking, oscSignal } from './OSC_Control.js'
+import { setUpOSC, realsensePos, OSCdepthData, OSCdepthW, OSCdepthH, OSCtracking, oscSignal, OSCpeople } from './OSC_Control.js'
 import { debugInfo } from './debugInfo.js'
 import globalVariables from './globalVariables';
 
@@ -18,6 +18,7 @@ let windowInstance;
 let animationLoopEnabled = false;
 let debug = true
 let enableDepth = true;
+let wireFormat = 'osc'; // 'binary' for the webcam tracker's compact format (less parsing per frame)
 let incrementCounterInterval;
 let manualCounter = false;
 let fadingIn = 255;
@@ -34,7 +35,7 @@ function libraryInit() {
   globalVariables.position = p5.prototype.createVector(0, 0, 0);
   globalVariables.posNormal = p5.prototype.createVector(0, 0, 0); // normalised
   windowInstance = window;
-  setUpOSC(enableDepth);
+  setUpOSC(enableDepth, wireFormat);
   this.poster.position = globalVariables.position;
   this.poster.posNormal = globalVariables.posNormal;
   incrementCounterInterval = setInterval(incrementCounter, 2000); // Call incrementCounter every 1000 milliseconds (1 second)
@@ -130,6 +131,7 @@ if (poses != undefined && Settings.poseDetection == true) {
   if (oscSignal && realsensePos != undefined) {
     // realsense data available over osc
     updatePosition(P5Instance, realsensePos.x, realsensePos.y, realsensePos.z)
+    this.poster.people = OSCpeople; // tracked individuals, empty unless the tracker runs with --multi-person
     if (enableDepth) {
       this.poster.depthData = OSCdepthData;
       this.poster.depthW = OSCdepthW; // width of data array